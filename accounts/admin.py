@@ -1,6 +1,13 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.auth.admin import UserAdmin
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from .exports import export_response
+from .forms import PriceListImportForm
 from .models import CustomUser, Category, Product, Order, OrderItem
+from .price_import import PriceImportError, PriceListImporter, read_price_list
+from .search import filter_products
 
 # Настройка отображения CustomUser в админке
 class CustomUserAdmin(UserAdmin):
@@ -30,16 +37,86 @@ class OrderAdmin(admin.ModelAdmin):
     search_fields = ('order_number', 'user__username', 'user__company_name')
     inlines = [OrderItemInline]
     readonly_fields = ('order_number', 'created_at', 'updated_at')
+    actions = ['export_csv', 'export_xlsx']
+    
+    @admin.action(description='Выгрузить реестр позиций (CSV)')
+    def export_csv(self, request, queryset):
+        return export_response('orders', 'csv', queryset)
+    
+    @admin.action(description='Выгрузить реестр позиций (XLSX)')
+    def export_xlsx(self, request, queryset):
+        return export_response('orders', 'xlsx', queryset)
+
+# Настройка отображения категорий (дерево по материализованному пути)
+class CategoryAdmin(admin.ModelAdmin):
+    list_display = ('indented_name', 'parent', 'depth')
+    list_select_related = ('parent',)
+    search_fields = ('name',)
+    ordering = ('path',)
+    readonly_fields = ('path', 'depth')
+    
+    @admin.display(description='Название категории', ordering='path')
+    def indented_name(self, obj):
+        return f"{'— ' * obj.depth}{obj.name}"
 
 # Настройка отображения товаров
 class ProductAdmin(admin.ModelAdmin):
     list_display = ('name', 'sku', 'category', 'price', 'stock', 'unit')
     list_filter = ('category',)
+    list_select_related = ('category',)
     search_fields = ('name', 'sku', 'description')
+    change_list_template = 'admin/accounts/product/change_list.html'
+    actions = ['export_csv', 'export_xlsx']
+    
+    @admin.action(description='Выгрузить прайс-лист (CSV)')
+    def export_csv(self, request, queryset):
+        return export_response('products', 'csv', queryset)
+    
+    @admin.action(description='Выгрузить прайс-лист (XLSX)')
+    def export_xlsx(self, request, queryset):
+        return export_response('products', 'xlsx', queryset)
+    
+    def get_urls(self):
+        return [
+            path('import/', self.admin_site.admin_view(self.import_prices_view), name='accounts_product_import'),
+        ] + super().get_urls()
+    
+    def import_prices_view(self, request):
+        """Загрузка прайс-листа: создание и обновление товаров по артикулу"""
+        if not self.has_change_permission(request) or not self.has_add_permission(request):
+            return redirect('admin:accounts_product_changelist')
+        
+        form = PriceListImportForm(request.POST or None, request.FILES or None)
+        result = None
+        if request.method == 'POST' and form.is_valid():
+            upload = form.cleaned_data['file']
+            importer = PriceListImporter(dry_run=form.cleaned_data['dry_run'])
+            try:
+                result = importer.run(read_price_list(upload.file, upload.name))
+            except PriceImportError as e:
+                messages.error(request, str(e))
+            else:
+                level = messages.WARNING if result.errors else messages.SUCCESS
+                prefix = 'Проверка' if form.cleaned_data['dry_run'] else 'Импорт'
+                messages.add_message(request, level, f"{prefix}: {result.summary()}")
+        
+        return TemplateResponse(request, 'admin/accounts/product/import_prices.html', {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Импорт прайс-листа',
+            'form': form,
+            'result': result,
+        })
+    
+    def get_search_results(self, request, queryset, search_term):
+        """Поиск через полнотекстовый индекс (плюс вхождение в артикул) вместо ILIKE по трем полям"""
+        if not search_term:
+            return super().get_search_results(request, queryset, search_term)
+        return filter_products(queryset, search_term), False
 
 # Регистрация моделей в админке
 admin.site.register(CustomUser, CustomUserAdmin)
-admin.site.register(Category)
+admin.site.register(Category, CategoryAdmin)
 admin.site.register(Product, ProductAdmin)
 admin.site.register(Order, OrderAdmin)
 admin.site.register(OrderItem)
\ No newline at end of file
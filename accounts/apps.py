@@ -10,4 +10,6 @@ class AccountsConfig(AppConfig):
         Здесь регистрируем сигналы.
         """
         # Импортируем и регистрируем сигналы
-        from . import signals
\ No newline at end of file
+        from . import signals
+        # Системные проверки (manage.py check --deploy)
+        from . import checks
\ No newline at end of file
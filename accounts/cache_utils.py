@@ -0,0 +1,49 @@
+"""
+Версионированные ключи кэша.
+
+Вместо удаления кэшированных данных увеличиваем номер версии пространства имен:
+старые ключи перестают читаться и вытесняются сами. Версия хранится в кэше
+по умолчанию, поэтому он должен быть общим для всех процессов (Redis): с
+LocMem сброс видит только процесс, который его сделал. Проверка -
+cache_is_shared() и системная проверка accounts.E001 (manage.py check --deploy).
+"""
+import time
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+
+VERSION_KEY = 'version:%s'
+
+
+def get_version(namespace):
+    """Текущая версия пространства имен (создается при первом обращении)"""
+    key = VERSION_KEY % namespace
+    version = cache.get(key)
+    if version is None:
+        # Начальное значение от времени: после вытеснения ключа версия
+        # не совпадет ни с одной из уже использованных
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump_version(namespace):
+    """Инвалидировать все данные пространства имен"""
+    key = VERSION_KEY % namespace
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ключа нет (еще не создан или вытеснен)
+        return get_version(namespace)
+
+
+def versioned_key(namespace, *parts):
+    """Ключ кэша с текущей версией: 'products:17:home'"""
+    return ':'.join(str(part) for part in (namespace, get_version(namespace)) + parts)
+
+
+def cache_is_shared(alias=DEFAULT_CACHE_ALIAS):
+    """Видят ли кэш все процессы (у LocMem и Dummy он свой в каждом процессе)"""
+    from django.core.cache.backends.dummy import DummyCache
+    from django.core.cache.backends.locmem import LocMemCache
+
+    return not isinstance(caches[alias], (LocMemCache, DummyCache))
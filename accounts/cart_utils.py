@@ -1,45 +1,170 @@
+import logging
+from decimal import Decimal
+
 from .models import Cart, CartItem, Product
+from .guest_cart import GuestCart, get_guest_cart_store
+from .reservations import available_to_promise, refresh_reservations, with_availability
 from django.db import transaction
+from django.db.models import DecimalField, F, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Round
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
 
 def get_or_create_cart(request):
     """
-    Получить или создать корзину для пользователя или сессии
+    Получить или создать корзину для пользователя или гостя.
+    Корзина гостя живет в сессии/cookie (GuestCart) и не создает записей в БД.
+    Результат запоминается на время запроса (он же доступен как request.cart).
     """
-    cart = None
+    user_id = request.user.pk if request.user.is_authenticated else None
+    cached = getattr(request, '_cart_cache', None)
+    if cached is not None and cached[0] == user_id:
+        return cached[1]
     
-    if request.user.is_authenticated:
+    if user_id is not None:
         # Для авторизованных пользователей
         cart, created = Cart.objects.get_or_create(user=request.user)
     else:
-        # Для гостей - используем сессию
-        session_key = request.session.session_key
-        if not session_key:
-            request.session.create()
-            session_key = request.session.session_key
-        
-        cart, created = Cart.objects.get_or_create(
-            session_key=session_key,
-            user=None
-        )
+        # Для гостей - хранилище из настройки GUEST_CART_STORE
+        cart = GuestCart(get_guest_cart_store(request))
     
+    request._cart_cache = (user_id, cart)
     return cart
 
+def peek_cart_items_count(request):
+    """
+    Количество товаров для значка корзины без создания корзины:
+    не больше одного чтения сохраненного items_count
+    """
+    user_id = request.user.pk if request.user.is_authenticated else None
+    cached = getattr(request, '_cart_cache', None)
+    if cached is not None and cached[0] == user_id:
+        return cached[1].total_items
+    if user_id is None:
+        return get_or_create_cart(request).total_items
+    return Cart.objects.filter(user_id=user_id).values_list('items_count', flat=True).first() or 0
+
+def get_cart_lines(cart):
+    """
+    Позиции корзины вместе с товарами (для отображения)
+    """
+    if isinstance(cart, GuestCart):
+        return cart.get_items()
+    return cart.items.all().select_related('product')
+
+def apply_cart_delta(cart, quantity_delta, amount_delta):
+    """
+    Атомарно изменить сохраненные итоги корзины (UPDATE ... SET x = x + delta)
+    """
+    Cart.objects.filter(pk=cart.pk).update(
+        items_count=F('items_count') + quantity_delta,
+        subtotal=F('subtotal') + amount_delta,
+        updated_at=timezone.now(),
+    )
+    cart.items_count += quantity_delta
+    cart.subtotal += amount_delta
+
+def recalculate_cart_totals(carts):
+    """
+    Пересчитать итоги корзин по позициям одним UPDATE с подзапросами.
+    Возвращает количество обновленных корзин.
+    """
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    quantity = lines.annotate(total=Sum('quantity')).values('total')
+    amount = lines.annotate(
+        total=Sum(F('quantity') * F('product__price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+    ).values('total')
+    return carts.update(
+        items_count=Coalesce(Subquery(quantity), 0),
+        subtotal=Coalesce(Subquery(amount), Value(Decimal('0')), output_field=DecimalField(max_digits=12, decimal_places=2)),
+    )
+
+def drifted_carts():
+    """
+    Корзины, у которых сохраненные итоги (items_count, subtotal) разошлись с позициями
+    """
+    lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    money = DecimalField(max_digits=12, decimal_places=2)
+    return (
+        Cart.objects
+        .annotate(
+            actual_count=Coalesce(Subquery(lines.annotate(total=Sum('quantity')).values('total')), 0),
+            # Обе суммы округляются: SQLite хранит и считает их в float (199.79999...)
+            stored_subtotal=Round('subtotal', 2),
+            actual_subtotal=Coalesce(
+                Subquery(lines.annotate(
+                    total=Round(Sum(F('quantity') * F('product__price'), output_field=money), 2)
+                ).values('total')),
+                Value(Decimal('0')),
+                output_field=money,
+            ),
+        )
+        .filter(~Q(items_count=F('actual_count')) | ~Q(stored_subtotal=F('actual_subtotal')))
+    )
+
+def locked_cart_item(cart, item_id):
+    """
+    Позиция корзины с товаром, заблокированная до конца транзакции (SELECT ... FOR UPDATE
+    только по строке позиции): параллельные изменения той же позиции выполняются
+    по очереди, и дельта итогов считается от актуального количества
+    """
+    return (
+        CartItem.objects
+        .select_for_update(of=('self',))
+        .select_related('product')
+        .get(id=item_id, cart=cart)
+    )
+
+def locked_product(product_id, cart):
+    """
+    Товар в наличии с доступным остатком, заблокированный до конца транзакции
+    (SELECT ... FOR UPDATE только по строке товара): корзины, претендующие на
+    один товар, проверяют остаток и ставят резерв по очереди, и сумма резервов
+    не превышает склад
+    """
+    return with_availability(
+        Product.objects.select_for_update(of=('self',)).filter(stock__gt=0), exclude_cart=cart,
+    ).get(id=product_id)
+
 def add_to_cart(request, product_id, quantity=1):
     """
     Добавить товар в корзину
     """
-    try:
-        product = Product.objects.get(id=product_id, stock__gt=0)
-    except Product.DoesNotExist:
-        return False, "Товар не найден или отсутствует на складе"
-    
-    if quantity > product.stock:
-        return False, f"Недостаточно товара на складе. Доступно: {product.stock}"
-    
     cart = get_or_create_cart(request)
     
+    if isinstance(cart, GuestCart):
+        # Гостевая корзина резервов не держит - блокировка товара не нужна
+        try:
+            product = with_availability(Product.objects.filter(stock__gt=0)).get(id=product_id)
+        except Product.DoesNotExist:
+            return False, "Товар не найден или отсутствует на складе"
+        if quantity > product.available:
+            return False, f"Недостаточно товара на складе. Доступно: {product.available}"
+        if cart.is_full(product.id):
+            return False, "Корзина гостя заполнена. Войдите, чтобы добавить больше товаров"
+        new_quantity = cart.lines.get(product.id, 0) + quantity
+        if new_quantity > product.available:
+            return False, f"Нельзя добавить больше {product.available} единиц товара"
+        cart.set_quantity(product.id, new_quantity)
+        return True, "Товар добавлен в корзину"
+    
     with transaction.atomic():
-        cart_item, created = CartItem.objects.get_or_create(
+        # Доступный остаток (за вычетом активных резервов других корзин) читается
+        # под блокировкой товара: иначе две корзины одновременно увидели бы
+        # один и тот же остаток и обе поставили бы на него резерв
+        try:
+            product = locked_product(product_id, cart)
+        except Product.DoesNotExist:
+            return False, "Товар не найден или отсутствует на складе"
+        
+        if quantity > product.available:
+            return False, f"Недостаточно товара на складе. Доступно: {product.available}"
+        
+        # Позиция блокируется до конца транзакции: параллельное добавление того же
+        # товара ждет и читает уже увеличенное количество (иначе одно из изменений
+        # количества потерялось бы, а обе дельты итогов применились)
+        cart_item, created = CartItem.objects.select_for_update().get_or_create(
             cart=cart,
             product=product,
             defaults={'quantity': quantity}
@@ -48,11 +173,14 @@ def add_to_cart(request, product_id, quantity=1):
         if not created:
             # Если товар уже в корзине, увеличиваем количество
             new_quantity = cart_item.quantity + quantity
-            if new_quantity <= product.stock:
+            if new_quantity <= product.available:
                 cart_item.quantity = new_quantity
-                cart_item.save()
+                cart_item.save(update_fields=['quantity'])
             else:
-                return False, f"Нельзя добавить больше {product.stock} единиц товара"
+                return False, f"Нельзя добавить больше {product.available} единиц товара"
+        
+        apply_cart_delta(cart, quantity, quantity * product.price)
+        refresh_reservations(cart)
     
     return True, "Товар добавлен в корзину"
 
@@ -60,10 +188,19 @@ def remove_from_cart(request, item_id):
     """
     Удалить позицию из корзины
     """
+    cart = get_or_create_cart(request)
+    if isinstance(cart, GuestCart):
+        # В гостевой корзине id позиции - это id товара
+        if item_id not in cart.lines:
+            return False, "Товар не найден в корзине"
+        cart.set_quantity(item_id, 0)
+        return True, "Товар удален из корзины"
+    
     try:
-        cart = get_or_create_cart(request)
-        item = CartItem.objects.get(id=item_id, cart=cart)
-        item.delete()
+        with transaction.atomic():
+            item = locked_cart_item(cart, item_id)
+            item.delete()
+            apply_cart_delta(cart, -item.quantity, -item.quantity * item.product.price)
         return True, "Товар удален из корзины"
     except CartItem.DoesNotExist:
         return False, "Товар не найден в корзине"
@@ -72,23 +209,55 @@ def update_cart_item(request, item_id, quantity):
     """
     Обновить количество товара в корзине
     """
+    cart = get_or_create_cart(request)
+    if isinstance(cart, GuestCart):
+        return update_guest_cart_item(cart, item_id, quantity)
+    
     try:
-        cart = get_or_create_cart(request)
-        item = CartItem.objects.get(id=item_id, cart=cart)
-        
-        if quantity <= 0:
-            item.delete()
-            return True, "Товар удален из корзины"
-        
-        if quantity > item.product.stock:
-            return False, f"Недостаточно товара на складе. Доступно: {item.product.stock}"
-        
-        item.quantity = quantity
-        item.save()
+        with transaction.atomic():
+            item = locked_cart_item(cart, item_id)
+            
+            if quantity <= 0:
+                item.delete()
+                apply_cart_delta(cart, -item.quantity, -item.quantity * item.product.price)
+                return True, "Товар удален из корзины"
+            
+            if quantity > item.quantity:
+                # Увеличение резерва - под блокировкой товара, как в add_to_cart
+                try:
+                    available = locked_product(item.product_id, cart).available
+                except Product.DoesNotExist:
+                    available = 0
+                if quantity > available:
+                    return False, f"Недостаточно товара на складе. Доступно: {available}"
+            
+            delta = quantity - item.quantity
+            item.quantity = quantity
+            item.save(update_fields=['quantity'])
+            apply_cart_delta(cart, delta, delta * item.product.price)
+            refresh_reservations(cart)
         return True, "Количество обновлено"
     except CartItem.DoesNotExist:
         return False, "Товар не найден в корзине"
 
+def update_guest_cart_item(cart, product_id, quantity):
+    """
+    Обновить количество товара в гостевой корзине
+    """
+    if product_id not in cart.lines:
+        return False, "Товар не найден в корзине"
+    
+    if quantity <= 0:
+        cart.set_quantity(product_id, 0)
+        return True, "Товар удален из корзины"
+    
+    available = available_to_promise(product_id)
+    if quantity > available:
+        return False, f"Недостаточно товара на складе. Доступно: {available}"
+    
+    cart.set_quantity(product_id, quantity)
+    return True, "Количество обновлено"
+
 def get_cart_items_count(request):
     """
     Получить количество товаров в корзине для отображения в навигации
@@ -101,7 +270,14 @@ def clear_cart(request):
     Очистить корзину
     """
     cart = get_or_create_cart(request)
-    cart.items.all().delete()
+    if isinstance(cart, GuestCart):
+        cart.clear()
+        return True, "Корзина очищена"
+    
+    with transaction.atomic():
+        cart.items.all().delete()
+        Cart.objects.filter(pk=cart.pk).update(items_count=0, subtotal=0, updated_at=timezone.now())
+    cart.items_count, cart.subtotal = 0, Decimal('0')
     return True, "Корзина очищена"
 
 def merge_carts(session_cart, user_cart):
@@ -109,47 +285,88 @@ def merge_carts(session_cart, user_cart):
     Объединить гостевую корзину с пользовательской при входе
     """
     if session_cart and user_cart:
-        for session_item in session_cart.items.all():
-            user_item, created = user_cart.items.get_or_create(
-                product=session_item.product,
-                defaults={'quantity': session_item.quantity}
-            )
-            if not created:
+        with transaction.atomic():
+            for session_item in session_cart.items.select_related('product'):
+                user_item, created = user_cart.items.get_or_create(
+                    product=session_item.product,
+                    defaults={'quantity': session_item.quantity}
+                )
+                if not created:
+                    # Если товар уже есть в пользовательской корзине, суммируем количество
+                    total_quantity = user_item.quantity + session_item.quantity
+                    if total_quantity <= session_item.product.stock:
+                        user_item.quantity = total_quantity
+                        user_item.save()
+            
+            # Удаляем гостевую корзину и пересчитываем итоги объединенной
+            session_cart.delete()
+            recalculate_cart_totals(Cart.objects.filter(pk=user_cart.pk))
+            user_cart.refresh_from_db(fields=['items_count', 'subtotal'])
+    
+    return user_cart
+def merge_guest_cart(guest_cart, user_cart):
+    """
+    Перенести гостевую корзину (сессия/cookie) в корзину пользователя.
+    Запросов - постоянное число, независимо от количества позиций.
+    """
+    lines = guest_cart.lines
+    if not lines:
+        return user_cart
+    
+    with transaction.atomic():
+        products = Product.objects.in_bulk(list(lines))
+        existing = {item.product_id: item for item in user_cart.items.filter(product_id__in=products)}
+        
+        new_items, changed_items = [], []
+        for product_id, quantity in lines.items():
+            product = products.get(product_id)
+            if product is None:
+                continue
+            item = existing.get(product_id)
+            if item is None:
+                quantity = min(quantity, product.stock)
+                if quantity > 0:
+                    new_items.append(CartItem(cart=user_cart, product=product, quantity=quantity))
+            elif item.quantity + quantity <= product.stock:
                 # Если товар уже есть в пользовательской корзине, суммируем количество
-                total_quantity = user_item.quantity + session_item.quantity
-                if total_quantity <= session_item.product.stock:
-                    user_item.quantity = total_quantity
-                    user_item.save()
+                item.quantity += quantity
+                changed_items.append(item)
         
-        # Удаляем гостевую корзину
-        session_cart.delete()
+        CartItem.objects.bulk_create(new_items)
+        CartItem.objects.bulk_update(changed_items, ['quantity'])
+        refresh_reservations(user_cart)
+        recalculate_cart_totals(Cart.objects.filter(pk=user_cart.pk))
+        user_cart.refresh_from_db(fields=['items_count', 'subtotal'])
     
+    guest_cart.clear()
     return user_cart
+
 def merge_carts_on_login(request, user):
     """
-    Функция для signals.py - объединяет корзины при входе
+    Функция для signals.py - объединяет корзины при входе.
+    Сбой объединения не должен мешать входу: изменения откатываются,
+    ошибка пишется в лог, возвращается None.
     """
     try:
-        # Получаем ключ сессии
-        session_key = request.session.session_key
-        
-        # Ищем гостевую корзину
-        session_cart = None
-        if session_key:
-            from .models import Cart
-            session_cart = Cart.objects.filter(
-                session_key=session_key,
-                user__isnull=True
-            ).first()
-        
-        # Получаем или создаем корзину пользователя
-        user_cart, created = Cart.objects.get_or_create(user=user)
+        with transaction.atomic():
+            # Получаем или создаем корзину пользователя
+            user_cart, created = Cart.objects.get_or_create(user=user)
+            
+            # Гостевая корзина из сессии/cookie
+            merge_guest_cart(GuestCart(get_guest_cart_store(request)), user_cart)
+            
+            # Корзины гостей, сохраненные в БД до перехода на GuestCart
+            session_key = request.session.session_key
+            if session_key:
+                session_cart = Cart.objects.filter(
+                    session_key=session_key,
+                    user__isnull=True
+                ).first()
+                if session_cart:
+                    merge_carts(session_cart, user_cart)
         
-        # Объединяем если есть что объединять
-        if session_cart:
-            return merge_carts(session_cart, user_cart)
         return user_cart
         
-    except Exception as e:
-        print(f"Ошибка в merge_carts_on_login: {e}")
-        return None
\ No newline at end of file
+    except Exception:
+        logger.exception("Не удалось объединить корзины при входе пользователя %s", user.pk)
+        return None
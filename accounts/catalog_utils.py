@@ -0,0 +1,207 @@
+import base64
+import binascii
+
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.db.models import Exists, F, OuterRef, Q, Window
+from django.db.models.functions import RowNumber
+
+from .cache_utils import bump_version, get_version, versioned_key
+from .category_tree import NAMESPACE as CATEGORY_TREE_NAMESPACE, get_category_tree
+from .models import Category, Product
+from .reservations import with_availability
+
+# Сколько категорий показываем на одной странице каталога
+CATEGORIES_PER_PAGE = 10
+# Сколько товаров показываем в категории до кнопки "Показать ещё"
+PRODUCTS_PER_CATEGORY = 12
+# Пространство имен версии кэша для данных о товарах
+PRODUCTS_CACHE_NAMESPACE = 'products'
+# Страховочный срок жизни данных главной страницы (инвалидация - по версии)
+HOME_CACHE_TIMEOUT = 60 * 10
+HOME_PRODUCTS_LIMIT = 8
+# Фрагменты шаблонов ({% fragment_cache %}, templatetags/fragments.py): карточки товаров и блоки категорий.
+# Карточка кэшируется по id, Product.version и доступному остатку; версия
+# пространства имен сбрасывает все карточки сразу (массовая загрузка товаров)
+PRODUCT_FRAGMENTS_NAMESPACE = 'product_fragments'
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+
+def in_stock_products():
+    """
+    Товары, доступные к заказу (остаток за вычетом активных резервов в корзинах > 0),
+    вместе с категорией (один запрос, без догрузки category) и доступным остатком
+    """
+    return (
+        with_availability(Product.objects.filter(stock__gt=0).select_related('category'))
+        .filter(available__gt=0)
+    )
+
+
+def encode_product_cursor(product):
+    """Курсор "Показать ещё", указывающий на товар: base64('name|id')"""
+    raw = f"{product.name}|{product.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_product_cursor(cursor):
+    """(name, id) из курсора или None, если курсор пустой или поврежден"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        # Название может содержать '|', id - нет
+        name, _, pk = raw.rpartition('|')
+        return name, int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def catalog_category_ids():
+    """
+    id категорий с товарами в наличии, в порядке каталога (по названию).
+    Хранится в кэше под версиями 'products' (сохранение товара, списание остатков)
+    и 'category_tree' (переименование, перенос категорий): обычная страница
+    каталога не проверяет наличие по всем категориям, а пересчет - по одному
+    EXISTS на категорию через частичный индекс (category, name, id) WHERE stock > 0.
+    """
+    key = versioned_key(PRODUCTS_CACHE_NAMESPACE, 'catalog_categories', get_version(CATEGORY_TREE_NAMESPACE))
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(
+            Category.objects
+            .filter(Exists(Product.objects.filter(category=OuterRef('pk'), stock__gt=0)))
+            .order_by('name', 'id')
+            .values_list('id', flat=True)
+        )
+        cache.set(key, ids, HOME_CACHE_TIMEOUT)
+    return ids
+
+
+def get_catalog_page(page_number, category_path=None, per_page=CATEGORIES_PER_PAGE,
+                     products_per_category=PRODUCTS_PER_CATEGORY):
+    """
+    Страница каталога: категории с товарами в наличии и первые товары каждой категории.
+    Если передан category_path, показывается только это поддерево категорий.
+
+    Список непустых категорий берется из кэша (catalog_category_ids), сами
+    категории - из дерева в памяти процесса, поэтому к БД идет один запрос:
+    выборка товаров страницы с оконной функцией ROW_NUMBER() по категории.
+    Его стоимость зависит от размера страницы, а не каталога.
+    """
+    tree = get_category_tree()
+    category_ids = [pk for pk in catalog_category_ids() if tree.get(pk) is not None]
+    if category_path:
+        category_ids = [pk for pk in category_ids if tree.get(pk)['path'].startswith(category_path)]
+    page = Paginator(category_ids, per_page).get_page(page_number)
+
+    products_by_category = {pk: [] for pk in page.object_list}
+    if products_by_category:
+        products = (
+            in_stock_products()
+            .filter(category_id__in=products_by_category)
+            .annotate(row_number=Window(
+                RowNumber(),
+                partition_by=F('category_id'),
+                order_by=[F('name').asc(), F('id').asc()],
+            ))
+            # На один товар больше - чтобы узнать, нужна ли кнопка "Показать ещё"
+            .filter(row_number__lte=products_per_category + 1)
+            .order_by('category_id', 'row_number')
+        )
+        for product in products:
+            products_by_category[product.category_id].append(product)
+
+    blocks = []
+    for pk, products in products_by_category.items():
+        # Все товары категории в резерве чужих корзин - блок не показываем
+        if not products:
+            continue
+        has_more = len(products) > products_per_category
+        products = products[:products_per_category]
+        blocks.append({
+            'category': tree.get(pk),
+            'products': products,
+            'has_more': has_more,
+            'next_cursor': encode_product_cursor(products[-1]) if has_more else None,
+        })
+    return page, blocks
+
+
+def get_category_chunk(category_id, cursor=None, limit=PRODUCTS_PER_CATEGORY):
+    """
+    Следующая порция товаров категории для подгрузки "Показать ещё" - после
+    товара из курсора (keyset по индексу (category, name, id), без OFFSET).
+    Возвращает (товары, next_cursor); next_cursor = None, если товаров больше нет.
+    """
+    products = in_stock_products().filter(category_id=category_id)
+    position = decode_product_cursor(cursor)
+    if position is not None:
+        name, pk = position
+        products = products.filter(Q(name__gt=name) | Q(name=name, pk__gt=pk))
+
+    # Берем на один товар больше, чтобы узнать, есть ли следующая порция
+    products = list(products.order_by('name', 'id')[:limit + 1])
+    if len(products) > limit:
+        products = products[:limit]
+        return products, encode_product_cursor(products[-1])
+    return products, None
+
+
+def invalidate_product_caches():
+    """Сбросить кэшированные данные о товарах (главная страница)"""
+    bump_version(PRODUCTS_CACHE_NAMESPACE)
+
+
+def invalidate_product_fragments():
+    """Сбросить все закэшированные карточки товаров (после записи в обход Product.save)"""
+    bump_version(PRODUCT_FRAGMENTS_NAMESPACE)
+
+
+def _build_home_data():
+    available = Product.objects.filter(stock__gt=0)
+    # Кандидатов берем с запасом: часть может оказаться целиком в резерве корзин
+    # (доступность проверяется при каждом запросе в get_home_data)
+    limit = HOME_PRODUCTS_LIMIT * 2
+
+    # Популярные товары (новые первыми) - по частичному индексу product_popular_idx;
+    # если их мало (меньше 4), добавляем новинки. Оба запроса читают индекс по
+    # порядку и останавливаются на LIMIT, а не просматривают весь каталог
+    popular = list(available.filter(is_popular=True).order_by('-id')[:limit])
+    if len(popular) < 4:
+        popular += list(
+            available.exclude(id__in=[p.id for p in popular]).order_by('-created_at')[:limit - len(popular)]
+        )
+    return {
+        'popular_products': popular,
+        'new_products': list(available.order_by('-created_at')[:limit]),
+    }
+
+
+def get_home_data():
+    """
+    Блоки главной страницы из кэша.
+    Версия сбрасывается при сохранении/удалении товара и после списания остатков,
+    поэтому обычный заход на главную читает из БД только доступный остаток
+    показываемых товаров.
+    """
+    key = versioned_key(PRODUCTS_CACHE_NAMESPACE, 'home')
+    data = cache.get(key)
+    if data is None:
+        data = _build_home_data()
+        cache.set(key, data, HOME_CACHE_TIMEOUT)
+
+    # Резервы истекают и появляются без сброса версии, поэтому доступный остаток
+    # товаров из кэша - свежий, одним запросом; целиком зарезервированные не показываем
+    products = data['popular_products'] + data['new_products']
+    available = dict(
+        with_availability(Product.objects.filter(pk__in={product.pk for product in products}))
+        .values_list('pk', 'available')
+    )
+    for product in products:
+        product.available = available.get(product.pk, 0)
+    return {
+        **data,
+        'popular_products': [p for p in data['popular_products'] if p.available > 0][:HOME_PRODUCTS_LIMIT],
+        'new_products': [p for p in data['new_products'] if p.available > 0][:HOME_PRODUCTS_LIMIT],
+    }
@@ -0,0 +1,83 @@
+"""
+Кэш дерева категорий в памяти процесса.
+
+Дерево целиком (id, название, родитель, путь) читается одним запросом и
+хранится в процессе, пока не изменится версия 'category_tree' в общем кэше.
+Версия увеличивается сигналами при сохранении/удалении Category. Кэш обязан
+быть общим для всех воркеров (cache_utils.cache_is_shared): с LocMem изменение
+категории увидел бы только воркер, который его сохранил.
+Используется для хлебных крошек и меню навигации без запросов к БД.
+"""
+import threading
+import time
+
+from .cache_utils import bump_version, get_version
+from .models import Category
+
+NAMESPACE = 'category_tree'
+# Как часто сверяться с общим кэшем (секунды): между проверками
+# дерево отдается из памяти вообще без обращений к кэшу
+VERSION_CHECK_INTERVAL = 5
+
+_lock = threading.Lock()
+_state = {'tree': None, 'version': None, 'checked_at': 0.0}
+
+
+class CategoryTree:
+    """Снимок дерева категорий"""
+
+    def __init__(self, rows):
+        self.nodes = {}
+        self.children = {}
+        for row in rows:
+            self.nodes[row['id']] = row
+            self.children.setdefault(row['parent_id'], []).append(row)
+        for nodes in self.children.values():
+            nodes.sort(key=lambda node: node['name'])
+
+    def get(self, category_id):
+        return self.nodes.get(category_id)
+
+    def roots(self):
+        return self.children.get(None, [])
+
+    def children_of(self, category_id):
+        return self.children.get(category_id, [])
+
+    def breadcrumbs(self, category_id):
+        """Цепочка от корня до категории включительно"""
+        node = self.nodes.get(category_id)
+        if node is None:
+            return []
+        ids = [int(segment) for segment in node['path'].split('/') if segment]
+        return [self.nodes[pk] for pk in ids if pk in self.nodes]
+
+    def full_name(self, category_id, separator=' / '):
+        """'Стройматериалы / Сухие смеси / Штукатурки'"""
+        return separator.join(node['name'] for node in self.breadcrumbs(category_id))
+
+
+def _load_tree():
+    return CategoryTree(Category.objects.values('id', 'name', 'parent_id', 'path', 'depth'))
+
+
+def get_category_tree():
+    """Актуальное дерево категорий (перечитывается из БД только после изменений)"""
+    now = time.monotonic()
+    tree = _state['tree']
+    if tree is not None and now - _state['checked_at'] < VERSION_CHECK_INTERVAL:
+        return tree
+
+    version = get_version(NAMESPACE)
+    with _lock:
+        if _state['tree'] is None or _state['version'] != version:
+            _state['tree'] = _load_tree()
+            _state['version'] = version
+        _state['checked_at'] = now
+        return _state['tree']
+
+
+def invalidate_category_tree():
+    """Сбросить дерево во всех процессах"""
+    bump_version(NAMESPACE)
+    _state['checked_at'] = 0.0
@@ -0,0 +1,119 @@
+"""
+Оформление заказа из корзины одной транзакцией.
+
+Число запросов не зависит от количества позиций:
+выборка позиций с товарами (с блокировкой строк на PostgreSQL), проверка
+остатков с учетом резервов других корзин, INSERT заказа,
+bulk_create позиций заказа, один условный UPDATE остатков и очистка корзины.
+Остатки списываются выражением stock = stock - qty с условием stock >= qty,
+поэтому параллельные оформления не уводят склад в минус.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, F, PositiveIntegerField, Value, When
+from django.utils import timezone
+
+from .catalog_utils import invalidate_product_caches
+from .models import Cart, CartItem, Order, OrderItem, Product
+from .order_numbers import allocate_order_number
+from .reservations import with_availability
+
+
+class CheckoutError(Exception):
+    """Заказ не может быть оформлен"""
+
+
+class EmptyCartError(CheckoutError):
+    def __init__(self):
+        super().__init__("Корзина пуста")
+
+
+class InsufficientStockError(CheckoutError):
+    def __init__(self, product, available, requested):
+        self.product = product
+        self.available = available
+        self.requested = requested
+        super().__init__(
+            f"Товара '{product.name}' недостаточно на складе. "
+            f"Доступно: {available}, в корзине: {requested}"
+        )
+
+
+def _per_product(quantities, default=None):
+    """CASE WHEN id = ... THEN qty ... END для одного UPDATE по всем товарам"""
+    return Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in quantities.items()],
+        default=default,
+        output_field=PositiveIntegerField(),
+    )
+
+
+def place_order(cart, user, delivery_address='', phone='', email='', comments=''):
+    """
+    Создать заказ из корзины, списать остатки и очистить корзину.
+    Бросает EmptyCartError или InsufficientStockError (транзакция откатывается).
+    """
+    # Номер берем до транзакции: UPSERT счетчика фиксируется сразу на основном
+    # соединении и не держит строку дня до конца оформления (см. order_numbers.py)
+    order_number = allocate_order_number()
+    with transaction.atomic():
+        # Блокируем позиции и товары в порядке id, чтобы параллельные заказы не взаимоблокировались
+        lines = list(
+            CartItem.objects
+            .filter(cart=cart)
+            .select_related('product')
+            .select_for_update(of=('self', 'product'))
+            .order_by('product_id')
+        )
+        if not lines:
+            raise EmptyCartError()
+
+        # Остаток за вычетом активных резервов других корзин
+        available = dict(
+            with_availability(Product.objects.filter(pk__in=[line.product_id for line in lines]), exclude_cart=cart)
+            .values_list('pk', 'available')
+        )
+        for line in lines:
+            if line.quantity > available.get(line.product_id, 0):
+                raise InsufficientStockError(line.product, available.get(line.product_id, 0), line.quantity)
+
+        order = Order.objects.create(
+            order_number=order_number,
+            user=user,
+            status='pending',
+            total_amount=sum((line.quantity * line.product.price for line in lines), Decimal('0')),
+            delivery_address=delivery_address,
+            comments=comments,
+            phone=phone,
+            email=email,
+        )
+
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=line.product, quantity=line.quantity, price=line.product.price)
+            for line in lines
+        ])
+
+        # Списание остатков одним UPDATE; условие stock >= qty защищает от продажи в минус
+        quantities = {line.product_id: line.quantity for line in lines}
+        updated = (
+            Product.objects
+            .filter(pk__in=quantities, stock__gte=_per_product(quantities))
+            .update(stock=F('stock') - _per_product(quantities, default=Value(0)))
+        )
+        if updated != len(quantities):
+            stocks = dict(Product.objects.filter(pk__in=quantities).values_list('pk', 'stock'))
+            for line in lines:
+                if stocks.get(line.product_id, 0) < line.quantity:
+                    raise InsufficientStockError(line.product, stocks.get(line.product_id, 0), line.quantity)
+            raise CheckoutError("Не удалось списать остатки, попробуйте еще раз")
+
+        # Остатки изменены UPDATE'ом без сигналов - сбрасываем кэш явно
+        transaction.on_commit(invalidate_product_caches)
+
+        # Очищаем корзину
+        CartItem.objects.filter(cart=cart).delete()
+        Cart.objects.filter(pk=cart.pk).update(items_count=0, subtotal=0, updated_at=timezone.now())
+        cart.items_count, cart.subtotal = 0, Decimal('0')
+
+    return order
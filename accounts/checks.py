@@ -0,0 +1,19 @@
+"""Системные проверки приложения (manage.py check --deploy)"""
+from django.core.checks import Error, Tags, register
+
+from .cache_utils import cache_is_shared
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Версии кэша (дерево категорий, данные главной, карточки товаров) живут в
+    кэше по умолчанию: с кэшем в памяти процесса воркеры не видят сбросы друг друга.
+    """
+    if cache_is_shared():
+        return []
+    return [Error(
+        'Кэш по умолчанию хранится в памяти процесса - воркеры не видят изменений друг друга',
+        hint='Задайте REDIS_URL (общий Redis для всех воркеров)',
+        id='accounts.E001',
+    )]
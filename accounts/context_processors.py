@@ -0,0 +1,27 @@
+from django.utils.functional import SimpleLazyObject
+
+from .cache_utils import get_version
+from .cart_utils import peek_cart_items_count
+from .catalog_utils import PRODUCT_FRAGMENTS_NAMESPACE
+from .category_tree import NAMESPACE as CATEGORY_TREE_NAMESPACE
+
+
+def cart(request):
+    """
+    Количество товаров в корзине для значка в шапке (base.html).
+    Вычисляется лениво - только если шаблон его выводит.
+    """
+    return {
+        'cart_count': SimpleLazyObject(lambda: peek_cart_items_count(request)),
+    }
+
+
+def fragments(request):
+    """
+    Версии для ключей {% fragment_cache %} карточек товаров и блоков категорий.
+    Читаются из кэша лениво - только на страницах с такими фрагментами.
+    """
+    return {
+        'product_fragments_version': SimpleLazyObject(lambda: get_version(PRODUCT_FRAGMENTS_NAMESPACE)),
+        'category_tree_version': SimpleLazyObject(lambda: get_version(CATEGORY_TREE_NAMESPACE)),
+    }
@@ -0,0 +1,316 @@
+"""
+Генератор синтетических данных для проверки производительности на объеме.
+
+Создает дерево категорий заданной глубины, товары в листовых категориях,
+пользователей всех типов, историю заказов с позициями и живые корзины.
+Все вставки - пачками bulk_create, одна транзакция на пачку; номера
+заказов, суммы и итоги корзин считаются в Python, поэтому сигналы и
+save() не нужны. Производные данные (пути категорий, счетчики номеров
+заказов, сводки UserOrderStats, кэши) обновляются в конце одним проходом.
+
+Данные детерминированы при одинаковом seed. Все генерируемые записи
+помечены префиксом (логины пользователей, артикулы товаров), так что
+повторный запуск с другим префиксом добавляет новый набор поверх старого.
+"""
+import datetime
+import random
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from .catalog_utils import invalidate_product_caches
+from .category_tree import invalidate_category_tree
+from .models import Cart, CartItem, Category, Order, OrderItem, OrderNumberCounter, Product
+from .order_numbers import ORDER_NUMBER_FORMAT
+from .order_stats import rebuild_user_stats
+
+DEFAULT_BATCH_SIZE = 5000
+GENERATED_PASSWORD = 'generated-password'
+
+# Готовые масштабы; отдельные значения переопределяются параметрами команды
+SCALES = {
+    'small': {'categories': 60, 'products': 2_000, 'users': 200, 'orders': 2_000, 'carts': 100},
+    'medium': {'categories': 600, 'products': 20_000, 'users': 5_000, 'orders': 100_000, 'carts': 2_000},
+    'large': {'categories': 3_000, 'products': 200_000, 'users': 50_000, 'orders': 1_000_000, 'carts': 20_000},
+}
+
+MATERIALS = [
+    'Цемент', 'Кирпич', 'Газоблок', 'Гипсокартон', 'Профиль', 'Саморез', 'Утеплитель', 'Краска',
+    'Грунтовка', 'Ламинат', 'Плитка', 'Клей', 'Шпаклевка', 'Доска', 'Брус', 'Фанера', 'ОСБ',
+    'Арматура', 'Труба', 'Кабель', 'Штукатурка', 'Герметик', 'Пена монтажная', 'Мембрана',
+]
+BRANDS = ['Кнауф', 'Церезит', 'Волма', 'Технониколь', 'Ceresit', 'Bergauf', 'Основит', 'Старатели', 'Юнис']
+UNITS = ['шт.', 'шт.', 'шт.', 'м', 'м²', 'кг', 'мешок', 'упак.', 'л']
+
+# Доли типов пользователей и статусов заказов (веса для random.choices)
+USER_TYPE_WEIGHTS = {'client': 85, 'partner': 10, 'manager': 5}
+ORDER_STATUS_WEIGHTS = {
+    'draft': 2, 'pending': 8, 'confirmed': 8, 'processing': 7, 'shipped': 10, 'delivered': 60, 'cancelled': 5,
+}
+
+
+@dataclass
+class DatasetConfig:
+    categories: int
+    products: int
+    users: int
+    orders: int
+    carts: int
+    category_depth: int = 4
+    lines_per_order: int = 4
+    history_days: int = 730
+    prefix: str = 'gen'
+    seed: int = 1
+    batch_size: int = DEFAULT_BATCH_SIZE
+
+
+@contextmanager
+def explicit_timestamps(model, *field_names):
+    """Временно отключить auto_now_add, чтобы bulk_create сохранил заданные даты"""
+    fields = [model._meta.get_field(name) for name in field_names]
+    saved = [field.auto_now_add for field in fields]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, value in zip(fields, saved):
+            field.auto_now_add = value
+
+
+def _batches(total, size):
+    """(начало, конец) пачек для range(total)"""
+    for start in range(0, total, size):
+        yield start, min(start + size, total)
+
+
+class DatasetGenerator:
+    def __init__(self, config, log=None):
+        self.config = config
+        self.rng = random.Random(config.seed)
+        self.log = log or (lambda message: None)
+        self.counts = {}
+        self.now = timezone.now()
+
+    def generate(self):
+        """Создать набор данных; возвращает {модель: количество}"""
+        category_ids = self.create_categories()
+        products, in_stock = self.create_products(category_ids)
+        user_ids = self.create_users()
+        client_ids = user_ids[:max(1, int(len(user_ids) * 0.95))]
+        self.create_orders(client_ids, products)
+        self.create_carts(client_ids, in_stock)
+        self.refresh_derived_data(user_ids)
+        return self.counts
+
+    def _step(self, label, count, started):
+        self.counts[label] = self.counts.get(label, 0) + count
+        elapsed = time.monotonic() - started
+        self.log(f"   {label}: {self.counts[label]} ({count / max(elapsed, 0.001):.0f} записей/с)")
+
+    # ==================== КАТЕГОРИИ ====================
+
+    def create_categories(self):
+        """Дерево по уровням (каждый уровень в ~3 раза шире); возвращает id листовых категорий"""
+        config = self.config
+        started = time.monotonic()
+        depth = max(config.category_depth, 1)
+        weights = [3 ** level for level in range(depth)]
+        per_level = [max(1, config.categories * weight // sum(weights)) for weight in weights]
+
+        parents = [None]
+        has_children = set()
+        all_ids = []
+        for level, count in enumerate(per_level):
+            categories = []
+            for index in range(count):
+                parent_id = self.rng.choice(parents)
+                material = self.rng.choice(MATERIALS)
+                name = material if level == 0 else f"{material} {self.rng.choice(BRANDS)} {index + 1}"
+                categories.append(Category(name=name, parent_id=parent_id))
+                has_children.add(parent_id)
+            with transaction.atomic():
+                created = Category.objects.bulk_create(categories, batch_size=config.batch_size)
+            parents = [category.pk for category in created]
+            all_ids.extend(parents)
+        self._step('accounts.Category', len(all_ids), started)
+        return [pk for pk in all_ids if pk not in has_children]
+
+    # ==================== ТОВАРЫ ====================
+
+    def create_products(self, category_ids):
+        """Товары в листовых категориях; возвращает [(id, цена)] всех товаров и товаров в наличии"""
+        config = self.config
+        started = time.monotonic()
+        products = []
+        with explicit_timestamps(Product, 'created_at'):
+            for start, end in _batches(config.products, config.batch_size):
+                batch = []
+                for number in range(start, end):
+                    material = self.rng.choice(MATERIALS)
+                    # Четверть товаров без остатка - частичные индексы и фильтры каталога работают как в жизни
+                    stock = 0 if self.rng.random() < 0.25 else self.rng.randint(1, 500)
+                    batch.append(Product(
+                        category_id=self.rng.choice(category_ids),
+                        name=f"{material} {self.rng.choice(BRANDS)} {self.rng.randint(1, 999)}",
+                        sku=f"{config.prefix.upper()}-{number:07d}",
+                        description=f"{material}, партия {self.rng.randint(1, 99)}",
+                        price=Decimal(self.rng.randint(500, 5_000_000)) / 100,
+                        stock=stock,
+                        unit=self.rng.choice(UNITS),
+                        is_popular=self.rng.random() < 0.03,
+                        created_at=self.now - datetime.timedelta(minutes=self.rng.randint(0, config.history_days * 1440)),
+                    ))
+                with transaction.atomic():
+                    created = Product.objects.bulk_create(batch)
+                products.extend((product.pk, product.price, product.stock) for product in created)
+        self._step('accounts.Product', len(products), started)
+        return (
+            [(pk, price) for pk, price, _ in products],
+            [(pk, price) for pk, price, stock in products if stock],
+        )
+
+    # ==================== ПОЛЬЗОВАТЕЛИ ====================
+
+    def create_users(self):
+        """Пользователи смешанных типов; первыми в списке id идут клиенты"""
+        config = self.config
+        User = get_user_model()
+        started = time.monotonic()
+        # PBKDF2 - сотни миллисекунд на хеш, поэтому один хеш на всех
+        password = make_password(GENERATED_PASSWORD)
+        types, weights = zip(*USER_TYPE_WEIGHTS.items())
+        ids = {user_type: [] for user_type in types}
+        for start, end in _batches(config.users, config.batch_size):
+            batch = []
+            for number in range(start, end):
+                user_type = self.rng.choices(types, weights)[0]
+                username = f"{config.prefix}_user_{number}"
+                batch.append(User(
+                    username=username,
+                    password=password,
+                    email=f"{username}@example.com",
+                    user_type=user_type,
+                    phone=f"+7{self.rng.randint(9000000000, 9999999999)}",
+                    company_name=f"ООО \"{self.rng.choice(BRANDS)}-{number}\"" if user_type != 'manager' else '',
+                    inn=f"{self.rng.randint(10 ** 9, 10 ** 10 - 1)}",
+                    is_staff=user_type == 'manager',
+                ))
+            with transaction.atomic():
+                created = User.objects.bulk_create(batch)
+            for user in created:
+                ids[user.user_type].append(user.pk)
+        self._step('accounts.CustomUser', sum(len(value) for value in ids.values()), started)
+        return ids['client'] + ids['partner'] + ids['manager']
+
+    # ==================== ЗАКАЗЫ ====================
+
+    def _order_numbers(self):
+        """Последние номера заказов по дням - генерируемые номера продолжают счетчики"""
+        return dict(OrderNumberCounter.objects.values_list('day', 'last_value'))
+
+    def create_orders(self, user_ids, products):
+        config = self.config
+        started = time.monotonic()
+        last_numbers = self._order_numbers()
+        statuses, weights = zip(*ORDER_STATUS_WEIGHTS.items())
+        max_lines = max(1, config.lines_per_order * 2 - 1)
+        items_total = 0
+
+        with explicit_timestamps(Order, 'created_at'):
+            for start, end in _batches(config.orders, config.batch_size):
+                orders = []
+                lines = []
+                for _ in range(start, end):
+                    created_at = self.now - datetime.timedelta(
+                        seconds=self.rng.randint(0, config.history_days * 86400),
+                    )
+                    day = timezone.localdate(created_at)
+                    last_numbers[day] = last_numbers.get(day, 0) + 1
+                    order_lines = [
+                        (product_id, self.rng.randint(1, 20), price)
+                        for product_id, price in self.rng.sample(products, min(self.rng.randint(1, max_lines), len(products)))
+                    ]
+                    orders.append(Order(
+                        user_id=self.rng.choice(user_ids),
+                        order_number=ORDER_NUMBER_FORMAT.format(day=day, number=last_numbers[day]),
+                        status=self.rng.choices(statuses, weights)[0],
+                        total_amount=sum((quantity * price for _, quantity, price in order_lines), Decimal('0')),
+                        delivery_address=f"г. Москва, ул. Строителей, д. {self.rng.randint(1, 200)}",
+                        created_at=created_at,
+                    ))
+                    lines.append(order_lines)
+
+                with transaction.atomic():
+                    created = Order.objects.bulk_create(orders)
+                    items = [
+                        OrderItem(order_id=order.pk, product_id=product_id, quantity=quantity, price=price)
+                        for order, order_lines in zip(created, lines)
+                        for product_id, quantity, price in order_lines
+                    ]
+                    OrderItem.objects.bulk_create(items)
+                items_total += len(items)
+                if end % (config.batch_size * 20) == 0:
+                    self.log(f"   ... заказов: {end}")
+
+        # Счетчики номеров - к последним выданным номерам
+        OrderNumberCounter.objects.bulk_create(
+            [OrderNumberCounter(day=day, last_value=value) for day, value in last_numbers.items()],
+            update_conflicts=True, unique_fields=['day'], update_fields=['last_value'], batch_size=500,
+        )
+        self._step('accounts.Order', config.orders, started)
+        self.counts['accounts.OrderItem'] = items_total
+
+    # ==================== КОРЗИНЫ ====================
+
+    def create_carts(self, user_ids, in_stock):
+        """Живые корзины: у части клиентов 1-8 позиций из товаров в наличии, итоги сразу посчитаны"""
+        config = self.config
+        started = time.monotonic()
+        owners = self.rng.sample(user_ids, min(config.carts, len(user_ids)))
+        # Корзина у пользователя одна (cart_unique_user)
+        owners = list(set(owners) - set(Cart.objects.filter(user_id__in=owners).values_list('user_id', flat=True)))
+        items_total = 0
+        for start, end in _batches(len(owners), config.batch_size):
+            carts = []
+            lines = []
+            for user_id in owners[start:end]:
+                cart_lines = [
+                    (product_id, self.rng.randint(1, 10), price)
+                    for product_id, price in self.rng.sample(in_stock, min(self.rng.randint(1, 8), len(in_stock)))
+                ]
+                carts.append(Cart(
+                    user_id=user_id,
+                    items_count=sum(quantity for _, quantity, _ in cart_lines),
+                    subtotal=sum((quantity * price for _, quantity, price in cart_lines), Decimal('0')),
+                ))
+                lines.append(cart_lines)
+            with transaction.atomic():
+                created = Cart.objects.bulk_create(carts)
+                items = [
+                    CartItem(cart_id=cart.pk, product_id=product_id, quantity=quantity)
+                    for cart, cart_lines in zip(created, lines)
+                    for product_id, quantity, _ in cart_lines
+                ]
+                CartItem.objects.bulk_create(items)
+            items_total += len(items)
+        self._step('accounts.Cart', len(owners), started)
+        self.counts['accounts.CartItem'] = items_total
+
+    # ==================== ПРОИЗВОДНЫЕ ДАННЫЕ ====================
+
+    def refresh_derived_data(self, user_ids):
+        """То, что обычно поддерживают save() и сигналы"""
+        started = time.monotonic()
+        Category.rebuild_paths()
+        invalidate_category_tree()
+        for start, end in _batches(len(user_ids), 1000):
+            rebuild_user_stats(user_ids[start:end])
+        invalidate_product_caches()
+        self.log(f"   пути категорий, сводки заказов, кэши: {time.monotonic() - started:.1f} с")
@@ -0,0 +1,130 @@
+"""
+Выгрузка прайс-листа и реестра заказов в CSV и XLSX.
+
+Строки читаются из БД через .iterator(chunk_size=...) плоскими кортежами
+(values_list с JOIN-ами вместо объектов моделей), поэтому память не
+зависит от размера выгрузки. CSV отдается StreamingHttpResponse - загрузка
+начинается сразу. XLSX не потоковый: книга целиком пишется openpyxl в режиме
+write_only во временный файл на диске и только потом отдается FileResponse.
+
+Столбцы прайс-листа совпадают с форматом импорта (price_import.py), так
+что выгрузку можно отредактировать и загрузить обратно.
+"""
+import csv
+import tempfile
+from datetime import datetime, time, timedelta
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+
+from .category_tree import get_category_tree
+from .models import OrderItem, Product
+
+CHUNK_SIZE = 2000
+
+PRODUCT_HEADER = ['Артикул', 'Название', 'Цена', 'Остаток', 'Ед.', 'Категория', 'Описание']
+ORDER_HEADER = [
+    'Номер заказа', 'Дата', 'Статус', 'Клиент', 'Компания',
+    'Артикул', 'Товар', 'Количество', 'Цена', 'Сумма',
+]
+
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи"""
+
+    def write(self, value):
+        return value
+
+
+def product_rows(queryset=None):
+    """Строки прайс-листа; категория - полный путь из дерева в памяти"""
+    queryset = Product.objects.all() if queryset is None else queryset
+    tree = get_category_tree()
+    rows = (
+        queryset
+        .order_by('category_id', 'name', 'id')
+        .values_list('sku', 'name', 'price', 'stock', 'unit', 'category_id', 'description')
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for sku, name, price, stock, unit, category_id, description in rows:
+        yield [sku, name, price, stock, unit, tree.full_name(category_id), description]
+
+
+def _start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def order_rows(orders, date_from=None, date_to=None):
+    """Реестр заказов построчно (позиция заказа = строка)"""
+    items = OrderItem.objects.filter(order__in=orders)
+    # Границы дней как моменты времени, а не __date: так работает индекс по created_at
+    if date_from:
+        items = items.filter(order__created_at__gte=_start_of_day(date_from))
+    if date_to:
+        items = items.filter(order__created_at__lt=_start_of_day(date_to + timedelta(days=1)))
+    statuses = dict(orders.model.STATUS_CHOICES)
+    rows = (
+        items
+        .order_by('order__created_at', 'order_id', 'id')
+        .values_list(
+            'order__order_number', 'order__created_at', 'order__status',
+            'order__user__username', 'order__user__company_name',
+            'product__sku', 'product__name', 'quantity', 'price',
+        )
+        .iterator(chunk_size=CHUNK_SIZE)
+    )
+    for number, created_at, status, username, company, sku, name, quantity, price in rows:
+        yield [
+            number, timezone.localtime(created_at).strftime('%d.%m.%Y %H:%M'), statuses.get(status, status),
+            username, company, sku, name, quantity, price, quantity * price,
+        ]
+
+
+def _filename(prefix, extension):
+    return f"{prefix}_{timezone.localdate():%Y%m%d}.{extension}"
+
+
+def csv_response(header, rows, prefix):
+    """CSV потоком; BOM и разделитель ';' - чтобы Excel открывал без мастера импорта"""
+    writer = csv.writer(Echo(), delimiter=';')
+
+    def stream():
+        yield '\ufeff' + writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(stream(), content_type=CSV_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{_filename(prefix, "csv")}"'
+    return response
+
+
+def xlsx_response(header, rows, prefix, title):
+    """XLSX через write_only-книгу во временном файле (строки не копятся в памяти)"""
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title)
+    worksheet.append(header)
+    for row in rows:
+        worksheet.append(row)
+
+    output = tempfile.TemporaryFile(suffix='.xlsx')
+    workbook.save(output)
+    output.seek(0)
+    return FileResponse(
+        output, as_attachment=True, filename=_filename(prefix, 'xlsx'), content_type=XLSX_CONTENT_TYPE,
+    )
+
+
+def export_response(kind, export_format, queryset, date_from=None, date_to=None):
+    """Ответ с выгрузкой: kind - 'products' или 'orders', export_format - 'csv' или 'xlsx'"""
+    if kind == 'products':
+        header, rows, title = PRODUCT_HEADER, product_rows(queryset), 'Прайс-лист'
+    else:
+        header, rows, title = ORDER_HEADER, order_rows(queryset, date_from, date_to), 'Заказы'
+    if export_format == 'xlsx':
+        return xlsx_response(header, rows, kind, title)
+    return csv_response(header, rows, kind)
@@ -0,0 +1,362 @@
+"""
+Потоковая работа с JSON-дампами формата dumpdata.
+
+iter_fixture() читает массив объектов порциями через JSONDecoder.raw_decode
+и отдает записи по одной - весь файл в память не загружается.
+write_fixture() так же по одной записи пишет их обратно в массив.
+
+FixtureLoader загружает дамп в два прохода:
+1. записи раскладываются по моделям во временные файлы (JSON lines);
+2. модели загружаются в порядке зависимостей по внешним ключам пачками
+   bulk_create, одна транзакция на пачку. Ссылки модели на саму себя
+   (Category.parent) проставляются отдельным bulk_update после загрузки.
+Даты из дампа сохраняются как есть: auto_now/auto_now_add на время загрузки
+отключаются (как save(raw=True) в loaddata), иначе bulk_create проставил бы
+всем записям время загрузки.
+В конце сбрасываются последовательности первичных ключей.
+"""
+import codecs
+import gzip
+import json
+import os
+import tempfile
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.core.serializers.python import Deserializer as PythonDeserializer
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+READ_CHUNK_SIZE = 1 << 16
+DEFAULT_BATCH_SIZE = 2000
+
+_decoder = json.JSONDecoder()
+SEPARATORS = ' \t\r\n,'
+# Кодировки для encoding='auto': старые дампы с Windows сохранены в cp1251
+FALLBACK_ENCODINGS = ('utf-8', 'cp1251')
+DELIMITERS = SEPARATORS + ']'
+
+
+def open_fixture(path, mode='rt', encoding='utf-8'):
+    """Открыть дамп (поддерживается .gz)"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode, encoding=encoding)
+    return open(path, mode, encoding=encoding)
+
+
+def iter_json_array(fp, chunk_size=READ_CHUNK_SIZE):
+    """Элементы JSON-массива верхнего уровня по одному"""
+    buffer = ''
+    position = 0
+    started = False
+    eof = False
+
+    while True:
+        # Пропускаем пробелы и разделители между элементами
+        while position < len(buffer) and buffer[position] in SEPARATORS:
+            position += 1
+        if position < len(buffer) and not started:
+            if buffer[position] != '[':
+                raise ValueError('Дамп должен быть JSON-массивом')
+            started = True
+            position += 1
+            continue
+        if position < len(buffer) and buffer[position] == ']':
+            return
+
+        if position < len(buffer):
+            try:
+                obj, end = _decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # Объект не поместился в буфер - дочитываем
+                if eof:
+                    raise
+            else:
+                # Число на границе буфера может быть обрезано ("2." из "2.5") -
+                # элемент готов, только когда за ним виден разделитель
+                if eof or (end < len(buffer) and buffer[end] in DELIMITERS):
+                    yield obj
+                    position = end
+                    continue
+
+        if eof:
+            if not started:
+                raise ValueError('Пустой дамп')
+            raise ValueError('Дамп оборван: нет закрывающей скобки массива')
+        chunk = fp.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[position:] + chunk
+        position = 0
+
+
+def iter_fixture(path, chunk_size=READ_CHUNK_SIZE, encoding='utf-8'):
+    """Записи дампа {'model', 'pk', 'fields'} по одной; encoding='auto' - detect_encoding"""
+    if encoding == 'auto':
+        encoding = detect_encoding(path)
+    with open_fixture(path, encoding=encoding) as fp:
+        yield from iter_json_array(fp, chunk_size)
+
+
+def detect_encoding(path, candidates=FALLBACK_ENCODINGS):
+    """
+    Первая кодировка из candidates, в которой читается весь дамп. Файл
+    проверяется потоково; cp1251 декодирует почти любые байты, поэтому стоит последней.
+    """
+    for encoding in candidates:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            with (gzip.open(path, 'rb') if path.endswith('.gz') else open(path, 'rb')) as fp:
+                while chunk := fp.read(READ_CHUNK_SIZE):
+                    decoder.decode(chunk)
+                decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        return encoding
+    raise ValueError(f"Не удалось определить кодировку (пробовали: {', '.join(candidates)})")
+
+
+def write_fixture(path, records, indent=None):
+    """
+    Записать записи JSON-массивом по одной; возвращает их количество.
+    Пишется во временный файл рядом, который заменяет path только после
+    успешной записи: ошибка посреди чтения исходного дампа не оставит вместо
+    результата оборванный файл.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f'.{name}.', suffix='.gz' if path.endswith('.gz') else '')
+    os.close(fd)
+    # mkstemp создает файл с правами 0600 - выставляем обычные (с учетом umask)
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp_path, 0o666 & ~umask)
+    try:
+        count = 0
+        with open_fixture(tmp_path, 'wt') as fp:
+            fp.write('[')
+            for record in records:
+                fp.write(',\n' if count else '\n')
+                fp.write(json.dumps(record, ensure_ascii=False, indent=indent))
+                count += 1
+            fp.write('\n]\n')
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return count
+
+
+def is_excluded(label, exclude):
+    """Модель исключена по метке 'app.model' или целиком по приложению"""
+    label = label.lower()
+    return label in exclude or label.split('.')[0] in exclude
+
+
+class PkRemapper:
+    """
+    Сдвиг первичных ключей моделей на заданное смещение вместе со всеми
+    ссылками на них (FK, O2O, M2M). Смещение не требует таблицы соответствия,
+    поэтому запись преобразуется сама по себе, без памяти о предыдущих.
+    """
+
+    def __init__(self, offsets):
+        self.offsets = {apps.get_model(label): offset for label, offset in offsets.items()}
+
+    def _shift(self, model, value):
+        offset = self.offsets.get(model)
+        if offset and isinstance(value, int):
+            return value + offset
+        return value
+
+    def remap(self, record):
+        model = apps.get_model(record['model'])
+        pk_field = model._meta.pk
+        pk_model = pk_field.related_model if pk_field.is_relation else model
+        if 'pk' in record:
+            record['pk'] = self._shift(pk_model, record['pk'])
+
+        fields = record.get('fields', {})
+        for field in model._meta.concrete_fields:
+            if field.is_relation and field.name in fields and field.target_field.primary_key:
+                fields[field.name] = self._shift(field.related_model, fields[field.name])
+        for field in model._meta.many_to_many:
+            if isinstance(fields.get(field.name), list):
+                fields[field.name] = [self._shift(field.related_model, value) for value in fields[field.name]]
+        return record
+
+
+def model_load_order(models):
+    """Модели в порядке зависимостей: сначала те, на которые ссылаются внешние ключи"""
+    models = list(models)
+    pending = set(models)
+    ordered = []
+    while pending:
+        ready = [
+            model for model in models
+            if model in pending and not any(
+                field.related_model in pending and field.related_model is not model
+                for field in model._meta.concrete_fields
+                if field.is_relation
+            )
+        ]
+        if not ready:
+            # Цикл между моделями: грузим в исходном порядке, проверка ключей - в конце
+            ready = [model for model in models if model in pending]
+        for model in ready:
+            pending.discard(model)
+            ordered.append(model)
+    return ordered
+
+
+def self_references(model):
+    """Внешние ключи модели на саму себя (загружаются вторым проходом)"""
+    return [
+        field for field in model._meta.concrete_fields
+        if field.is_relation and field.related_model is model
+    ]
+
+
+@contextmanager
+def stored_timestamps(models):
+    """Временно отключить auto_now и auto_now_add: bulk_create сохранит даты из дампа"""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False) or getattr(field, 'auto_now_add', False)
+    ]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+class FixtureLoader:
+    """Загрузка дампа пачками bulk_create; записи с существующим pk обновляются"""
+
+    def __init__(self, using=DEFAULT_DB_ALIAS, batch_size=DEFAULT_BATCH_SIZE,
+                 exclude=(), ignorenonexistent=False, log=None):
+        self.using = using
+        self.connection = connections[using]
+        self.batch_size = batch_size
+        self.exclude = {label.lower() for label in exclude}
+        self.ignorenonexistent = ignorenonexistent
+        self.log = log or (lambda message: None)
+        self.counts = defaultdict(int)
+
+    def load(self, path):
+        """Загрузить дамп; возвращает {модель: количество записей}"""
+        with tempfile.TemporaryDirectory(prefix='fixture-') as spool_dir:
+            spools = self._spool(path, spool_dir)
+            models = model_load_order(spools)
+
+            with self.connection.constraint_checks_disabled(), stored_timestamps(models):
+                for model in models:
+                    self._load_model(model, spools[model])
+                for model in models:
+                    if self_references(model):
+                        self._load_self_references(model, spools[model])
+
+            table_names = [model._meta.db_table for model in models]
+            self.connection.check_constraints(table_names=table_names)
+            self._reset_sequences(models)
+        return dict(self.counts)
+
+    def _spool(self, path, spool_dir):
+        """Первый проход: записи по моделям во временные файлы"""
+        files = {}
+        spools = {}
+        try:
+            for record in iter_fixture(path):
+                label = record['model'].lower()
+                if is_excluded(label, self.exclude):
+                    continue
+                model = apps.get_model(label)
+                if model not in files:
+                    spools[model] = os.path.join(spool_dir, label + '.jsonl')
+                    files[model] = open(spools[model], 'w', encoding='utf-8')
+                files[model].write(json.dumps(record, ensure_ascii=False) + '\n')
+        finally:
+            for fp in files.values():
+                fp.close()
+        return spools
+
+    def _iter_batches(self, spool_path):
+        batch = []
+        with open(spool_path, encoding='utf-8') as fp:
+            for line in fp:
+                batch.append(json.loads(line))
+                if len(batch) >= self.batch_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _load_model(self, model, spool_path):
+        deferred = [field.attname for field in self_references(model)]
+        pk_name = model._meta.pk.name
+        update_fields = [
+            field.name for field in model._meta.concrete_fields
+            if not field.primary_key and field.attname not in deferred
+        ]
+        features = self.connection.features
+        upsert = features.supports_update_conflicts_with_target and update_fields
+
+        for batch in self._iter_batches(spool_path):
+            objects = []
+            m2m = defaultdict(list)
+            for deserialized in PythonDeserializer(batch, using=self.using,
+                                                   ignorenonexistent=self.ignorenonexistent):
+                obj = deserialized.object
+                for attname in deferred:
+                    setattr(obj, attname, None)
+                objects.append(obj)
+                for field_name, values in (deserialized.m2m_data or {}).items():
+                    m2m[field_name].append((obj.pk, values))
+
+            with transaction.atomic(using=self.using):
+                if upsert:
+                    model.objects.using(self.using).bulk_create(
+                        objects, update_conflicts=True, unique_fields=[pk_name], update_fields=update_fields,
+                    )
+                else:
+                    model.objects.using(self.using).bulk_create(objects, ignore_conflicts=True)
+                self._load_m2m(model, m2m)
+            self.counts[model._meta.label] += len(objects)
+            self.log(f"   {model._meta.label}: {self.counts[model._meta.label]}")
+
+    def _load_m2m(self, model, m2m):
+        for field_name, rows in m2m.items():
+            field = model._meta.get_field(field_name)
+            through = field.remote_field.through
+            source = field.m2m_field_name() + '_id'
+            target = field.m2m_reverse_field_name() + '_id'
+            through.objects.using(self.using).filter(**{
+                source + '__in': [pk for pk, _ in rows],
+            }).delete()
+            through.objects.using(self.using).bulk_create([
+                through(**{source: pk, target: value})
+                for pk, values in rows
+                for value in values
+            ])
+
+    def _load_self_references(self, model, spool_path):
+        """Второй проход: ссылки на ту же модель, когда все строки уже есть"""
+        fields = self_references(model)
+        for batch in self._iter_batches(spool_path):
+            objects = [
+                deserialized.object
+                for deserialized in PythonDeserializer(batch, using=self.using,
+                                                       ignorenonexistent=self.ignorenonexistent)
+            ]
+            with transaction.atomic(using=self.using):
+                model.objects.using(self.using).bulk_update(objects, [field.name for field in fields])
+
+    def _reset_sequences(self, models):
+        statements = self.connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with self.connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
@@ -75,4 +75,10 @@ class CartItemForm(forms.ModelForm):
                 'max': 100,
                 'style': 'width: 80px;'
             })
-        }
\ No newline at end of file
+        }
+
+
+class PriceListImportForm(forms.Form):
+    """Загрузка прайс-листа в админке (см. price_import.py)"""
+    file = forms.FileField(label='Прайс-лист (CSV или XLSX)')
+    dry_run = forms.BooleanField(label='Только проверить, ничего не записывать', required=False)
@@ -0,0 +1,143 @@
+"""
+Корзина гостя без записи в таблицы Cart/CartItem.
+
+Позиции хранятся как {id товара: количество} в сессии или в подписанной cookie
+(настройка GUEST_CART_STORE: 'session' или 'cookie'). В БД корзина попадает
+только при входе пользователя - через cart_utils.merge_carts_on_login.
+"""
+from decimal import Decimal
+
+from django.conf import settings
+
+from .models import Product
+
+SESSION_KEY = 'guest_cart'
+COOKIE_NAME = 'guest_cart'
+COOKIE_SALT = 'accounts.guest_cart'
+COOKIE_MAX_AGE = 60 * 60 * 24 * 30
+# Ограничение cookie-хранилища: подписанная cookie должна уложиться в 4 КБ
+COOKIE_MAX_LINES = 100
+
+
+class SessionGuestCartStore:
+    """Хранение позиций в сессии (пишется только при изменении корзины)"""
+
+    max_lines = None
+
+    def __init__(self, request):
+        self.request = request
+
+    def load(self):
+        lines = self.request.session.get(SESSION_KEY, {})
+        return {int(product_id): quantity for product_id, quantity in lines.items()}
+
+    def save(self, lines):
+        if lines:
+            self.request.session[SESSION_KEY] = {str(product_id): quantity for product_id, quantity in lines.items()}
+        else:
+            self.request.session.pop(SESSION_KEY, None)
+
+
+class SignedCookieGuestCartStore:
+    """
+    Хранение позиций в подписанной cookie вида "12:3|40:1" - без сессии и без БД.
+    Новое значение выставляется в ответ через CartMiddleware.
+    """
+
+    max_lines = COOKIE_MAX_LINES
+
+    def __init__(self, request):
+        self.request = request
+
+    def load(self):
+        if hasattr(self.request, '_guest_cart_cookie'):
+            raw = self.request._guest_cart_cookie
+        else:
+            raw = self.request.get_signed_cookie(COOKIE_NAME, default='', salt=COOKIE_SALT)
+        lines = {}
+        for pair in (raw or '').split('|'):
+            product_id, _, quantity = pair.partition(':')
+            if product_id.isdigit() and quantity.isdigit() and int(quantity) > 0:
+                lines[int(product_id)] = int(quantity)
+        return lines
+
+    def save(self, lines):
+        # None - удалить cookie в ответе
+        self.request._guest_cart_cookie = '|'.join(
+            f"{product_id}:{quantity}" for product_id, quantity in lines.items()
+        ) or None
+
+
+STORES = {
+    'session': SessionGuestCartStore,
+    'cookie': SignedCookieGuestCartStore,
+}
+
+
+def get_guest_cart_store(request):
+    return STORES[getattr(settings, 'GUEST_CART_STORE', 'session')](request)
+
+
+class GuestCartItem:
+    """Позиция гостевой корзины с интерфейсом CartItem (id позиции = id товара)"""
+
+    def __init__(self, product, quantity):
+        self.id = product.id
+        self.product = product
+        self.quantity = quantity
+
+    @property
+    def price(self):
+        return self.product.price
+
+    @property
+    def total(self):
+        return self.quantity * self.product.price
+
+
+class GuestCart:
+    """Корзина гостя с интерфейсом модели Cart (total_items, total_price)"""
+
+    pk = None
+    user = None
+
+    def __init__(self, store):
+        self.store = store
+        self.lines = store.load()
+        self._items = None
+
+    def get_items(self):
+        """Позиции с товарами (один запрос); исчезнувшие товары отбрасываются"""
+        if self._items is None:
+            products = Product.objects.in_bulk(list(self.lines))
+            self._items = [
+                GuestCartItem(products[product_id], quantity)
+                for product_id, quantity in self.lines.items()
+                if product_id in products
+            ]
+        return self._items
+
+    @property
+    def total_items(self):
+        return sum(self.lines.values())
+
+    @property
+    def total_price(self):
+        return sum((item.total for item in self.get_items()), Decimal('0'))
+
+    def set_quantity(self, product_id, quantity):
+        if quantity > 0:
+            self.lines[product_id] = quantity
+        else:
+            self.lines.pop(product_id, None)
+        self._items = None
+        self.store.save(self.lines)
+
+    def is_full(self, product_id):
+        max_lines = self.store.max_lines
+        return max_lines is not None and product_id not in self.lines and len(self.lines) >= max_lines
+
+    def clear(self):
+        self.lines = {}
+        self._items = None
+        self.store.save(self.lines)
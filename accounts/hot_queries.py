@@ -0,0 +1,209 @@
+"""
+Проверка планов горячих запросов (главная, каталог, корзина, заказы).
+
+Запросы не перечисляются вручную: страницы из HOT_VIEWS открываются тестовым
+клиентом, и проверяется ровно тот SQL, который они выполнили
+(CaptureQueriesContext). На время съемки кэш подменяется пустым (DummyCache),
+поэтому в выборку попадают и запросы, которые обычно закрыты кэшем (список
+категорий каталога, данные главной). Все изменения в БД откатываются.
+
+Для каждого SELECT получаем план и ищем чтение большой таблицы целиком:
+полное сканирование таблицы или полного индекса (SQLite: SCAN t, SCAN t USING
+INDEX i; PostgreSQL: Seq Scan, Index Scan без Index Cond). Исключение - чтение
+индекса по порядку под ORDER BY ... LIMIT без сортировки (новинки на главной):
+оно останавливается после LIMIT строк. Маленькие таблицы (меньше
+LARGE_TABLE_ROWS строк) читать целиком нормально. Команда
+check_query_indexes запускает проверку на текущей БД - так новый горячий
+запрос без подходящего индекса виден сразу, а не на продакшене.
+"""
+import json
+import re
+from dataclasses import dataclass, field
+
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .catalog_utils import catalog_category_ids, get_category_chunk
+from .models import Order, Product
+
+LARGE_TABLE_ROWS = 1000
+
+# Страница -> адрес для образца данных (HotQuerySample)
+HOT_VIEWS = {
+    'home': lambda sample: reverse('home'),
+    'catalog': lambda sample: reverse('catalog'),
+    'catalog.subtree': lambda sample: reverse('catalog') + f'?category={sample.category_id}',
+    'catalog.more': lambda sample: (
+        reverse('catalog_category_products', args=[sample.category_id])
+        + (f'?cursor={sample.cursor}' if sample.cursor else '')
+    ),
+    'search': lambda sample: reverse('product_search') + f'?q={sample.search_term}',
+    'cart': lambda sample: reverse('cart_view'),
+    'cart.count': lambda sample: reverse('get_cart_count'),
+    'orders': lambda sample: reverse('order_list'),
+    'orders.status': lambda sample: reverse('order_list') + f'?status={sample.order.status}',
+    'order_detail': lambda sample: reverse('order_detail', args=[sample.order.pk]),
+    'dashboard': lambda sample: reverse('dashboard'),
+}
+
+NO_CACHE = {'default': {'BACKEND': 'django.core.cache.backends.dummy.DummyCache'}}
+
+# SQLite: 'SCAN accounts_product', 'SCAN U0 USING COVERING INDEX ...',
+# 'SCAN accounts_product_fts VIRTUAL TABLE INDEX 0:M3' (FTS5 с MATCH - поиск по индексу)
+SQLITE_SCAN_RE = re.compile(
+    r'^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+)| VIRTUAL TABLE INDEX \d+:(\S*))?'
+)
+# ORDER BY ... LIMIT n в конце запроса (не в подзапросе)
+TOP_N_RE = re.compile(r'\bORDER BY [^()]*\bLIMIT \d+(?: OFFSET 0)?\s*$')
+# Псевдонимы таблиц в SQL Django: "accounts_cartitem" U0
+ALIAS_RE = re.compile(r'"(\w+)"\s+(?:AS\s+)?"?([A-Z]\d+)"?\b')
+
+
+@dataclass
+class HotQuerySample:
+    """Реальные данные, на которых открываются страницы"""
+    order: Order
+    category_id: int
+    cursor: str | None
+    search_term: str
+
+    @property
+    def user(self):
+        return self.order.user
+
+
+@dataclass
+class HotQuery:
+    sql: str
+    views: list
+    plan: str = ''
+    # [(таблица, 'таблица целиком' | 'индекс <имя> целиком', строк в таблице)]
+    scans: list = field(default_factory=list)
+
+
+def pick_sample():
+    order = Order.objects.select_related('user').order_by('-id').first()
+    category_ids = catalog_category_ids()
+    if order is None or not category_ids:
+        raise ValueError('Нужны данные: товары в наличии и хотя бы один заказ (manage.py generate_dataset)')
+    category_id = category_ids[0]
+    _, cursor = get_category_chunk(category_id)
+    name = Product.objects.filter(category_id=category_id).values_list('name', flat=True).first()
+    return HotQuerySample(order=order, category_id=category_id, cursor=cursor, search_term=name.split()[0])
+
+
+def capture_hot_queries(views=None):
+    """{SQL: [страницы]} для SELECT-запросов страниц HOT_VIEWS"""
+    from django.test import Client, override_settings
+
+    from . import category_tree
+
+    queries = {}
+    with override_settings(CACHES=NO_CACHE), transaction.atomic():
+        # Дерево категорий в памяти процесса тоже перечитываем - его запрос горячий
+        category_tree._state['tree'] = None
+        sample = pick_sample()
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(sample.user)
+        for name, build_url in (views or HOT_VIEWS).items():
+            with CaptureQueriesContext(connection) as captured:
+                response = client.get(build_url(sample))
+            if response.status_code != 200:
+                raise ValueError(f"{name}: ответ {response.status_code}")
+            for query in captured.captured_queries:
+                if query['sql'].lstrip().upper().startswith(('SELECT', 'WITH')):
+                    queries.setdefault(query['sql'], []).append(name)
+        # Сессия входа и прочие записи страниц не нужны
+        transaction.set_rollback(True)
+    category_tree._state['tree'] = None
+    return queries
+
+
+def _sqlite_plan(sql):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+        rows = cursor.fetchall()
+    aliases = dict((alias, table) for table, alias in ALIAS_RE.findall(sql))
+    tables = set(connection.introspection.table_names())
+    details = [detail for *_, detail in rows]
+    top_n = TOP_N_RE.search(sql) and not any('TEMP B-TREE FOR ORDER BY' in detail for detail in details)
+    scans = []
+    for detail in details:
+        match = SQLITE_SCAN_RE.match(detail)
+        if not match or match.group(3) or (match.group(2) and top_n):
+            continue
+        table, index = aliases.get(match.group(1), match.group(1)), match.group(2)
+        # Подзапросы (qualify у оконных фильтров Django) и CONSTANT ROW - не таблицы,
+        # чтение таблиц внутри подзапроса видно отдельной строкой плана
+        if table in tables:
+            scans.append((table, f'индекс {index} целиком' if index else 'таблица целиком'))
+    return '\n'.join(details), scans
+
+
+def _postgres_nodes(node, depth=0, top_n=False):
+    """(глубина, узел, под Limit без сортировки между ними) для всех узлов плана"""
+    yield depth, node, top_n
+    if node['Node Type'] == 'Limit':
+        top_n = True
+    elif node['Node Type'] in ('Sort', 'Incremental Sort', 'Aggregate', 'Hash', 'Materialize'):
+        top_n = False
+    for child in node.get('Plans', []):
+        yield from _postgres_nodes(child, depth + 1, top_n)
+
+
+def _postgres_plan(sql):
+    # Seq scan запрещаем: при наличии подходящего индекса планировщик возьмет его
+    # даже на таблице среднего размера, и видно, есть ли такой индекс вообще
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}')
+        plan = cursor.fetchone()[0]
+    plan = json.loads(plan) if isinstance(plan, str) else plan
+    lines, scans = [], []
+    for depth, node, top_n in _postgres_nodes(plan[0]['Plan']):
+        node_type, table = node['Node Type'], node.get('Relation Name')
+        condition = node.get('Index Cond') or node.get('Filter') or ''
+        lines.append('  ' * depth + ' '.join(filter(None, [
+            node_type, f"on {table}" if table else '', f"using {node['Index Name']}" if 'Index Name' in node else '',
+            f"({condition})" if condition else '',
+        ])))
+        if node_type == 'Seq Scan':
+            scans.append((table, 'таблица целиком'))
+        elif node_type in ('Index Scan', 'Index Only Scan') and 'Index Cond' not in node and not top_n:
+            scans.append((table, f"индекс {node['Index Name']} целиком"))
+    return '\n'.join(lines), scans
+
+
+def explain(sql):
+    """(план текстом, [(таблица, как читается)] - чтения таблицы или индекса целиком)"""
+    if connection.vendor == 'postgresql':
+        return _postgres_plan(sql)
+    if connection.vendor == 'sqlite':
+        return _sqlite_plan(sql)
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN {sql}')
+        return '\n'.join(str(row) for row in cursor.fetchall()), []
+
+
+def table_rows(table):
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}')
+        return cursor.fetchone()[0]
+
+
+def check_hot_queries(queries=None, min_rows=LARGE_TABLE_ROWS):
+    """
+    Проверить планы запросов ({SQL: [страницы]}, по умолчанию - capture_hot_queries()).
+    Возвращает [HotQuery]; в scans - только таблицы от min_rows строк.
+    """
+    results, rows = [], {}
+    for sql, views in (queries if queries is not None else capture_hot_queries()).items():
+        plan, scans = explain(sql)
+        for table, _ in scans:
+            if table not in rows:
+                rows[table] = table_rows(table)
+        results.append(HotQuery(sql=sql, views=views, plan=plan, scans=[
+            (table, how, rows[table]) for table, how in scans if rows[table] >= min_rows
+        ]))
+    return results
@@ -0,0 +1,132 @@
+"""
+Замеры производительности запросов.
+
+Для каждого запроса CustomMiddleware собирает:
+- полное время обработки;
+- количество SQL-запросов и их суммарное время (connection.execute_wrapper);
+- время рендеринга шаблонов (бэкенд accounts.template_backend).
+
+Результат уходит в заголовок Server-Timing (виден во вкладке Network
+браузера), в лог accounts.performance строкой key=value и в счетчики
+процесса по маршрутам (p50/p95), которые показывает страница /metrics/
+для персонала.
+"""
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+# Сколько последних замеров храним на маршрут для перцентилей
+SAMPLES_PER_ROUTE = 1000
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    """Счетчики одного запроса"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def __call__(self, execute, sql, params, many, context):
+        """execute_wrapper: время каждого SQL-запроса"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+
+
+def start_request():
+    metrics = RequestMetrics()
+    token = _current.set(metrics)
+    return metrics, token
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def current_metrics():
+    """Счетчики текущего запроса или None вне запроса"""
+    return _current.get()
+
+
+def add_template_time(seconds):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.template_time += seconds
+
+
+def percentile(sorted_values, fraction):
+    """Перцентиль по отсортированному списку (ближайший ранг)"""
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(fraction * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+class RouteStats:
+    """Скользящие замеры по маршрутам в памяти процесса"""
+
+    def __init__(self, samples=SAMPLES_PER_ROUTE):
+        self.samples = samples
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, duration, queries):
+        with self._lock:
+            stats = self._routes.get(route)
+            if stats is None:
+                stats = self._routes[route] = {
+                    'count': 0,
+                    'durations': deque(maxlen=self.samples),
+                    'queries': deque(maxlen=self.samples),
+                }
+            stats['count'] += 1
+            stats['durations'].append(duration)
+            stats['queries'].append(queries)
+
+    def snapshot(self):
+        """[{route, count, p50_ms, p95_ms, max_ms, avg_queries}] по убыванию p95"""
+        with self._lock:
+            routes = {
+                route: (stats['count'], sorted(stats['durations']), list(stats['queries']))
+                for route, stats in self._routes.items()
+            }
+        rows = []
+        for route, (count, durations, queries) in routes.items():
+            rows.append({
+                'route': route,
+                'count': count,
+                'p50_ms': round(percentile(durations, 0.5) * 1000, 1),
+                'p95_ms': round(percentile(durations, 0.95) * 1000, 1),
+                'max_ms': round(durations[-1] * 1000, 1) if durations else 0.0,
+                'avg_queries': round(sum(queries) / len(queries), 1) if queries else 0.0,
+            })
+        rows.sort(key=lambda row: row['p95_ms'], reverse=True)
+        return rows
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+
+route_stats = RouteStats()
+
+
+def server_timing(metrics, total):
+    """Значение заголовка Server-Timing (длительности в миллисекундах)"""
+    return ', '.join([
+        f'total;dur={total * 1000:.1f}',
+        f'db;dur={metrics.sql_time * 1000:.1f};desc="{metrics.queries} queries"',
+        f'tpl;dur={metrics.template_time * 1000:.1f}',
+    ])
@@ -0,0 +1,477 @@
+"""
+Нагрузочный прогон сценария "главная -> каталог -> корзина -> заказ".
+
+Виртуальные пользователи - потоки, каждый со своей cookie-сессией, - ходят
+по настоящему HTTP к запущенному серверу (runserver или gunicorn, см.
+start_server), как браузер: вход через форму логина, AJAX-запросы корзины
+с X-CSRFToken, оформление заказа формой. Время каждого запроса пишется в
+Recorder; отчет - пропускная способность и p50/p95/p99 по эндпоинтам.
+
+После прогона по базе проверяется целостность: остатки не ушли в минус,
+продано не больше, чем было на складе, списание совпадает с позициями
+заказов, суммы заказов равны сумме позиций, итоги корзин сходятся.
+
+Запуск - команда loadtest.
+"""
+import http.cookiejar
+import json
+import os
+import platform
+import random
+import re
+import socket
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.db.models import DecimalField, F, Sum
+
+from .cart_utils import drifted_carts, recalculate_cart_totals
+from .instrumentation import percentile
+from .models import Cart, CartItem, Order, OrderItem, Product
+
+LOADTEST_USER_PREFIX = 'loadtest_'
+LOADTEST_PASSWORD = 'loadtest-password'
+
+REQUEST_TIMEOUT = 30
+SERVER_START_TIMEOUT = 60
+
+# Сколько примеров нарушений сохранять в отчете по каждой проверке
+MAX_VIOLATION_SAMPLES = 10
+
+# Страницы для замера холодных запросов после старта сервера (без входа)
+COLD_PATHS = ['/', '/catalog/', '/search/?q=' + urllib.parse.quote('цемент'), '/cart/', '/login/']
+
+UPDATE_ITEM_RE = re.compile(r'/cart/update/(\d+)/')
+ORDER_URL_RE = re.compile(r'/orders/(\d+)/$')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    """Редиректы не выполняются: 302 - это результат (куда отправил сервер)"""
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class Recorder:
+    """Замеры запросов и счетчики исходов сценария (общие для всех потоков)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.durations = {}
+        self.statuses = {}
+        self.errors = Counter()
+        self.events = Counter()
+
+    def record(self, endpoint, duration, status):
+        with self._lock:
+            self.durations.setdefault(endpoint, []).append(duration)
+            self.statuses.setdefault(endpoint, Counter())[status] += 1
+
+    def error(self, endpoint, message):
+        with self._lock:
+            self.errors[f"{endpoint}: {message}"] += 1
+
+    def event(self, name):
+        with self._lock:
+            self.events[name] += 1
+
+    def report(self, elapsed):
+        """Сводка: по эндпоинтам запросы/с, ошибки, p50/p95/p99 (мс)"""
+        endpoints = {}
+        total = 0
+        for endpoint, durations in sorted(self.durations.items()):
+            durations = sorted(durations)
+            statuses = self.statuses[endpoint]
+            failed = sum(count for status, count in statuses.items() if status is None or status >= 400)
+            total += len(durations)
+            endpoints[endpoint] = {
+                'requests': len(durations),
+                'failed': failed,
+                'rps': round(len(durations) / elapsed, 2) if elapsed else 0.0,
+                'mean_ms': round(sum(durations) / len(durations) * 1000, 1),
+                'p50_ms': round(percentile(durations, 0.5) * 1000, 1),
+                'p95_ms': round(percentile(durations, 0.95) * 1000, 1),
+                'p99_ms': round(percentile(durations, 0.99) * 1000, 1),
+                'max_ms': round(durations[-1] * 1000, 1),
+                'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+            }
+        return {
+            'duration_s': round(elapsed, 2),
+            'requests': total,
+            'throughput_rps': round(total / elapsed, 2) if elapsed else 0.0,
+            'endpoints': endpoints,
+            'events': dict(self.events),
+            'errors': dict(self.errors.most_common(20)),
+        }
+
+
+class VirtualUser:
+    """Один покупатель: своя сессия (cookie) и CSRF-токен, как у браузера"""
+
+    def __init__(self, base_url, username, password, product_ids, recorder, rng, checkout_ratio=0.3):
+        self.base_url = base_url.rstrip('/')
+        self.username = username
+        self.password = password
+        self.product_ids = product_ids
+        self.recorder = recorder
+        self.rng = rng
+        self.checkout_ratio = checkout_ratio
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), NoRedirect)
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, endpoint, path, data=None, ajax=False):
+        """(статус, тело, Location) или None при сетевой ошибке"""
+        headers = {}
+        if data is not None:
+            data = dict(data, csrfmiddlewaretoken=self.csrf_token())
+            data = urllib.parse.urlencode(data).encode()
+            headers['X-CSRFToken'] = self.csrf_token()
+        if ajax:
+            headers['X-Requested-With'] = 'XMLHttpRequest'
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+
+        started = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=REQUEST_TIMEOUT) as response:
+                status, body, location = response.status, response.read(), None
+        except urllib.error.HTTPError as e:
+            status, body, location = e.code, e.read(), e.headers.get('Location')
+        except (urllib.error.URLError, OSError) as e:
+            self.recorder.record(endpoint, time.perf_counter() - started, None)
+            self.recorder.error(endpoint, getattr(e, 'reason', e))
+            return None
+        self.recorder.record(endpoint, time.perf_counter() - started, status)
+        if status >= 500:
+            self.recorder.error(endpoint, f"HTTP {status}")
+        return status, body, location
+
+    def login(self):
+        self.request('login_form', '/login/')
+        result = self.request('login', '/login/', {'username': self.username, 'password': self.password})
+        return result is not None and result[0] == 302
+
+    def run_iteration(self):
+        """Один проход сценария"""
+        self.request('home', '/')
+        self.request('catalog', '/catalog/')
+
+        product_id = self.rng.choice(self.product_ids)
+        result = self.request(
+            'add_to_cart', f'/cart/add/{product_id}/', {'quantity': self.rng.randint(1, 3)}, ajax=True,
+        )
+        if result and result[0] == 200 and not json.loads(result[1]).get('success'):
+            self.recorder.event('add_rejected')
+
+        result = self.request('cart', '/cart/')
+        item_ids = UPDATE_ITEM_RE.findall(result[1].decode('utf-8', 'replace')) if result and result[0] == 200 else []
+        if item_ids:
+            result = self.request(
+                'update_cart_item', f'/cart/update/{self.rng.choice(item_ids)}/',
+                {'quantity': self.rng.randint(1, 3)}, ajax=True,
+            )
+            if result and result[0] == 200 and not json.loads(result[1]).get('success'):
+                self.recorder.event('update_rejected')
+
+        if item_ids and self.rng.random() < self.checkout_ratio:
+            self.checkout()
+
+    def checkout(self):
+        result = self.request('checkout_form', '/cart/checkout/')
+        if not result or result[0] != 200:
+            self.recorder.event('checkout_form_redirected')
+            return
+        result = self.request('checkout', '/cart/checkout/', {
+            'delivery_address': f'Склад нагрузочного теста, {self.username}',
+            'comments': 'loadtest',
+        })
+        if not result:
+            return
+        if result[0] == 302 and ORDER_URL_RE.search(result[2] or ''):
+            self.recorder.event('orders_placed')
+        elif result[0] == 302:
+            # Не хватило остатка: сервер вернул в корзину
+            self.recorder.event('checkout_rejected')
+
+
+def run_load(base_url, users, product_ids, duration=None, iterations=None, ramp_up=0.0,
+             checkout_ratio=0.3, seed=None):
+    """
+    Прогнать сценарий параллельно за всех пользователей [(логин, пароль)].
+    Останавливается по времени (duration, с) или по числу итераций на пользователя.
+    """
+    recorder = Recorder()
+    deadline = None
+    master = random.Random(seed)
+
+    def worker(index, username, password):
+        if ramp_up:
+            time.sleep(ramp_up * index / len(users))
+        user = VirtualUser(
+            base_url, username, password, product_ids, recorder,
+            random.Random(master.random()), checkout_ratio,
+        )
+        if not user.login():
+            recorder.error('login', f"не удалось войти как {username}")
+            return
+        done = 0
+        while (iterations is None or done < iterations) and (deadline is None or time.monotonic() < deadline):
+            user.run_iteration()
+            recorder.event('iterations')
+            done += 1
+
+    started = time.perf_counter()
+    if duration:
+        deadline = time.monotonic() + ramp_up + duration
+    with ThreadPoolExecutor(max_workers=len(users)) as executor:
+        futures = [executor.submit(worker, index, *credentials) for index, credentials in enumerate(users)]
+        for future in futures:
+            future.result()
+    return recorder.report(time.perf_counter() - started)
+
+
+# ==================== ПОДГОТОВКА ДАННЫХ ====================
+
+def ensure_users(count):
+    """Пользователи loadtest_0..N-1 с общим паролем; возвращает [(логин, пароль)]"""
+    User = get_user_model()
+    usernames = [f"{LOADTEST_USER_PREFIX}{index}" for index in range(count)]
+    existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+    # Хеш пароля считается один раз - PBKDF2 на каждого пользователя занял бы секунды
+    password = make_password(LOADTEST_PASSWORD)
+    User.objects.bulk_create([
+        User(username=username, password=password, email=f"{username}@example.com")
+        for username in usernames if username not in existing
+    ])
+    User.objects.filter(username__in=existing).update(password=password, is_active=True)
+    return [(username, LOADTEST_PASSWORD) for username in usernames]
+
+
+def reset_carts(usernames):
+    """Пустые корзины у пользователей прогона - прогоны сравнимы между собой"""
+    carts = Cart.objects.filter(user__username__in=usernames)
+    CartItem.objects.filter(cart__in=carts).delete()
+    recalculate_cart_totals(carts)
+
+
+def pick_products(count, restock=None):
+    """
+    id товаров для прогона (в наличии, по порядку id). restock - выставить
+    им одинаковый остаток: маленький остаток создает конкуренцию за товар.
+    """
+    product_ids = list(Product.objects.filter(stock__gt=0).order_by('id').values_list('id', flat=True)[:count])
+    if restock is not None:
+        Product.objects.filter(pk__in=product_ids).update(stock=restock)
+    return product_ids
+
+
+# ==================== ПРОВЕРКИ ЦЕЛОСТНОСТИ ====================
+
+def stock_snapshot(product_ids):
+    return dict(Product.objects.filter(pk__in=product_ids).values_list('id', 'stock'))
+
+
+def _check(violations):
+    return {'ok': not violations, 'violations': len(violations), 'samples': violations[:MAX_VIOLATION_SAMPLES]}
+
+
+def check_consistency(stock_before, usernames, since_order_id):
+    """
+    Проверки после прогона. stock_before - остатки до прогона, since_order_id -
+    последний id заказа до прогона (учитываются только заказы прогона).
+    """
+    orders = Order.objects.filter(pk__gt=since_order_id, user__username__in=usernames)
+    sold = dict(
+        OrderItem.objects.filter(order__in=orders, product_id__in=stock_before)
+        .values('product_id').annotate(total=Sum('quantity')).values_list('product_id', 'total')
+    )
+    stock_after = stock_snapshot(stock_before)
+
+    # Суммы сравниваются в Decimal: SQLite вычисляет SUM(quantity * price) в float
+    money = DecimalField(max_digits=12, decimal_places=2)
+    lines_totals = dict(
+        OrderItem.objects.filter(order__in=orders).order_by()
+        .values('order_id').annotate(total=Sum(F('quantity') * F('price'), output_field=money))
+        .values_list('order_id', 'total')
+    )
+    wrong_totals = [
+        (number, total, lines_totals.get(pk, Decimal('0')))
+        for pk, number, total in orders.values_list('pk', 'order_number', 'total_amount')
+        if Decimal(lines_totals.get(pk, 0)).quantize(Decimal('0.01')) != total
+    ]
+
+    return {
+        'negative_stock': _check([
+            {'product_id': pk, 'stock': stock} for pk, stock in stock_after.items() if stock < 0
+        ]),
+        'oversold': _check([
+            {'product_id': pk, 'stock_before': stock, 'sold': sold[pk]}
+            for pk, stock in stock_before.items() if sold.get(pk, 0) > stock
+        ]),
+        # Верно, только если во время прогона остатки не меняли другие процессы
+        'stock_matches_orders': _check([
+            {'product_id': pk, 'stock_before': stock, 'sold': sold.get(pk, 0), 'stock_after': stock_after.get(pk)}
+            for pk, stock in stock_before.items() if stock - sold.get(pk, 0) != stock_after.get(pk)
+        ]),
+        'order_totals': _check([
+            {'order': number, 'total_amount': str(total), 'lines_total': str(lines_total)}
+            for number, total, lines_total in wrong_totals
+        ]),
+        'cart_totals': _check([
+            {'cart_id': pk, 'items_count': count, 'subtotal': str(subtotal)}
+            for pk, count, subtotal in drifted_carts().values_list('pk', 'items_count', 'subtotal')[:MAX_VIOLATION_SAMPLES]
+        ]),
+        'orders_in_db': orders.count(),
+    }
+
+
+# ==================== СЕРВЕР ====================
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(base_url, process=None, timeout=SERVER_START_TIMEOUT):
+    """
+    Ждать, пока сервер начнет принимать соединения; возвращает время ожидания (с).
+    Проверяется только TCP-порт: HTTP-запрос прогрел бы приложение до замера холодных запросов.
+    """
+    address = urllib.parse.urlsplit(base_url)
+    started = time.perf_counter()
+    while time.perf_counter() - started < timeout:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Сервер завершился с кодом {process.returncode}")
+        try:
+            with socket.create_connection((address.hostname, address.port or 80), timeout=1):
+                return time.perf_counter() - started
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"Сервер не ответил за {timeout} с")
+
+
+def timed_get(base_url, path):
+    """Время одного GET без cookie (мс) и статус"""
+    started = time.perf_counter()
+    try:
+        with urllib.request.build_opener(NoRedirect).open(base_url + path, timeout=REQUEST_TIMEOUT) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return round((time.perf_counter() - started) * 1000, 1), status
+
+
+def cold_requests(base_url, paths=COLD_PATHS):
+    """Первый (холодный) и второй запрос к каждой странице сразу после старта сервера"""
+    result = {}
+    for path in paths:
+        first, status = timed_get(base_url, path)
+        second, _ = timed_get(base_url, path)
+        result[path] = {'first_ms': first, 'second_ms': second, 'status': status}
+    return result
+
+
+def start_server(kind='runserver', port=None, workers=None, extra_args=(), log_path=None, env=None):
+    """
+    Запустить сервер проекта в отдельном процессе; возвращает (процесс, base_url).
+    kind: 'runserver' (многопоточный dev-сервер) или 'gunicorn' (с gunicorn.conf.py;
+    workers - переопределить число воркеров); log_path - куда писать вывод сервера;
+    env - дополнительные переменные окружения (например, GUNICORN_MODE).
+    """
+    port = port or free_port()
+    base_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if kind == 'gunicorn':
+        command = [
+            sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'lk_clone.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', *(['--workers', str(workers)] if workers else []), *extra_args,
+        ]
+    else:
+        command = [sys.executable, 'manage.py', 'runserver', f'127.0.0.1:{port}', '--noreload', *extra_args]
+    log = open(log_path, 'ab') if log_path else subprocess.DEVNULL
+    try:
+        process = subprocess.Popen(
+            command, cwd=base_dir, stdout=log, stderr=subprocess.STDOUT, env={**os.environ, **(env or {})},
+        )
+    finally:
+        if log_path:
+            log.close()
+    return process, f'http://127.0.0.1:{port}'
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def measure_cold_start(runs=3, paths=COLD_PATHS, **server_options):
+    """
+    Несколько холодных стартов сервера: время до приема соединений и
+    время первого/второго запроса к каждой странице. Медианы - в summary.
+    """
+    results = []
+    for _ in range(runs):
+        process, base_url = start_server(**server_options)
+        try:
+            startup = wait_for_server(base_url, process)
+            results.append({'startup_s': round(startup, 3), 'requests': cold_requests(base_url, paths)})
+        finally:
+            stop_server(process)
+
+    def median(values):
+        values = sorted(values)
+        return values[len(values) // 2]
+
+    return {
+        'runs': results,
+        'summary': {
+            'startup_s': median([run['startup_s'] for run in results]),
+            'first_request_ms': {path: median([run['requests'][path]['first_ms'] for run in results]) for path in paths},
+            'second_request_ms': {path: median([run['requests'][path]['second_ms'] for run in results]) for path in paths},
+        },
+    }
+
+
+def environment():
+    import django
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'cpu_count': os.cpu_count(),
+        'platform': platform.platform(),
+    }
+
+
+def compare_reports(previous, current):
+    """Строки сравнения с прошлым прогоном: rps и p95 по эндпоинтам"""
+    lines = []
+    for endpoint, stats in current['load']['endpoints'].items():
+        before = previous.get('load', {}).get('endpoints', {}).get(endpoint)
+        if not before:
+            continue
+        lines.append(
+            f"{endpoint}: rps {before['rps']} -> {stats['rps']}, "
+            f"p95 {before['p95_ms']} -> {stats['p95_ms']} мс"
+        )
+    return lines
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from accounts.cart_utils import recalculate_cart_totals
+from accounts.catalog_utils import invalidate_product_caches, invalidate_product_fragments
+from accounts.category_tree import invalidate_category_tree
+from accounts.fixture_stream import DEFAULT_BATCH_SIZE, FixtureLoader
+from accounts.models import Cart, Category
+from accounts.order_numbers import sync_counters
+
+
+class Command(BaseCommand):
+    help = 'Потоковая загрузка JSON-дампа (формат dumpdata) пачками bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('fixture', help='Путь к дампу (.json или .json.gz)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Записей в одной пачке (одна транзакция на пачку)')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('-e', '--exclude', action='append', default=[],
+                            help='Пропустить приложение или модель (app_label или app_label.Model)')
+        parser.add_argument('-i', '--ignorenonexistent', action='store_true',
+                            help='Пропускать поля, которых нет в моделях')
+
+    def handle(self, *args, fixture, batch_size, database, exclude, ignorenonexistent, **options):
+        started = time.monotonic()
+        loader = FixtureLoader(
+            using=database,
+            batch_size=batch_size,
+            exclude=exclude,
+            ignorenonexistent=ignorenonexistent,
+            log=self.stdout.write if options['verbosity'] > 1 else None,
+        )
+        try:
+            counts = loader.load(fixture)
+        except (OSError, ValueError, LookupError) as e:
+            raise CommandError(f"Не удалось загрузить {fixture}: {e}")
+
+        self.refresh_derived_data(counts)
+
+        total = sum(counts.values())
+        elapsed = time.monotonic() - started
+        for label, count in counts.items():
+            self.stdout.write(f"   {label}: {count}")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Загружено {total} записей за {elapsed:.1f} с ({total / max(elapsed, 0.001):.0f} записей/с)"
+        ))
+
+    def refresh_derived_data(self, counts):
+        """Данные, которые обычно поддерживают save() и сигналы, а bulk_create их обходит"""
+        if 'accounts.Category' in counts:
+            Category.rebuild_paths()
+            invalidate_category_tree()
+        if 'accounts.Cart' in counts or 'accounts.CartItem' in counts:
+            recalculate_cart_totals(Cart.objects.all())
+        if 'accounts.Order' in counts:
+            sync_counters()
+            call_command('rebuild_order_stats', verbosity=0)
+        if 'accounts.Product' in counts:
+            invalidate_product_caches()
+            invalidate_product_fragments()
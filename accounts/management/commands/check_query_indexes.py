@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.hot_queries import LARGE_TABLE_ROWS, check_hot_queries
+
+
+class Command(BaseCommand):
+    help = (
+        'Открывает горячие страницы (accounts/hot_queries.py), проверяет планы выполненных ими '
+        'запросов и сообщает о чтении больших таблиц или индексов целиком'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Печатать план и SQL каждого запроса')
+        parser.add_argument('--min-rows', type=int, default=LARGE_TABLE_ROWS,
+                            help='С какого числа строк таблица считается большой')
+
+    def handle(self, *args, verbose_plans, min_rows, **options):
+        try:
+            results = check_hot_queries(min_rows=min_rows)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        problems = []
+        for query in results:
+            views = ', '.join(query.views)
+            if query.scans:
+                problems.append(query)
+                scans = ', '.join(f"{table} ({how}, {rows} строк)" for table, how, rows in query.scans)
+                self.stdout.write(self.style.ERROR(f"❌ [{views}] полное сканирование: {scans}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"✅ [{views}] {query.sql[:100]}"))
+            if verbose_plans or query.scans:
+                self.stdout.write(f"{query.sql}\n{query.plan}\n")
+
+        if problems:
+            raise CommandError(f"Запросов без подходящего индекса: {len(problems)} из {len(results)}")
+        self.stdout.write(self.style.SUCCESS(f"✅ Проверено запросов: {len(results)}"))
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.fixture_stream import PkRemapper, is_excluded, iter_fixture, write_fixture
+
+# Таблицы, которые Django создает сам - при переносе дампа они только мешают
+DEFAULT_EXCLUDE = ['contenttypes', 'sessions', 'admin.logentry']
+
+
+class Command(BaseCommand):
+    help = 'Потоковая фильтрация JSON-дампа: исключение моделей и сдвиг первичных ключей, запись по одной'
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help='Исходный дамп (.json или .json.gz)')
+        parser.add_argument('output', help='Куда записать результат (.json или .json.gz)')
+        parser.add_argument('-e', '--exclude', action='append', default=[],
+                            help='Дополнительно исключить приложение или модель (app_label или app_label.Model)')
+        parser.add_argument('--keep-defaults', action='store_true',
+                            help=f"Не исключать {', '.join(DEFAULT_EXCLUDE)}")
+        parser.add_argument('--remap-pks', action='append', default=[], metavar='app_label.Model=OFFSET',
+                            help='Сдвинуть pk модели и все ссылки на нее на OFFSET (можно повторять)')
+        parser.add_argument('--encoding', default='auto',
+                            help="Кодировка исходного дампа; auto - UTF-8, а если дамп в ней не читается, cp1251")
+        parser.add_argument('--indent', type=int, default=None, help='Отступ в выходном JSON')
+
+    def handle(self, *args, input, output, exclude, keep_defaults, remap_pks, encoding, indent, **options):
+        exclude = {label.lower() for label in exclude + ([] if keep_defaults else DEFAULT_EXCLUDE)}
+        try:
+            remapper = PkRemapper(self.parse_offsets(remap_pks)) if remap_pks else None
+        except LookupError as e:
+            raise CommandError(f"Неизвестная модель в --remap-pks: {e}")
+        stats = {'read': 0, 'dropped': 0}
+
+        def records():
+            for record in iter_fixture(input, encoding=encoding):
+                stats['read'] += 1
+                if is_excluded(record['model'], exclude):
+                    stats['dropped'] += 1
+                    continue
+                yield remapper.remap(record) if remapper else record
+
+        try:
+            written = write_fixture(output, records(), indent=indent)
+        except (OSError, ValueError, LookupError) as e:
+            raise CommandError(f"Не удалось обработать {input}: {e}")
+
+        self.stdout.write(f"Очищено: {stats['dropped']} записей")
+        self.stdout.write(self.style.SUCCESS(f"Сохранено: {written} записей из {stats['read']}"))
+
+    def parse_offsets(self, values):
+        offsets = {}
+        for value in values:
+            label, _, offset = value.partition('=')
+            try:
+                offsets[label] = int(offset)
+            except ValueError:
+                raise CommandError(f"Неверный формат --remap-pks: {value} (нужно app_label.Model=OFFSET)")
+        return offsets
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.price_import import DEFAULT_BATCH_SIZE, PriceImportError, PriceListImporter, read_price_list
+
+
+class Command(BaseCommand):
+    help = 'Импорт прайс-листа (CSV/XLSX) по артикулу: новые товары создаются, измененные обновляются пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл прайс-листа (.csv или .xlsx)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Строк в одной пачке (одна транзакция на пачку)')
+        parser.add_argument('--sheet', help='Лист XLSX (по умолчанию первый)')
+        parser.add_argument('--encoding', default='auto',
+                            help='Кодировка CSV (по умолчанию определяется: UTF-8 или cp1251)')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только посчитать изменения, ничего не записывая')
+
+    def handle(self, *args, path, batch_size, sheet, encoding, dry_run, **options):
+        started = time.monotonic()
+        importer = PriceListImporter(batch_size=batch_size, dry_run=dry_run)
+        try:
+            with open(path, 'rb') as fileobj:
+                result = importer.run(read_price_list(fileobj, path, sheet=sheet, encoding=encoding))
+        except (OSError, PriceImportError) as e:
+            raise CommandError(f"Не удалось импортировать {path}: {e}")
+
+        for error in result.errors[:50]:
+            self.stdout.write(self.style.WARNING(f"⚠️ {error}"))
+        if len(result.errors) > 50:
+            self.stdout.write(self.style.WARNING(f"... и еще {len(result.errors) - 50} ошибок"))
+
+        prefix = 'Пробный запуск' if dry_run else 'Импорт завершен'
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {prefix} за {time.monotonic() - started:.1f} с: {result.summary()}"
+        ))
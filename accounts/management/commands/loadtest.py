@@ -0,0 +1,158 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from accounts import loadtest
+from accounts.models import Order
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон: виртуальные пользователи параллельно проходят главная -> каталог -> '
+        'корзина -> заказ; отчет p50/p95/p99 по эндпоинтам и проверка целостности остатков и сумм в JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='Адрес уже запущенного сервера (иначе сервер запускается сам)')
+        parser.add_argument('--server', choices=['runserver', 'gunicorn'], default='runserver',
+                            help='Какой сервер запускать, если --url не задан')
+        parser.add_argument('--workers', type=int, help='Воркеры gunicorn (по умолчанию - из gunicorn.conf.py)')
+        parser.add_argument('--gunicorn-mode', choices=['sync', 'gthread'], help='GUNICORN_MODE для gunicorn.conf.py')
+        parser.add_argument('--startup-runs', type=int,
+                            help='Только замер холодного старта: N запусков сервера, без нагрузки')
+        parser.add_argument('--server-log', help='Файл для вывода запущенного сервера (трейсбеки ошибок 500)')
+        parser.add_argument('--users', type=int, default=20, help='Виртуальных пользователей (потоков)')
+        parser.add_argument('--duration', type=float, default=30, help='Длительность прогона, с')
+        parser.add_argument('--iterations', type=int,
+                            help='Итераций сценария на пользователя (вместо --duration)')
+        parser.add_argument('--ramp-up', type=float, default=2, help='За сколько секунд подключаются все пользователи')
+        parser.add_argument('--products', type=int, default=50, help='Сколько товаров участвует в прогоне')
+        parser.add_argument('--restock', type=int,
+                            help='Выставить этим товарам остаток (маленький - проверка на перепродажу)')
+        parser.add_argument('--checkout-ratio', type=float, default=0.3,
+                            help='Доля итераций, заканчивающихся оформлением заказа')
+        parser.add_argument('--seed', type=int, default=1, help='Seed случайных действий пользователей')
+        parser.add_argument('--output', help='Файл отчета JSON (по умолчанию benchmarks/loadtest-<дата>.json)')
+        parser.add_argument('--compare', help='Отчет прошлого прогона для сравнения')
+
+    def server_options(self, options):
+        return {
+            'kind': options['server'],
+            'workers': options['workers'],
+            'log_path': options['server_log'],
+            'env': {'GUNICORN_MODE': options['gunicorn_mode']} if options['gunicorn_mode'] else None,
+        }
+
+    def handle(self, *args, **options):
+        if options['startup_runs']:
+            return self.handle_startup(options)
+
+        users = loadtest.ensure_users(options['users'])
+        usernames = [username for username, _ in users]
+        loadtest.reset_carts(usernames)
+        product_ids = loadtest.pick_products(options['products'], options['restock'])
+        if not product_ids:
+            raise CommandError('Нет товаров в наличии - сначала загрузите или сгенерируйте данные')
+
+        stock_before = loadtest.stock_snapshot(product_ids)
+        since_order_id = Order.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+        process = None
+        base_url = options['url']
+        if not base_url:
+            process, base_url = loadtest.start_server(**self.server_options(options))
+        try:
+            startup = loadtest.wait_for_server(base_url, process)
+            self.stdout.write(f"🚀 Сервер {base_url} принимает соединения через {startup:.2f} с")
+            cold = loadtest.cold_requests(base_url) if process is not None else None
+            self.stdout.write(
+                f"👥 {len(users)} пользователей, {len(product_ids)} товаров, "
+                + (f"{options['iterations']} итераций" if options['iterations'] else f"{options['duration']:g} с")
+            )
+            report = loadtest.run_load(
+                base_url, users, product_ids,
+                duration=None if options['iterations'] else options['duration'],
+                iterations=options['iterations'],
+                ramp_up=options['ramp_up'],
+                checkout_ratio=options['checkout_ratio'],
+                seed=options['seed'],
+            )
+        finally:
+            if process is not None:
+                loadtest.stop_server(process)
+
+        consistency = loadtest.check_consistency(stock_before, usernames, since_order_id)
+        result = {
+            'started_at': timezone.now().isoformat(),
+            'config': {
+                key: options[key] for key in (
+                    'server', 'workers', 'gunicorn_mode', 'users', 'duration', 'iterations', 'ramp_up',
+                    'products', 'restock', 'checkout_ratio', 'seed',
+                )
+            },
+            'environment': loadtest.environment(),
+            'cold_start': {'startup_s': round(startup, 3), 'requests': cold} if process is not None else None,
+            'load': report,
+            'consistency': consistency,
+        }
+
+        self.print_report(report, consistency)
+        self.save(result, options['output'], 'loadtest')
+
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as f:
+                previous = json.load(f)
+            self.stdout.write(f"📊 Сравнение с {options['compare']}:")
+            for line in loadtest.compare_reports(previous, result):
+                self.stdout.write(f"  {line}")
+
+        failed = [name for name, check in consistency.items() if isinstance(check, dict) and not check['ok']]
+        if failed:
+            raise CommandError(f"Нарушена целостность данных: {', '.join(failed)}")
+
+    def handle_startup(self, options):
+        """Холодный старт: время до приема соединений и первые запросы к страницам"""
+        result = loadtest.measure_cold_start(options['startup_runs'], **self.server_options(options))
+        summary = result['summary']
+        self.stdout.write(f"🚀 Старт сервера (медиана из {options['startup_runs']}): {summary['startup_s']} с")
+        self.stdout.write(f"{'страница':<40}{'первый':>10}{'второй':>10}")
+        for path, first in summary['first_request_ms'].items():
+            self.stdout.write(f"{path:<40}{first:>10}{summary['second_request_ms'][path]:>10}")
+        self.save({
+            'started_at': timezone.now().isoformat(),
+            'config': {key: options[key] for key in ('server', 'workers', 'gunicorn_mode', 'startup_runs')},
+            'environment': loadtest.environment(),
+            'startup': result,
+        }, options['output'], 'startup')
+
+    def save(self, result, output, prefix):
+        output = output or os.path.join('benchmarks', f"{prefix}-{timezone.localtime():%Y%m%d-%H%M%S}.json")
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"💾 Отчет сохранен: {output}"))
+
+    def print_report(self, report, consistency):
+        self.stdout.write(
+            f"\n⏱  {report['duration_s']} с, {report['requests']} запросов, {report['throughput_rps']} запр/с"
+        )
+        self.stdout.write(f"{'эндпоинт':<18}{'запр.':>8}{'ошибок':>8}{'запр/с':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+        for endpoint, stats in report['endpoints'].items():
+            self.stdout.write(
+                f"{endpoint:<18}{stats['requests']:>8}{stats['failed']:>8}{stats['rps']:>9}"
+                f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}"
+            )
+        if report['events']:
+            self.stdout.write('События: ' + ', '.join(f"{name}={count}" for name, count in report['events'].items()))
+        for error, count in report['errors'].items():
+            self.stdout.write(self.style.WARNING(f"⚠️ {error} (x{count})"))
+
+        for name, check in consistency.items():
+            if not isinstance(check, dict):
+                continue
+            if check['ok']:
+                self.stdout.write(self.style.SUCCESS(f"✅ {name}"))
+            else:
+                self.stdout.write(self.style.ERROR(f"❌ {name}: {check['violations']} нарушений {check['samples']}"))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from accounts.models import CustomUser
+from accounts.order_stats import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает сводки заказов пользователей (UserOrderStats) по таблице заказов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько пользователей пересобирать за один проход')
+        parser.add_argument('--user', type=int, action='append', dest='user_ids',
+                            help='id пользователя (можно повторять); по умолчанию - все')
+
+    def handle(self, *args, batch_size, user_ids, **options):
+        if user_ids:
+            rebuilt = rebuild_user_stats(user_ids)
+        else:
+            users = CustomUser.objects.values_list('pk', flat=True).order_by('pk')
+            rebuilt = 0
+            last_pk = 0
+            while True:
+                batch = list(users.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1]
+                rebuilt += rebuild_user_stats(batch)
+
+        if options['verbosity'] > 0:
+            self.stdout.write(self.style.SUCCESS(f"Пересобрано сводок: {rebuilt}"))
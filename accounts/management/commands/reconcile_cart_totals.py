@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from accounts.cart_utils import drifted_carts, recalculate_cart_totals
+from accounts.models import Cart
+
+
+class Command(BaseCommand):
+    help = 'Находит и исправляет расхождения сохраненных итогов корзин (items_count, subtotal) с позициями'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько корзин исправлять одним UPDATE')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать количество расхождений')
+
+    def handle(self, *args, batch_size, dry_run, **options):
+        drifted = (
+            drifted_carts()
+            .values_list('pk', flat=True)
+            .order_by('pk')
+        )
+
+        fixed = 0
+        last_pk = 0
+        while True:
+            batch = list(drifted.filter(pk__gt=last_pk)[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1]
+            if not dry_run:
+                fixed += recalculate_cart_totals(Cart.objects.filter(pk__in=batch))
+            else:
+                fixed += len(batch)
+
+        action = 'Найдено' if dry_run else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(f"{action} корзин с расхождениями: {fixed}"))
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from accounts.models import CartItem
+
+
+class Command(BaseCommand):
+    help = 'Снимает истекшие резервы остатков с позиций корзин (пачками)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Сколько позиций обновлять одним UPDATE')
+
+    def handle(self, *args, batch_size, **options):
+        now = timezone.now()
+        expired = (
+            CartItem.objects
+            .filter(reserved_until__lte=now)
+            .values_list('pk', flat=True)
+            .order_by('pk')
+        )
+
+        released = 0
+        while True:
+            batch = list(expired[:batch_size])
+            if not batch:
+                break
+            released += CartItem.objects.filter(pk__in=batch).update(reserved_until=None)
+
+        self.stdout.write(self.style.SUCCESS(f"Снято истекших резервов: {released}"))
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.static_assets import DEFAULT_BUDGET_KB, verify
+
+
+class Command(BaseCommand):
+    help = (
+        'Проверяет статику после collectstatic: файлы из {% static %} в шаблонах есть в манифесте '
+        'с хэшем в имени, сжаты (.gz/.br) и укладываются в бюджет, JS без синтаксических ошибок, '
+        'в шаблонах нет встроенных <script>'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-kb', type=int, default=DEFAULT_BUDGET_KB,
+                            help='Бюджет на один файл в gzip, КБ')
+
+    def handle(self, *args, **options):
+        reports, problems = verify(budget_kb=options['max_kb'])
+
+        for report in reports:
+            sizes = f"{report.size / 1024:.1f} КБ"
+            if report.gzip_size is not None:
+                sizes += f", gzip {report.gzip_size / 1024:.1f} КБ"
+            if report.brotli_size is not None:
+                sizes += f", br {report.brotli_size / 1024:.1f} КБ"
+            mark = '❌' if report.problems else '✅'
+            self.stdout.write(f"{mark} {report.name} -> {report.hashed_name} ({sizes})")
+
+        if problems:
+            for problem in problems:
+                self.stderr.write(f"  • {problem}")
+            raise CommandError(f"Статика не прошла проверку: {len(problems)} проблем(ы)")
+        self.stdout.write(self.style.SUCCESS(f"✅ Статика в порядке: {len(reports)} файлов"))
@@ -1,28 +1,104 @@
 """
-Простые middleware для отладки
+Middleware приложения: замеры производительности и корзина запроса
 """
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from .instrumentation import finish_request, route_stats, server_timing, start_request
+
+logger = logging.getLogger('accounts.performance')
+
 
 class SimpleMiddleware:
-    """Простой middleware для тестирования"""
+    """Базовый middleware: хуки before() и after() вокруг обработки запроса"""
     
     def __init__(self, get_response):
         self.get_response = get_response
     
     def __call__(self, request):
-        # Код до обработки запроса
+        self.before(request)
         response = self.get_response(request)
-        # Код после обработки запроса
+        return self.after(request, response)
+    
+    def before(self, request):
+        """Код до обработки запроса"""
+    
+    def after(self, request, response):
+        """Код после обработки запроса"""
         return response
 
-# ↓↓↓ ОТДЕЛЬНЫЙ класс (не внутри SimpleMiddleware)
-class CustomMiddleware:
-    """Кастомный middleware"""
+
+class CustomMiddleware(SimpleMiddleware):
+    """
+    Замеры запроса: полное время, число и время SQL-запросов, время шаблонов.
+    Пишет заголовок Server-Timing, строку в лог accounts.performance
+    (DEBUG, медленный запрос - WARNING) и p50/p95 по маршрутам (instrumentation.route_stats)
+    """
+    
+    def __call__(self, request):
+        metrics, token = start_request()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics))
+                response = self.get_response(request)
+        finally:
+            finish_request(token)
+        
+        total = metrics.elapsed
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match and match.route else (match.view_name if match else 'unresolved')
+        route_stats.record(route, total, metrics.queries)
+        
+        if getattr(settings, 'PERF_SERVER_TIMING', True):
+            response['Server-Timing'] = server_timing(metrics, total)
+        
+        slow = total * 1000 >= getattr(settings, 'PERF_SLOW_REQUEST_MS', 500)
+        logger.log(
+            logging.WARNING if slow else logging.DEBUG,
+            'method=%s path=%s route=%s status=%s duration_ms=%.1f queries=%d sql_ms=%.1f template_ms=%.1f',
+            request.method, request.path, route, response.status_code,
+            total * 1000, metrics.queries, metrics.sql_time * 1000, metrics.template_time * 1000,
+            extra={
+                'route': route,
+                'status_code': response.status_code,
+                'duration_ms': round(total * 1000, 1),
+                'queries': metrics.queries,
+                'sql_ms': round(metrics.sql_time * 1000, 1),
+                'template_ms': round(metrics.template_time * 1000, 1),
+            },
+        )
+        return response
+
+
+class CartMiddleware:
+    """
+    Ленивая корзина запроса request.cart (создается при первом обращении, один раз за запрос)
+    и запись в ответ подписанной cookie гостевой корзины (GUEST_CART_STORE = 'cookie')
+    """
     
     def __init__(self, get_response):
         self.get_response = get_response
     
     def __call__(self, request):
-        # Код до обработки запроса
+        from django.utils.functional import SimpleLazyObject
+        from .cart_utils import get_or_create_cart
+        
+        request.cart = SimpleLazyObject(lambda: get_or_create_cart(request))
         response = self.get_response(request)
-        # Код после обработки запроса
-        return response
\ No newline at end of file
+        
+        if hasattr(request, '_guest_cart_cookie'):
+            from .guest_cart import COOKIE_MAX_AGE, COOKIE_NAME, COOKIE_SALT
+            
+            value = request._guest_cart_cookie
+            if value:
+                response.set_signed_cookie(
+                    COOKIE_NAME, value, salt=COOKIE_SALT,
+                    max_age=COOKIE_MAX_AGE, httponly=True, samesite='Lax',
+                )
+            else:
+                response.delete_cookie(COOKIE_NAME, samesite='Lax')
+        return response
@@ -0,0 +1,95 @@
+from django.db import migrations
+from django.db.utils import OperationalError
+
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE accounts_product ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(sku, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(name, '')), 'A') ||
+        setweight(to_tsvector('russian', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX accounts_product_search_gin ON accounts_product USING GIN (search_vector)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS accounts_product_search_gin",
+    "ALTER TABLE accounts_product DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE accounts_product_fts USING fts5(
+        name, sku, description,
+        content='accounts_product', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER accounts_product_fts_ai AFTER INSERT ON accounts_product BEGIN
+        INSERT INTO accounts_product_fts(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER accounts_product_fts_ad AFTER DELETE ON accounts_product BEGIN
+        INSERT INTO accounts_product_fts(accounts_product_fts, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER accounts_product_fts_au AFTER UPDATE OF name, sku, description ON accounts_product BEGIN
+        INSERT INTO accounts_product_fts(accounts_product_fts, rowid, name, sku, description)
+        VALUES ('delete', old.id, old.name, old.sku, old.description);
+        INSERT INTO accounts_product_fts(rowid, name, sku, description)
+        VALUES (new.id, new.name, new.sku, new.description);
+    END
+    """,
+    "INSERT INTO accounts_product_fts(accounts_product_fts) VALUES ('rebuild')",
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER IF EXISTS accounts_product_fts_ai",
+    "DROP TRIGGER IF EXISTS accounts_product_fts_ad",
+    "DROP TRIGGER IF EXISTS accounts_product_fts_au",
+    "DROP TABLE IF EXISTS accounts_product_fts",
+]
+
+
+def _execute(schema_editor, statements):
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def create_search_index(apps, schema_editor):
+    """Поисковый индекс: tsvector + GIN на PostgreSQL, FTS5 на SQLite"""
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _execute(schema_editor, POSTGRES_FORWARD)
+    elif vendor == 'sqlite':
+        try:
+            _execute(schema_editor, SQLITE_FORWARD)
+        except OperationalError:
+            # SQLite собран без FTS5 - поиск работает через icontains
+            _execute(schema_editor, SQLITE_REVERSE)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        _execute(schema_editor, POSTGRES_REVERSE)
+    elif vendor == 'sqlite':
+        _execute(schema_editor, SQLITE_REVERSE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_alter_order_options'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
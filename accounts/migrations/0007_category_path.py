@@ -0,0 +1,44 @@
+from django.db import migrations, models
+
+
+PATH_SEGMENT_WIDTH = 10
+
+
+def fill_category_paths(apps, schema_editor):
+    """Заполняем пути существующих категорий обходом дерева от корней"""
+    Category = apps.get_model('accounts', 'Category')
+    children = {}
+    for category in Category.objects.only('id', 'parent_id'):
+        children.setdefault(category.parent_id, []).append(category)
+
+    updated = []
+    stack = [(category, '') for category in children.get(None, [])]
+    while stack:
+        category, parent_path = stack.pop()
+        category.path = parent_path + f"{category.pk:0{PATH_SEGMENT_WIDTH}d}/"
+        category.depth = category.path.count('/') - 1
+        updated.append(category)
+        stack.extend((child, category.path) for child in children.get(category.pk, []))
+
+    Category.objects.bulk_update(updated, ['path', 'depth'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False, verbose_name='Уровень вложенности'),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(db_index=True, default='', editable=False, max_length=255, verbose_name='Путь в дереве'),
+        ),
+        migrations.RunPython(fill_category_paths, migrations.RunPython.noop),
+    ]
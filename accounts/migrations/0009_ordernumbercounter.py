@@ -0,0 +1,48 @@
+import datetime
+import re
+
+from django.db import migrations, models
+
+
+ORDER_NUMBER_RE = re.compile(r'^ORD-(\d{6})-(\d+)$')
+
+
+def seed_counters(apps, schema_editor):
+    """Счетчики начинаются после максимальных уже выданных номеров каждого дня"""
+    Order = apps.get_model('accounts', 'Order')
+    OrderNumberCounter = apps.get_model('accounts', 'OrderNumberCounter')
+
+    last_values = {}
+    for order_number in Order.objects.values_list('order_number', flat=True).iterator():
+        match = ORDER_NUMBER_RE.match(order_number)
+        if not match:
+            continue
+        day = datetime.datetime.strptime(match.group(1), '%y%m%d').date()
+        last_values[day] = max(last_values.get(day, 0), int(match.group(2)))
+
+    OrderNumberCounter.objects.bulk_create(
+        [OrderNumberCounter(day=day, last_value=value) for day, value in last_values.items()],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_cart_totals'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderNumberCounter',
+            fields=[
+                ('day', models.DateField(primary_key=True, serialize=False, verbose_name='День')),
+                ('last_value', models.PositiveIntegerField(default=0, verbose_name='Последний выданный номер')),
+            ],
+            options={
+                'verbose_name': 'Счетчик номеров заказов',
+                'verbose_name_plural': 'Счетчики номеров заказов',
+            },
+        ),
+        migrations.RunPython(seed_counters, migrations.RunPython.noop),
+    ]
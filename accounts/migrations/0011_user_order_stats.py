@@ -0,0 +1,66 @@
+# Generated by Django 6.0 on 2026-10-17 14:27
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Max, Q, Sum
+
+
+def backfill_stats(apps, schema_editor):
+    """Сводки для всех пользователей, у которых уже есть заказы"""
+    Order = apps.get_model('accounts', 'Order')
+    UserOrderStats = apps.get_model('accounts', 'UserOrderStats')
+
+    rows = (
+        Order.objects
+        .order_by()
+        .values('user')
+        .annotate(
+            total_orders=Count('id'),
+            total_spent=Sum('total_amount'),
+            active_orders=Count('id', filter=~Q(status__in=['delivered', 'cancelled'])),
+            last_order_at=Max('created_at'),
+        )
+    )
+    UserOrderStats.objects.bulk_create(
+        [
+            UserOrderStats(
+                user_id=row['user'],
+                total_orders=row['total_orders'],
+                total_spent=row['total_spent'] or 0,
+                active_orders=row['active_orders'],
+                last_order_at=row['last_order_at'],
+            )
+            for row in rows
+        ],
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_cartitem_reserved_until'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserOrderStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='order_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('total_orders', models.PositiveIntegerField(default=0, verbose_name='Всего заказов')),
+                ('total_spent', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Сумма заказов')),
+                ('active_orders', models.PositiveIntegerField(default=0, verbose_name='Активных заказов')),
+                ('last_order_at', models.DateTimeField(blank=True, null=True, verbose_name='Последний заказ')),
+            ],
+            options={
+                'verbose_name': 'Сводка заказов пользователя',
+                'verbose_name_plural': 'Сводки заказов пользователей',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+        ),
+        migrations.RunPython(backfill_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,86 @@
+# Generated by Django 6.0 on 2026-10-17 14:28
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count, DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    """
+    Перед уникальными ограничениями сливаем дубли корзин: позиции переносятся
+    в самую раннюю корзину пользователя (сессии), остальные удаляются
+    """
+    Cart = apps.get_model('accounts', 'Cart')
+    CartItem = apps.get_model('accounts', 'CartItem')
+
+    keepers = []
+    for field in ('user', 'session_key'):
+        duplicated = (
+            Cart.objects
+            .filter(**{f'{field}__isnull': False})
+            .order_by()
+            .values(field)
+            .annotate(carts=Count('id'))
+            .filter(carts__gt=1)
+            .values_list(field, flat=True)
+        )
+        for value in list(duplicated):
+            cart_ids = list(Cart.objects.filter(**{field: value}).order_by('pk').values_list('pk', flat=True))
+            keeper_id, duplicate_ids = cart_ids[0], cart_ids[1:]
+            kept = {item.product_id: item for item in CartItem.objects.filter(cart_id=keeper_id)}
+            for item in CartItem.objects.filter(cart_id__in=duplicate_ids).order_by('pk'):
+                if item.product_id in kept:
+                    kept[item.product_id].quantity += item.quantity
+                    kept[item.product_id].save(update_fields=['quantity'])
+                    item.delete()
+                else:
+                    item.cart_id = keeper_id
+                    item.save(update_fields=['cart'])
+                    kept[item.product_id] = item
+            Cart.objects.filter(pk__in=duplicate_ids).delete()
+            keepers.append(keeper_id)
+
+    if keepers:
+        money = DecimalField(max_digits=12, decimal_places=2)
+        lines = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+        Cart.objects.filter(pk__in=keepers).update(
+            items_count=Coalesce(Subquery(lines.annotate(total=Sum('quantity')).values('total')), 0),
+            subtotal=Coalesce(
+                Subquery(lines.annotate(total=Sum(F('quantity') * F('product__price'), output_field=money)).values('total')),
+                Value(Decimal('0')),
+                output_field=money,
+            ),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_order_user_status_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['category', 'name', 'id'], name='product_in_stock_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('is_popular', True), ('stock__gt', 0)), fields=['id'], name='product_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('stock__gt', 0)), fields=['-created_at'], name='product_new_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('user__isnull', False)), fields=('user',), name='cart_unique_user'),
+        ),
+        migrations.AddConstraint(
+            model_name='cart',
+            constraint=models.UniqueConstraint(condition=models.Q(('session_key__isnull', False)), fields=('session_key',), name='cart_unique_session'),
+        ),
+    ]
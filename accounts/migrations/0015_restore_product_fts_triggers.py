@@ -0,0 +1,34 @@
+from importlib import import_module
+
+from django.db import migrations
+
+search_index = import_module('accounts.migrations.0006_product_search_index')
+
+
+def restore_fts_triggers(apps, schema_editor):
+    """
+    На SQLite AddField в 0014 пересоздает таблицу accounts_product, и вместе со
+    старой таблицей удаляются триггеры FTS5 из 0006: новые и измененные товары
+    перестают попадать в поиск. Создаем триггеры заново и перестраиваем индекс.
+    То же нужно после любой миграции, пересоздающей accounts_product на SQLite.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'accounts_product_fts'")
+        if cursor.fetchone() is None:
+            # SQLite без FTS5 - поиск работает через icontains
+            return
+    for statement in search_index.SQLITE_REVERSE[:3] + search_index.SQLITE_FORWARD[1:]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0014_product_version'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_fts_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+from django.db import migrations, transaction
+from django.db.utils import DatabaseError
+
+# Индекс под поиск части артикула в админке (search.filter_products):
+# Django пишет sku__icontains как UPPER("sku"::text) LIKE UPPER('%...%'),
+# такой LIKE использует GIN-индекс по триграммам того же выражения
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS accounts_product_sku_trgm ON accounts_product "
+    "USING GIN ((UPPER(sku::text)) gin_trgm_ops)",
+]
+
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS accounts_product_sku_trgm",
+]
+
+
+def create_sku_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=schema_editor.connection.alias):
+            for statement in POSTGRES_FORWARD:
+                schema_editor.execute(statement)
+    except DatabaseError:
+        # Нет прав на CREATE EXTENSION - поиск по части артикула работает без индекса
+        pass
+
+
+def drop_sku_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        for statement in POSTGRES_REVERSE:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0016_order_user_status_created_idx'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_sku_index, drop_sku_index),
+    ]
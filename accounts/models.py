@@ -25,12 +25,97 @@ class CustomUser(AbstractUser):
 
 # 2. Категория товаров
 class Category(models.Model):
+    # Ширина сегмента материализованного пути: id с ведущими нулями + '/'
+    PATH_SEGMENT_WIDTH = 10
+    
     name = models.CharField('Название категории', max_length=200)
     parent = models.ForeignKey('self', on_delete=models.CASCADE, null=True, blank=True, verbose_name='Родительская категория')
+    path = models.CharField('Путь в дереве', max_length=255, db_index=True, editable=False, default='')
+    depth = models.PositiveSmallIntegerField('Уровень вложенности', default=0, editable=False)
     
     def __str__(self):
         return self.name
     
+    @classmethod
+    def path_segment(cls, pk):
+        return f"{pk:0{cls.PATH_SEGMENT_WIDTH}d}/"
+    
+    def clean(self):
+        """Нельзя переместить категорию внутрь самой себя"""
+        from django.core.exceptions import ValidationError
+        if self.path and self.parent_id and self.parent.path.startswith(self.path):
+            raise ValidationError({'parent': 'Категорию нельзя вложить в саму себя или в свою подкатегорию'})
+    
+    def save(self, *args, **kwargs):
+        """Сохранение с пересчетом материализованного пути (и путей всего поддерева при перемещении)"""
+        from django.db import transaction
+        from django.db.models import F, Value
+        from django.db.models.functions import Concat, Substr
+        
+        with transaction.atomic():
+            # Актуальные пути берем из БД: объекты в памяти могли устареть после перемещений
+            paths = dict(
+                Category.objects.filter(pk__in=[pk for pk in (self.pk, self.parent_id) if pk])
+                .values_list('pk', 'path')
+            )
+            old_path = paths.get(self.pk, '')
+            parent_path = paths.get(self.parent_id, '')
+            if old_path and parent_path.startswith(old_path):
+                raise ValueError('Категорию нельзя вложить в саму себя или в свою подкатегорию')
+            
+            if self.pk:
+                self.path = parent_path + self.path_segment(self.pk)
+                self.depth = self.path.count('/') - 1
+                super().save(*args, **kwargs)
+            else:
+                # id новой категории известен только после INSERT
+                super().save(*args, **kwargs)
+                self.path = parent_path + self.path_segment(self.pk)
+                self.depth = self.path.count('/') - 1
+                Category.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+            
+            if old_path and old_path != self.path:
+                # Перемещение: переписываем префикс пути у всех потомков одним UPDATE
+                old_depth = old_path.count('/') - 1
+                Category.objects.filter(path__startswith=old_path).exclude(pk=self.pk).update(
+                    path=Concat(Value(self.path), Substr('path', len(old_path) + 1)),
+                    depth=F('depth') + (self.depth - old_depth),
+                )
+    
+    @classmethod
+    def rebuild_paths(cls):
+        """Пересчитать пути всех категорий обходом от корней (после массовой загрузки без save)"""
+        children = {}
+        for category in cls.objects.only('id', 'parent_id'):
+            children.setdefault(category.parent_id, []).append(category)
+        
+        updated = []
+        stack = [(category, '') for category in children.get(None, [])]
+        while stack:
+            category, parent_path = stack.pop()
+            category.path = parent_path + cls.path_segment(category.pk)
+            category.depth = category.path.count('/') - 1
+            updated.append(category)
+            stack.extend((child, category.path) for child in children.get(category.pk, []))
+        
+        cls.objects.bulk_update(updated, ['path', 'depth'], batch_size=500)
+        return len(updated)
+    
+    def ancestor_ids(self):
+        """id предков от корня, берутся прямо из пути без запросов"""
+        return [int(segment) for segment in self.path.split('/') if segment][:-1]
+    
+    def ancestors(self):
+        """Предки от корня к родителю (один запрос по первичному ключу)"""
+        return Category.objects.filter(pk__in=self.ancestor_ids()).order_by('depth')
+    
+    def descendants(self, include_self=False):
+        """Все потомки на любой глубине (один запрос по индексу path)"""
+        queryset = Category.objects.filter(path__startswith=self.path)
+        if not include_self:
+            queryset = queryset.exclude(pk=self.pk)
+        return queryset.order_by('path')
+    
     class Meta:
         verbose_name = 'Категория'
         verbose_name_plural = 'Категории'
@@ -46,12 +131,50 @@ class Product(models.Model):
     unit = models.CharField('Единица измерения', max_length=20, default='шт.')
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
     is_popular = models.BooleanField(default=False)
+    # Растет при каждом сохранении; входит в ключ кэша фрагментов карточки товара
+    version = models.PositiveIntegerField('Версия', default=1, editable=False)
+    
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Запоминаем загруженную цену, чтобы пересчитать корзины при ее изменении"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_price = instance.__dict__.get('price')
+        return instance
+    
+    def save(self, *args, **kwargs):
+        """Сохранение с новой версией: закэшированные карточки товара перестают совпадать по ключу"""
+        if not self._state.adding:
+            self.version += 1
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+    
+    @property
+    def available_stock(self):
+        """Доступно к заказу: с учетом резервов, если queryset аннотирован (reservations.with_availability)"""
+        return getattr(self, 'available', self.stock)
+    
+    @property
+    def price_changed(self):
+        loaded_price = getattr(self, '_loaded_price', None)
+        return loaded_price is not None and loaded_price != self.price
+    
     def __str__(self):
         return f"{self.name} ({self.sku})"
     
     class Meta:
         verbose_name = 'Товар'
         verbose_name_plural = 'Товары'
+        # Частичные индексы только по товарам в наличии (stock > 0) - под запросы
+        # каталога и главной страницы, см. hot_queries.py
+        indexes = [
+            models.Index(fields=['category', 'name', 'id'], name='product_in_stock_idx',
+                         condition=models.Q(stock__gt=0)),
+            models.Index(fields=['id'], name='product_popular_idx',
+                         condition=models.Q(stock__gt=0, is_popular=True)),
+            models.Index(fields=['-created_at'], name='product_new_idx',
+                         condition=models.Q(stock__gt=0)),
+        ]
 
 # 4. Заказ
 class Order(models.Model):
@@ -76,32 +199,28 @@ class Order(models.Model):
     phone = models.CharField(max_length=20, blank=True)
     email = models.EmailField(blank=True)
     
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """Запоминаем загруженные поля, от которых зависит сводка UserOrderStats"""
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_stats_state = instance.stats_state()
+        return instance
+    
+    def stats_state(self):
+        """(пользователь, статус, сумма, дата) - вклад заказа в сводку пользователя"""
+        return (
+            self.__dict__.get('user_id'),
+            self.__dict__.get('status'),
+            self.__dict__.get('total_amount'),
+            self.__dict__.get('created_at'),
+        )
+    
     def save(self, *args, **kwargs):
         """Сохранение заказа с генерацией номера"""
         if not self.order_number:
-            from django.utils.timezone import now
-            import random
-            import time
-            
-            # Генерируем до 10 раз пока не найдем уникальный
-            for attempt in range(10):
-                try:
-                    date_str = now().strftime('%y%m%d')
-                    random_num = random.randint(1000, 9999)
-                    proposed_number = f"ORD-{date_str}-{random_num:04d}"
-                    
-                    # Проверяем существование
-                    if not Order.objects.filter(order_number=proposed_number).exists():
-                        self.order_number = proposed_number
-                        break
-                        
-                except Exception:
-                    # Если ошибка, используем timestamp
-                    pass
-            
-            # Если не удалось сгенерировать уникальный
-            if not self.order_number:
-                self.order_number = f"ORD-TS-{int(time.time())}-{random.randint(100, 999)}"
+            # Номер из счетчика на текущий день (один запрос, без перебора и гонок)
+            from .order_numbers import allocate_order_number
+            self.order_number = allocate_order_number()
         super().save(*args, **kwargs)
     
     def __str__(self):
@@ -111,6 +230,38 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-id'], name='order_user_created_idx'),
+            models.Index(fields=['user', 'status', '-created_at', '-id'], name='order_user_status_created_idx'),
+        ]
+
+# 4a. Счетчик номеров заказов на день (см. order_numbers.py)
+class OrderNumberCounter(models.Model):
+    day = models.DateField('День', primary_key=True)
+    last_value = models.PositiveIntegerField('Последний выданный номер', default=0)
+    
+    def __str__(self):
+        return f"{self.day:%y%m%d}: {self.last_value}"
+    
+    class Meta:
+        verbose_name = 'Счетчик номеров заказов'
+        verbose_name_plural = 'Счетчики номеров заказов'
+
+# 4b. Сводка заказов пользователя для личного кабинета (см. order_stats.py)
+class UserOrderStats(models.Model):
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, primary_key=True,
+                                related_name='order_stats', verbose_name='Пользователь')
+    total_orders = models.PositiveIntegerField('Всего заказов', default=0)
+    total_spent = models.DecimalField('Сумма заказов', max_digits=14, decimal_places=2, default=0)
+    active_orders = models.PositiveIntegerField('Активных заказов', default=0)
+    last_order_at = models.DateTimeField('Последний заказ', null=True, blank=True)
+    
+    def __str__(self):
+        return f"{self.user}: {self.total_orders} заказов"
+    
+    class Meta:
+        verbose_name = 'Сводка заказов пользователя'
+        verbose_name_plural = 'Сводки заказов пользователей'
 
 # 5. Позиция в заказе
 class OrderItem(models.Model):
@@ -134,6 +285,10 @@ class Cart(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, null=True, blank=True, 
                            verbose_name='Пользователь')
     session_key = models.CharField('Ключ сессии', max_length=40, null=True, blank=True)
+    # Денормализованные итоги: обновляются атомарно в cart_utils,
+    # расхождения исправляет команда reconcile_cart_totals
+    items_count = models.PositiveIntegerField('Количество товаров', default=0)
+    subtotal = models.DecimalField('Сумма', max_digits=12, decimal_places=2, default=0)
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
     updated_at = models.DateTimeField('Дата обновления', auto_now=True)
     
@@ -146,20 +301,23 @@ class Cart(models.Model):
     @property
     def total_items(self):
         """Общее количество товаров в корзине"""
-        from django.db.models import Sum 
-        return self.items.aggregate(total=Sum('quantity'))['total'] or 0
+        return self.items_count
     
     @property
     def total_price(self):
         """Общая стоимость корзины"""
-        total = 0
-        for item in self.items.all():
-            total += item.quantity * item.product.price
-        return total
+        return self.subtotal
     
     class Meta:
         verbose_name = 'Корзина'
         verbose_name_plural = 'Корзины'
+        constraints = [
+            # Одна корзина на пользователя и одна на сессию
+            models.UniqueConstraint(fields=['user'], condition=models.Q(user__isnull=False),
+                                    name='cart_unique_user'),
+            models.UniqueConstraint(fields=['session_key'], condition=models.Q(session_key__isnull=False),
+                                    name='cart_unique_session'),
+        ]
 
 # 7. Позиция в корзине
 class CartItem(models.Model):
@@ -167,6 +325,8 @@ class CartItem(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE, verbose_name='Товар')
     quantity = models.PositiveIntegerField('Количество', default=1)
     added_at = models.DateTimeField('Дата добавления', auto_now_add=True)
+    # Резерв остатка под позицию (см. reservations.py)
+    reserved_until = models.DateTimeField('Резерв до', null=True, blank=True)
     
     @property
     def price(self):
@@ -185,4 +345,12 @@ class CartItem(models.Model):
         verbose_name = 'Позиция корзины'
         verbose_name_plural = 'Позиции корзины'
         unique_together = ['cart', 'product']  # Один товар - одна запись в корзине
+        indexes = [
+            # Активные резервы по товару и выборка истекших
+            models.Index(
+                fields=['product', 'reserved_until'],
+                name='cartitem_reservation_idx',
+                condition=models.Q(reserved_until__isnull=False),
+            ),
+        ]
 # Create your models here.
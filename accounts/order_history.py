@@ -0,0 +1,59 @@
+"""
+История заказов пользователя с keyset-пагинацией.
+
+Вместо OFFSET страница продолжается от последнего показанного заказа:
+WHERE (created_at, id) < (курсор) ORDER BY created_at DESC, id DESC LIMIT n.
+Запрос идет по индексу (user, -created_at, -id), поэтому стоимость страницы
+не зависит от того, насколько глубоко пользователь пролистал историю.
+С фильтром по статусу - индекс (user, status, -created_at, -id): и отбор, и
+сортировка по курсору идут по индексу, без сортировки всех заказов в статусе.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from django.db.models import Q
+
+from .models import Order
+
+ORDERS_PER_PAGE = 20
+
+
+def encode_cursor(order):
+    """Курсор, указывающий на заказ: base64('created_at|id')"""
+    raw = f"{order.created_at.isoformat()}|{order.pk}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(created_at, id) из курсора или None, если курсор пустой или поврежден"""
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, _, pk = raw.partition('|')
+        return datetime.fromisoformat(created_at), int(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+
+
+def get_orders_page(user, cursor=None, status=None, limit=ORDERS_PER_PAGE):
+    """
+    Страница истории заказов после курсора.
+    Возвращает (orders, next_cursor); next_cursor = None на последней странице.
+    """
+    orders = Order.objects.filter(user=user)
+    if status:
+        orders = orders.filter(status=status)
+
+    position = decode_cursor(cursor)
+    if position is not None:
+        created_at, pk = position
+        orders = orders.filter(Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk))
+
+    # Берем на одну запись больше, чтобы узнать, есть ли следующая страница
+    page = list(orders.order_by('-created_at', '-id')[:limit + 1])
+    if len(page) > limit:
+        page = page[:limit]
+        return page, encode_cursor(page[-1])
+    return page, None
@@ -0,0 +1,150 @@
+"""
+Выдача номеров заказов формата ORD-yymmdd-NNNN.
+
+Номер берется из счетчика на текущий день (OrderNumberCounter) атомарным
+INSERT ... ON CONFLICT DO UPDATE ... RETURNING - один запрос, без проверок
+exists() и без гонки между проверкой и вставкой. Номера уникальны, но могут
+идти с пропусками (например, после отката транзакции заказа).
+
+Внутри транзакции заказа UPSERT выполняется в отдельном соединении в режиме
+autocommit: строка счетчика блокируется только на время самого запроса, а не до
+фиксации всего заказа, и оформления заказов в один день не выстраиваются в
+очередь за ней. Исключение - SQLite: писатель там один на всю базу
+(BEGIN IMMEDIATE), и второе соединение ждало бы блокировку транзакции заказа.
+Соединение закрывается в конце запроса (close_counter_connection по сигналу
+request_finished), иначе при CONN_MAX_AGE каждый поток держал бы в PostgreSQL
+два соединения. Оформление заказа (checkout.place_order) берет номер еще до
+начала своей транзакции - на основном соединении, второе ему не нужно.
+
+При большом потоке заказов процесс может резервировать номера блоками:
+ORDER_NUMBER_BLOCK_SIZE = 50 - один запрос к БД на 50 заказов.
+"""
+import datetime
+import re
+import threading
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Order, OrderNumberCounter
+
+ORDER_NUMBER_FORMAT = 'ORD-{day:%y%m%d}-{number:04d}'
+ORDER_NUMBER_RE = re.compile(r'^ORD-(\d{6})-(\d+)$')
+
+UPSERT_SQL = (
+    "INSERT INTO {table} (day, last_value) VALUES (%s, %s) "
+    "ON CONFLICT (day) DO UPDATE SET last_value = {table}.last_value + excluded.last_value "
+    "RETURNING last_value"
+)
+
+_lock = threading.Lock()
+_block = {'day': None, 'next': 1, 'last': 0}
+# Отдельное соединение для счетчика - свое у каждого потока
+_local = threading.local()
+
+
+def supports_upsert(db):
+    return db.features.supports_update_conflicts and db.features.can_return_columns_from_insert
+
+
+def uses_counter_connection():
+    """Резервировать ли номера в отдельном autocommit-соединении (см. описание модуля)"""
+    return connection.in_atomic_block and connection.vendor != 'sqlite' and supports_upsert(connection)
+
+
+def counter_connection():
+    """Соединение потока для счетчика (autocommit), переиспользуется между заказами"""
+    db = getattr(_local, 'connection', None)
+    if db is None:
+        db = _local.connection = connections.create_connection(DEFAULT_DB_ALIAS)
+    db.close_if_unusable_or_obsolete()
+    return db
+
+
+def close_counter_connection(**kwargs):
+    """Закрыть соединение счетчика текущего потока (обработчик request_finished)"""
+    db = getattr(_local, 'connection', None)
+    if db is not None:
+        del _local.connection
+        db.close()
+
+
+def reserve_numbers(day, count=1):
+    """
+    Увеличить счетчик дня на count и вернуть последний зарезервированный номер.
+    Зарезервированы номера last - count + 1 ... last. Внутри транзакции резерв
+    фиксируется сразу, независимо от нее (uses_counter_connection).
+    """
+    db = counter_connection() if uses_counter_connection() else connection
+    if supports_upsert(db):
+        sql = UPSERT_SQL.format(table=db.ops.quote_name(OrderNumberCounter._meta.db_table))
+        with db.cursor() as cursor:
+            cursor.execute(sql, [day, count])
+            return cursor.fetchone()[0]
+
+    # Запасной вариант для БД без UPSERT ... RETURNING
+    with transaction.atomic():
+        OrderNumberCounter.objects.get_or_create(day=day)
+        OrderNumberCounter.objects.filter(day=day).update(last_value=F('last_value') + count)
+        return OrderNumberCounter.objects.values_list('last_value', flat=True).get(day=day)
+
+
+def allocate_order_number():
+    """Следующий номер заказа на текущий день"""
+    day = timezone.localdate()
+    block_size = max(int(getattr(settings, 'ORDER_NUMBER_BLOCK_SIZE', 1)), 1)
+
+    if block_size == 1:
+        return ORDER_NUMBER_FORMAT.format(day=day, number=reserve_numbers(day))
+
+    with _lock:
+        if _block['day'] == day and _block['next'] <= _block['last']:
+            number = _block['next']
+            _block['next'] += 1
+            return ORDER_NUMBER_FORMAT.format(day=day, number=number)
+
+    separate = uses_counter_connection()
+    last = reserve_numbers(day, block_size)
+    first = last - block_size + 1
+
+    def publish_block():
+        with _lock:
+            _block.update(day=day, next=first + 1, last=last)
+
+    if separate:
+        # Резерв уже зафиксирован в своем соединении
+        publish_block()
+    else:
+        # Остаток блока раздаем только после фиксации резерва: при откате транзакции
+        # счетчик вернется назад, и эти номера могут быть выданы снова
+        transaction.on_commit(publish_block)
+    return ORDER_NUMBER_FORMAT.format(day=day, number=first)
+
+
+def sync_counters():
+    """
+    Подтянуть счетчики к максимальным номерам существующих заказов
+    (после загрузки заказов в обход Order.save). Возвращает число обновленных дней.
+    """
+    last_values = {}
+    for order_number in Order.objects.values_list('order_number', flat=True).iterator():
+        match = ORDER_NUMBER_RE.match(order_number)
+        if not match:
+            continue
+        day = datetime.datetime.strptime(match.group(1), '%y%m%d').date()
+        last_values[day] = max(last_values.get(day, 0), int(match.group(2)))
+
+    current = dict(OrderNumberCounter.objects.filter(day__in=last_values).values_list('day', 'last_value'))
+    stale = [
+        OrderNumberCounter(day=day, last_value=value)
+        for day, value in last_values.items()
+        if value > current.get(day, 0)
+    ]
+    OrderNumberCounter.objects.bulk_create(
+        stale, update_conflicts=True, unique_fields=['day'], update_fields=['last_value'], batch_size=500,
+    )
+    with _lock:
+        _block.update(day=None, next=1, last=0)
+    return len(stale)
@@ -0,0 +1,148 @@
+"""
+Сводка заказов пользователя (UserOrderStats) для личного кабинета.
+
+Строка сводки обновляется инкрементально из сигналов Order: при создании
+заказа, смене статуса, суммы или владельца применяется разница одним
+UPDATE с F()-выражениями. Если строки еще нет, она собирается агрегатом по
+заказам пользователя - под блокировкой строки пользователя (_lock_user),
+чтобы сборки из параллельных транзакций не затирали друг друга. Полная
+пересборка - команда rebuild_order_stats.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Count, F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+
+from .models import CustomUser, Order, UserOrderStats
+
+# Заказы в этих статусах не считаются активными
+INACTIVE_STATUSES = ('delivered', 'cancelled')
+
+STATS_FIELDS = ['total_orders', 'total_spent', 'active_orders', 'last_order_at']
+
+
+def _is_active(status):
+    return int(status not in INACTIVE_STATUSES)
+
+
+def rebuild_user_stats(user_ids):
+    """Пересобрать сводки пользователей по их заказам (один агрегат и один UPSERT)"""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return 0
+    rows = {
+        row['user']: row
+        for row in (
+            Order.objects
+            .filter(user_id__in=user_ids)
+            .order_by()
+            .values('user')
+            .annotate(
+                total_orders=Count('id'),
+                total_spent=Sum('total_amount'),
+                active_orders=Count('id', filter=~Q(status__in=INACTIVE_STATUSES)),
+                last_order_at=Max('created_at'),
+            )
+        )
+    }
+    stats = []
+    for user_id in user_ids:
+        row = rows.get(user_id, {})
+        stats.append(UserOrderStats(
+            user_id=user_id,
+            total_orders=row.get('total_orders', 0),
+            total_spent=row.get('total_spent') or Decimal('0'),
+            active_orders=row.get('active_orders', 0),
+            last_order_at=row.get('last_order_at'),
+        ))
+    UserOrderStats.objects.bulk_create(
+        stats, update_conflicts=True, unique_fields=['user'], update_fields=STATS_FIELDS,
+    )
+    return len(stats)
+
+
+def _apply_delta(user_id, orders, spent, active, last_order_at=None):
+    """Прибавить разницу к сводке; 0, если строки сводки еще нет"""
+    updates = {
+        'total_orders': F('total_orders') + orders,
+        'total_spent': F('total_spent') + spent,
+        'active_orders': F('active_orders') + active,
+    }
+    if last_order_at is not None:
+        updates['last_order_at'] = Greatest(Coalesce(F('last_order_at'), Value(last_order_at)), Value(last_order_at))
+    return UserOrderStats.objects.filter(user_id=user_id).update(**updates)
+
+
+def _lock_user(user_id):
+    """SELECT ... FOR UPDATE строки пользователя до конца транзакции"""
+    CustomUser.objects.select_for_update().filter(pk=user_id).values_list('pk', flat=True).first()
+
+
+def _apply_or_rebuild(user_id, *delta):
+    """
+    Прибавить разницу к сводке, а если сводки нет - собрать ее агрегатом.
+
+    Два первых заказа пользователя в параллельных транзакциях не видят
+    незафиксированный заказ друг друга: собери обе сводку сами, вторая
+    перезаписала бы первую, и один заказ пропал бы. Поэтому сборка идет под
+    блокировкой пользователя, а после ее получения разница пробуется еще раз:
+    вторая транзакция дожидается сводки первой и прибавляет к ней свой заказ.
+    """
+    if _apply_delta(user_id, *delta):
+        return
+    with transaction.atomic():
+        _lock_user(user_id)
+        if not _apply_delta(user_id, *delta):
+            rebuild_user_stats([user_id])
+
+
+def order_added(state):
+    user_id, status, amount, created_at = state
+    _apply_or_rebuild(user_id, 1, amount or 0, _is_active(status), created_at)
+
+
+def order_removed(state):
+    """Вычесть заказ из сводки; дата последнего заказа берется заново подзапросом"""
+    user_id, status, amount, created_at = state
+    latest = Order.objects.filter(user_id=OuterRef('user_id')).order_by('-created_at').values('created_at')[:1]
+    UserOrderStats.objects.filter(user_id=user_id).update(
+        total_orders=F('total_orders') - 1,
+        total_spent=F('total_spent') - (amount or 0),
+        active_orders=F('active_orders') - _is_active(status),
+        last_order_at=Subquery(latest),
+    )
+
+
+def order_changed(old_state, new_state):
+    """Применить изменение заказа к сводке (old_state=None - новый заказ)"""
+    if old_state is None:
+        order_added(new_state)
+        return
+    if old_state == new_state:
+        return
+
+    old_user, old_status, old_amount, _ = old_state
+    new_user, new_status, new_amount, created_at = new_state
+    if old_user != new_user:
+        order_removed(old_state)
+        order_added(new_state)
+        return
+
+    delta_active = _is_active(new_status) - _is_active(old_status)
+    delta_spent = (new_amount or 0) - (old_amount or 0)
+    _apply_or_rebuild(new_user, 0, delta_spent, delta_active, created_at)
+
+
+def get_user_stats(user):
+    """Сводка пользователя одним чтением строки (собирается при первом обращении)"""
+    stats = UserOrderStats.objects.filter(user=user).first()
+    if stats is None:
+        # Под той же блокировкой, что и в _apply_or_rebuild: иначе сборка без
+        # еще не зафиксированного заказа затерла бы его вклад
+        with transaction.atomic():
+            _lock_user(user.pk)
+            if not UserOrderStats.objects.filter(user=user).exists():
+                rebuild_user_stats([user.pk])
+        stats = UserOrderStats.objects.get(user=user)
+    return stats
@@ -0,0 +1,314 @@
+"""
+Импорт прайс-листов поставщиков (CSV, XLSX) по артикулу.
+
+Файл читается потоково, строки обрабатываются пачками: для каждой пачки
+одним запросом берутся существующие товары по sku, новые артикулы
+создаются bulk_create, измененные - bulk_update только по реально
+изменившимся полям; одна транзакция на пачку. Категории создаются по
+названию, вложенность задается через "/": "Сухие смеси / Цемент".
+
+После импорта пересчитываются итоги корзин с товарами, у которых
+изменилась цена, и сбрасывается кэш данных о товарах.
+
+Кодировка CSV по умолчанию определяется до импорта (UTF-8 или cp1251 -
+обычная выгрузка Excel у российских поставщиков), а битый файл - ошибка
+PriceImportError, а не сбой посреди загрузки.
+"""
+import codecs
+import csv
+import io
+import zipfile
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .cart_utils import recalculate_cart_totals
+from .catalog_utils import invalidate_product_caches
+from .models import Cart, Category, Product
+
+DEFAULT_BATCH_SIZE = 1000
+CATEGORY_SEPARATOR = '/'
+# Границы полей Product: значение больше не сохранится и сорвет весь пакет
+_price_field = Product._meta.get_field('price')
+MAX_PRICE = Decimal(10) ** (_price_field.max_digits - _price_field.decimal_places)
+MAX_STOCK = 2147483647
+# Кодировки CSV для encoding='auto'; cp1251 читает почти любые байты, поэтому последняя
+CSV_ENCODINGS = ('utf-8-sig', 'cp1251')
+READ_CHUNK_SIZE = 1 << 16
+
+# Допустимые заголовки столбцов -> поле
+COLUMN_ALIASES = {
+    'sku': 'sku', 'артикул': 'sku',
+    'name': 'name', 'название': 'name', 'наименование': 'name',
+    'price': 'price', 'цена': 'price',
+    'stock': 'stock', 'остаток': 'stock', 'количество': 'stock',
+    'unit': 'unit', 'ед.': 'unit', 'единица': 'unit', 'единица измерения': 'unit',
+    'category': 'category', 'категория': 'category',
+    'description': 'description', 'описание': 'description',
+}
+
+UPDATABLE_FIELDS = ['name', 'price', 'stock', 'unit', 'description']
+FIELD_LABELS = {'sku': 'артикул', 'name': 'название', 'unit': 'единица измерения', 'category': 'категория'}
+
+
+class PriceImportError(Exception):
+    """Файл не может быть импортирован"""
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    categories_created: int = 0
+    errors: list = field(default_factory=list)
+
+    def summary(self):
+        return (
+            f"строк: {self.rows}, создано: {self.created}, обновлено: {self.updated}, "
+            f"без изменений: {self.unchanged}, новых категорий: {self.categories_created}, "
+            f"ошибок: {len(self.errors)}"
+        )
+
+
+def _normalize_header(header):
+    columns = []
+    for name in header:
+        key = str(name or '').strip().lower()
+        columns.append(COLUMN_ALIASES.get(key))
+    if 'sku' not in columns:
+        raise PriceImportError('В файле нет столбца с артикулом (sku / Артикул)')
+    return columns
+
+
+def detect_csv_encoding(fileobj, candidates=CSV_ENCODINGS):
+    """Первая кодировка, в которой читается весь файл (двоичный, с поддержкой seek)"""
+    for encoding in candidates:
+        decoder = codecs.getincrementaldecoder(encoding)()
+        fileobj.seek(0)
+        try:
+            while chunk := fileobj.read(READ_CHUNK_SIZE):
+                decoder.decode(chunk)
+            decoder.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        finally:
+            fileobj.seek(0)
+        return encoding
+    raise PriceImportError(f"Не удалось определить кодировку файла (пробовали: {', '.join(candidates)})")
+
+
+def read_csv(fileobj, encoding='auto'):
+    """Строки CSV (файл открыт в двоичном режиме) как словари {поле: значение}; разделитель определяется автоматически"""
+    if encoding == 'auto':
+        encoding = detect_csv_encoding(fileobj)
+    fileobj = io.TextIOWrapper(fileobj, encoding=encoding, newline='')
+    try:
+        sample = fileobj.read(4096)
+        fileobj.seek(0)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=';,\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.reader(fileobj, dialect)
+        columns = _normalize_header(next(reader, []))
+        for row in reader:
+            yield {column: value for column, value in zip(columns, row) if column}
+    except UnicodeDecodeError as e:
+        raise PriceImportError(f"Файл не в кодировке {encoding}: {e.reason} (байт {e.start})")
+    except csv.Error as e:
+        raise PriceImportError(f"Не удалось разобрать CSV: {e}")
+
+
+def read_xlsx(fileobj, sheet=None):
+    """Строки первого (или указанного) листа XLSX; openpyxl читает файл в режиме read_only"""
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise PriceImportError('Для импорта XLSX нужен пакет openpyxl')
+    try:
+        workbook = load_workbook(fileobj, read_only=True, data_only=True)
+    except (zipfile.BadZipFile, KeyError, ValueError, OSError) as e:
+        # openpyxl: не zip, zip без листов книги, неизвестный формат
+        raise PriceImportError(f"Файл не является книгой XLSX: {e}")
+    try:
+        try:
+            worksheet = workbook[sheet] if sheet else workbook.worksheets[0]
+        except (KeyError, IndexError):
+            raise PriceImportError(f"В книге нет листа {sheet or 'с данными'}")
+        rows = worksheet.iter_rows(values_only=True)
+        columns = _normalize_header(next(rows, ()))
+        for row in rows:
+            yield {column: value for column, value in zip(columns, row) if column}
+    finally:
+        workbook.close()
+
+
+def read_price_list(fileobj, filename, sheet=None, encoding='auto'):
+    """Строки прайс-листа (двоичный файл) по расширению имени файла"""
+    name = filename.lower()
+    if name.endswith('.xlsx'):
+        return read_xlsx(fileobj, sheet)
+    if name.endswith('.csv') or name.endswith('.txt'):
+        return read_csv(fileobj, encoding)
+    raise PriceImportError('Поддерживаются файлы .csv и .xlsx')
+
+
+def _check_length(field_name, value, max_length):
+    if len(value) > max_length:
+        raise ValueError(f"{FIELD_LABELS[field_name]} длиннее {max_length} символов: {value[:40]}...")
+    return value
+
+
+def _clean_row(row):
+    """Значения строки в типах модели; бросает ValueError с понятным текстом"""
+    sku = str(row.get('sku') or '').strip()
+    if not sku:
+        raise ValueError('пустой артикул')
+    values = {'sku': _check_length('sku', sku, Product._meta.get_field('sku').max_length)}
+    for name in ('name', 'unit', 'description', 'category'):
+        if row.get(name) not in (None, ''):
+            values[name] = str(row[name]).strip()
+    # Слишком длинное значение сорвало бы всю пачку (DataError на PostgreSQL)
+    for name in ('name', 'unit'):
+        if name in values:
+            _check_length(name, values[name], Product._meta.get_field(name).max_length)
+    for part in values.get('category', '').split(CATEGORY_SEPARATOR):
+        _check_length('category', part.strip(), Category._meta.get_field('name').max_length)
+    if row.get('price') not in (None, ''):
+        try:
+            price = Decimal(str(row['price']).replace(' ', '').replace(',', '.'))
+            # Decimal() принимает 'Infinity' и 'NaN' - для цены это ошибка строки, а не исключение импорта
+            if not price.is_finite():
+                raise InvalidOperation
+            price = price.quantize(Decimal('0.01'))
+        except InvalidOperation:
+            raise ValueError(f"неверная цена: {row['price']}")
+        if price < 0:
+            raise ValueError(f"отрицательная цена: {row['price']}")
+        if price >= MAX_PRICE:
+            raise ValueError(f"слишком большая цена: {row['price']}")
+        values['price'] = price
+    if row.get('stock') not in (None, ''):
+        try:
+            stock = int(Decimal(str(row['stock']).replace(' ', '').replace(',', '.')))
+        except (InvalidOperation, OverflowError, ValueError):
+            # ValueError - NaN, OverflowError - Infinity
+            raise ValueError(f"неверный остаток: {row['stock']}")
+        if stock > MAX_STOCK:
+            raise ValueError(f"слишком большой остаток: {row['stock']}")
+        values['stock'] = max(stock, 0)
+    return values
+
+
+class PriceListImporter:
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.result = ImportResult()
+        self._categories = None
+
+    def run(self, rows):
+        """Импортировать строки (итератор словарей); возвращает ImportResult"""
+        batch = []
+        for line_number, row in enumerate(rows, start=2):
+            if not any(value not in (None, '') for value in row.values()):
+                continue
+            self.result.rows += 1
+            try:
+                batch.append((line_number, _clean_row(row)))
+            except ValueError as e:
+                self.result.errors.append(f"Строка {line_number}: {e}")
+            if len(batch) >= self.batch_size:
+                self._import_batch(batch)
+                batch = []
+        if batch:
+            self._import_batch(batch)
+        if not self.dry_run and (self.result.created or self.result.updated):
+            transaction.on_commit(invalidate_product_caches)
+        return self.result
+
+    def _category_id(self, path):
+        """id категории по пути "Родитель / Дочерняя", недостающие создаются"""
+        if self._categories is None:
+            self._categories = {}
+            for category in Category.objects.only('id', 'name', 'parent_id').order_by('path'):
+                self._categories.setdefault((category.parent_id, category.name.lower()), category.pk)
+
+        parent_id = None
+        for name in [part.strip() for part in path.split(CATEGORY_SEPARATOR) if part.strip()]:
+            key = (parent_id, name.lower())
+            if key not in self._categories:
+                if self.dry_run:
+                    self._categories[key] = None
+                else:
+                    self._categories[key] = Category.objects.create(name=name, parent_id=parent_id).pk
+                self.result.categories_created += 1
+            parent_id = self._categories[key]
+        return parent_id
+
+    def _import_batch(self, batch):
+        # Повтор артикула в файле: побеждает последняя строка
+        rows = {}
+        for line_number, values in batch:
+            rows[values['sku']] = (line_number, values)
+
+        with transaction.atomic():
+            existing = Product.objects.in_bulk(list(rows), field_name='sku')
+            new_products = []
+            changed = {}
+            price_changed_ids = []
+
+            for sku, (line_number, values) in rows.items():
+                product = existing.get(sku)
+                if product is None:
+                    missing = [name for name in ('name', 'price', 'category') if name not in values]
+                    if missing:
+                        self.result.errors.append(
+                            f"Строка {line_number}: новый артикул {sku} без полей {', '.join(missing)}"
+                        )
+                        continue
+                    new_products.append(Product(
+                        sku=sku,
+                        name=values['name'],
+                        price=values['price'],
+                        stock=values.get('stock', 0),
+                        unit=values.get('unit', 'шт.'),
+                        description=values.get('description', ''),
+                        category_id=self._category_id(values['category']),
+                    ))
+                    continue
+
+                fields = [name for name in UPDATABLE_FIELDS if name in values and getattr(product, name) != values[name]]
+                if 'category' in values:
+                    category_id = self._category_id(values['category'])
+                    if category_id != product.category_id:
+                        product.category_id = category_id
+                        fields.append('category')
+                if not fields:
+                    self.result.unchanged += 1
+                    continue
+                for name in fields:
+                    if name != 'category':
+                        setattr(product, name, values[name])
+                if 'price' in fields:
+                    price_changed_ids.append(product.pk)
+                # bulk_update обходит Product.save - версию карточки меняем сами
+                product.version += 1
+                fields.append('version')
+                changed.setdefault(tuple(sorted(fields)), []).append(product)
+
+            self.result.created += len(new_products)
+            self.result.updated += sum(len(products) for products in changed.values())
+            if self.dry_run:
+                transaction.set_rollback(True)
+                return
+
+            Product.objects.bulk_create(new_products)
+            # bulk_update по группам с одинаковым набором полей - без лишних колонок в UPDATE
+            for fields, products in changed.items():
+                Product.objects.bulk_update(products, list(fields))
+            if price_changed_ids:
+                recalculate_cart_totals(Cart.objects.filter(items__product_id__in=price_changed_ids))
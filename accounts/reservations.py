@@ -0,0 +1,61 @@
+"""
+Временный резерв остатков под позиции корзины.
+
+Позиция CartItem держит резерв до reserved_until (CART_RESERVATION_MINUTES,
+продлевается при каждом изменении корзины). Доступно к заказу =
+stock - сумма активных резервов других корзин. Истекшие резервы просто
+перестают учитываться; команда release_expired_reservations пачками
+снимает их отметки, чтобы частичный индекс оставался маленьким.
+
+Гостевые корзины (сессия/cookie) резервов не держат - они появляются
+после входа, когда корзина переносится в БД.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import CartItem, Product
+
+
+def reservation_ttl():
+    return timedelta(minutes=getattr(settings, 'CART_RESERVATION_MINUTES', 15))
+
+
+def reservation_deadline():
+    return timezone.now() + reservation_ttl()
+
+
+def reserved_quantity(exclude_cart=None):
+    """Подзапрос: сумма активных резервов по товару (OuterRef('pk'))"""
+    active = CartItem.objects.filter(product=OuterRef('pk'), reserved_until__gt=timezone.now())
+    if exclude_cart is not None and exclude_cart.pk is not None:
+        active = active.exclude(cart=exclude_cart)
+    total = active.order_by().values('product').annotate(total=Sum('quantity')).values('total')
+    return Coalesce(Subquery(total, output_field=IntegerField()), Value(0))
+
+
+def with_availability(queryset, exclude_cart=None):
+    """Добавить к товарам reserved и available (остаток за вычетом чужих резервов)"""
+    return queryset.annotate(
+        reserved=reserved_quantity(exclude_cart),
+    ).annotate(
+        available=Greatest(F('stock') - F('reserved'), Value(0), output_field=IntegerField()),
+    )
+
+
+def available_to_promise(product_id, exclude_cart=None):
+    """Сколько единиц товара можно положить в корзину прямо сейчас"""
+    return (
+        with_availability(Product.objects.filter(pk=product_id), exclude_cart)
+        .values_list('available', flat=True)
+        .first()
+    ) or 0
+
+
+def refresh_reservations(cart):
+    """Продлить резервы всех позиций корзины (один UPDATE)"""
+    if cart.pk is not None:
+        CartItem.objects.filter(cart=cart).update(reserved_until=reservation_deadline())
@@ -0,0 +1,175 @@
+"""
+Полнотекстовый поиск товаров по названию, артикулу и описанию.
+
+Бэкенды:
+- PostgreSQL: генерируемый столбец search_vector (tsvector, словарь russian) + GIN индекс
+- SQLite: виртуальная таблица FTS5 accounts_product_fts, синхронизируется триггерами
+- запасной вариант: icontains, если индекс недоступен
+
+Индексы создаются миграцией 0006_product_search_index, триграммный индекс
+артикула для админки (PostgreSQL) - миграцией 0017_product_sku_trigram_index. Бэкенд выбирается по
+типу БД, либо явно настройкой PRODUCT_SEARCH_BACKEND ('postgres', 'sqlite', 'basic').
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Product
+from .reservations import with_availability
+
+# Максимум результатов поиска по умолчанию
+SEARCH_LIMIT = 50
+# С какой длины запроса искать вхождение в артикул (триграммы - по 3 символа)
+SKU_SUBSTRING_MIN_LENGTH = 3
+
+# Окончания для упрощенного стемминга на SQLite (FTS5 не знает русской морфологии)
+RUSSIAN_ENDINGS = re.compile(
+    r'(иями|ями|ами|иях|ого|его|ому|ему|ыми|ими|ая|яя|ое|ее|ые|ие|ый|ий|ой|ую|юю|'
+    r'ов|ев|ей|ам|ям|ах|ях|ом|ем|а|я|ы|и|е|у|ю|о|ь)$'
+)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+
+class BasicSearchBackend:
+    """Поиск без индекса (icontains) - для БД без полнотекстового поиска"""
+
+    def condition(self, query):
+        condition = Q()
+        for word in WORD_RE.findall(query):
+            condition &= Q(name__icontains=word) | Q(sku__icontains=word) | Q(description__icontains=word)
+        return condition
+
+    def search_ids(self, query, limit):
+        return list(
+            Product.objects.filter(self.condition(query)).order_by('name').values_list('id', flat=True)[:limit]
+        )
+
+
+class PostgresSearchBackend:
+    """Поиск по tsvector с ранжированием ts_rank_cd и русской морфологией"""
+
+    tsquery = "websearch_to_tsquery('russian', %s)"
+
+    def condition(self, query):
+        return Q(RawSQL(f"search_vector @@ {self.tsquery}", (query,), output_field=BooleanField()))
+
+    def search_ids(self, query, limit):
+        rank = RawSQL(f"ts_rank_cd(search_vector, {self.tsquery})", (query,), output_field=FloatField())
+        return list(
+            Product.objects
+            .filter(self.condition(query))
+            .annotate(rank=rank)
+            .order_by('-rank', 'id')
+            .values_list('id', flat=True)[:limit]
+        )
+
+
+class SQLiteSearchBackend:
+    """Поиск по FTS5 с ранжированием bm25 (название весомее описания)"""
+
+    sql = (
+        "SELECT rowid FROM accounts_product_fts "
+        "WHERE accounts_product_fts MATCH %s "
+        "ORDER BY bm25(accounts_product_fts, 10.0, 5.0, 1.0) "
+        "LIMIT %s"
+    )
+
+    def build_match(self, query):
+        """Каждое слово - префиксный терм с отброшенным окончанием: "цемент"* "м500"*"""
+        terms = []
+        for word in WORD_RE.findall(query.lower()):
+            stem = RUSSIAN_ENDINGS.sub('', word)
+            if len(stem) < 3:
+                stem = word
+            terms.append('"%s"*' % stem.replace('"', ''))
+        return ' '.join(terms)
+
+    def condition(self, query):
+        match = self.build_match(query)
+        if not match:
+            return Q(pk__in=[])
+        return Q(pk__in=RawSQL(
+            "SELECT rowid FROM accounts_product_fts WHERE accounts_product_fts MATCH %s", (match,)
+        ))
+
+    def search_ids(self, query, limit):
+        match = self.build_match(query)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            cursor.execute(self.sql, [match, limit])
+            return [row[0] for row in cursor.fetchall()]
+
+
+BACKENDS = {
+    'postgres': PostgresSearchBackend,
+    'sqlite': SQLiteSearchBackend,
+    'basic': BasicSearchBackend,
+}
+
+
+def _sqlite_fts_available():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'accounts_product_fts'"
+        )
+        return cursor.fetchone() is not None
+
+
+def get_search_backend():
+    """Бэкенд поиска из настроек или по типу текущей БД"""
+    name = getattr(settings, 'PRODUCT_SEARCH_BACKEND', None)
+    if name is None:
+        if connection.vendor == 'postgresql':
+            name = 'postgres'
+        elif connection.vendor == 'sqlite' and _sqlite_fts_available():
+            name = 'sqlite'
+        else:
+            name = 'basic'
+    return BACKENDS[name]()
+
+
+def search_product_ids(query, limit=SEARCH_LIMIT):
+    """
+    id товаров по убыванию релевантности.
+    Точное совпадение артикула (уникальный индекс) возвращается сразу, без полнотекстового поиска.
+    """
+    query = (query or '').strip()
+    if not query:
+        return []
+
+    exact_id = Product.objects.filter(sku=query).values_list('id', flat=True).first()
+    if exact_id is not None:
+        return [exact_id]
+
+    return get_search_backend().search_ids(query, limit)
+
+
+def filter_products(queryset, query):
+    """
+    Все товары queryset, найденные по запросу, без ограничения числа и без
+    ранжирования (админка: порядок и постраничный вывод - свои). Кроме
+    полнотекстового индекса ищется вхождение в артикул: индекс находит слова
+    по началу, а артикул менеджеры ищут по любой его части. На PostgreSQL
+    вхождение ищется по триграммному индексу (миграция 0017), который
+    работает от SKU_SUBSTRING_MIN_LENGTH символов; короче - только точный артикул.
+    """
+    query = (query or '').strip()
+    if not query:
+        return queryset
+    if len(query) >= SKU_SUBSTRING_MIN_LENGTH:
+        sku_condition = Q(sku__icontains=query)
+    else:
+        sku_condition = Q(sku=query)
+    return queryset.filter(get_search_backend().condition(query) | sku_condition)
+
+
+def search_products(query, limit=SEARCH_LIMIT):
+    """Товары (с категорией) в порядке релевантности"""
+    ids = search_product_ids(query, limit)
+    products = with_availability(Product.objects.select_related('category')).in_bulk(ids)
+    return [products[product_id] for product_id in ids if product_id in products]
@@ -1,11 +1,13 @@
 # accounts/signals.py
 from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.core.signals import request_finished
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.db import transaction
 from django.utils.timezone import now
 
 try:
-    from .cart_utils import merge_carts, get_or_create_cart
+    from .cart_utils import merge_carts_on_login, get_or_create_cart
     from .models import Cart, CartItem
     CART_AVAILABLE = True
 except ImportError:
@@ -26,28 +28,13 @@ def handle_user_login(sender, request, user, **kwargs):
     # Объединяем корзины если доступно
     if CART_AVAILABLE:
         try:
-            # Получаем ключ сессии
-            session_key = request.session.session_key
-            
-            # Ищем гостевую корзину
-            session_cart = None
-            if session_key:
-                session_cart = Cart.objects.filter(
-                    session_key=session_key,
-                    user__isnull=True
-                ).first()
-            
-            # Получаем или создаем корзину пользователя
-            user_cart, created = Cart.objects.get_or_create(user=user)
-            
-            # Объединяем если есть что объединять
-            if session_cart and session_cart.items.exists():
-                merge_carts(session_cart, user_cart)
+            user_cart = merge_carts_on_login(request, user)
+            if user_cart is not None and user_cart.total_items:
                 print(f"🛒 Корзины объединены для {user.username}")
-                
-                # Обновляем сессию
-                if 'cart_id' in request.session:
-                    del request.session['cart_id']
+            
+            # Обновляем сессию
+            if 'cart_id' in request.session:
+                del request.session['cart_id']
         except Exception as e:
             print(f"❌ Ошибка при объединении корзин: {e}")
 
@@ -59,4 +46,65 @@ def handle_user_logout(sender, request, user, **kwargs):
     if user:
         print(f"✅ Пользователь {user.username} вышел из системы")
     else:
-        print("✅ Анонимный пользователь вышел из системы")
\ No newline at end of file
+        print("✅ Анонимный пользователь вышел из системы")
+
+@receiver([post_save, post_delete], sender='accounts.Category')
+def handle_category_change(sender, **kwargs):
+    """
+    Сброс кэша дерева категорий после фиксации транзакции: если поднять версию
+    раньше, другой воркер успеет перечитать старое дерево под новой версией
+    """
+    from .category_tree import invalidate_category_tree
+    transaction.on_commit(invalidate_category_tree)
+
+@receiver(post_save, sender='accounts.Product')
+def handle_product_price_change(sender, instance, created, **kwargs):
+    """
+    Пересчет сохраненных итогов корзин, в которых лежит товар с новой ценой
+    """
+    if created or not instance.price_changed:
+        return
+    from .cart_utils import recalculate_cart_totals
+    recalculate_cart_totals(Cart.objects.filter(items__product_id=instance.pk))
+    instance._loaded_price = instance.price
+
+@receiver([post_save, post_delete], sender='accounts.Product')
+def handle_product_change(sender, **kwargs):
+    """
+    Сброс кэша данных о товарах (главная страница) после фиксации транзакции
+    """
+    from .catalog_utils import invalidate_product_caches
+    transaction.on_commit(invalidate_product_caches)
+
+@receiver(post_save, sender='accounts.Order')
+def handle_order_save(sender, instance, created, **kwargs):
+    """
+    Инкрементальное обновление сводки заказов пользователя
+    """
+    from .order_stats import order_changed
+    old_state = None if created else getattr(instance, '_loaded_stats_state', None)
+    new_state = instance.stats_state()
+    if old_state is None and not created:
+        # Заказ сохранен без загрузки из БД - прежний вклад неизвестен
+        from .order_stats import rebuild_user_stats
+        rebuild_user_stats([instance.user_id])
+    else:
+        order_changed(old_state, new_state)
+    instance._loaded_stats_state = new_state
+
+@receiver(post_delete, sender='accounts.Order')
+def handle_order_delete(sender, instance, **kwargs):
+    """
+    Вычитание удаленного заказа из сводки пользователя
+    """
+    from .order_stats import order_removed
+    order_removed(instance.stats_state())
+
+@receiver(request_finished)
+def handle_request_finished(sender, **kwargs):
+    """
+    Закрытие отдельного соединения счетчика номеров заказов: Django закрывает
+    по request_finished только свои соединения
+    """
+    from .order_numbers import close_counter_connection
+    close_counter_connection()
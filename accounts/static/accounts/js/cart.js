@@ -0,0 +1,76 @@
+/*
+ * Добавление в корзину без перезагрузки страницы.
+ * Обработчики висят на document (делегирование), поэтому работают и для
+ * карточек, подгруженных кнопкой "Показать ещё".
+ */
+(function () {
+    'use strict';
+
+    const {updateCartCounter, showNotification, postJSON} = window.lk;
+
+    // Формы добавления в корзину (карточки каталога, поиска, главной)
+    document.addEventListener('submit', function (e) {
+        const form = e.target;
+        if (!form.matches('form[action*="/cart/add/"]')) {
+            return;
+        }
+        e.preventDefault();
+
+        postJSON(form.action, new FormData(form))
+            .then(data => {
+                if (data.success) {
+                    updateCartCounter(data.cart_count);
+                    showNotification(data.message, 'success');
+                } else {
+                    showNotification(data.message, 'error');
+                }
+            })
+            .catch(error => {
+                console.error('Error:', error);
+                form.submit(); // Отправляем форму обычным способом при ошибке
+            });
+    });
+
+    document.addEventListener('click', function (e) {
+        const button = e.target.closest('.add-to-cart-ajax, .test-ajax-btn, .test-simple-add-btn');
+        if (!button) {
+            return;
+        }
+        e.preventDefault();
+        const productId = button.dataset.productId;
+
+        // Тестовый эндпоинт: всегда добавляет 1 шт.
+        if (button.classList.contains('test-simple-add-btn')) {
+            postJSON(`/test-simple-add/${productId}/`)
+                .then(data => {
+                    if (data.success) {
+                        showNotification(`✅ ${data.message}<br>Товаров в корзине: ${data.cart_count}`, 'success');
+                        updateCartCounter(data.cart_count);
+                    } else {
+                        showNotification('❌ Ошибка: ' + data.error, 'error');
+                    }
+                })
+                .catch(error => {
+                    console.error('Ошибка сети:', error);
+                    showNotification('Ошибка соединения с сервером', 'error');
+                });
+            return;
+        }
+
+        // Быстрое добавление: количество из data-quantity (по умолчанию 1)
+        const body = new URLSearchParams({quantity: button.dataset.quantity || 1});
+        postJSON(`/cart/add/${productId}/`, body)
+            .then(data => {
+                if (data.success) {
+                    updateCartCounter(data.cart_count);
+                    showNotification(data.message, 'success');
+                } else {
+                    showNotification('Ошибка: ' + data.message, 'error');
+                }
+            })
+            .catch(error => {
+                console.error('❌ Ошибка:', error);
+                showNotification('Ошибка при добавлении в корзину', 'error');
+            });
+    });
+})();
@@ -0,0 +1,34 @@
+/*
+ * Каталог: подгрузка следующих товаров категории кнопкой "Показать ещё".
+ * Ответ эндпоинта: {html, next_cursor, has_more}; курсор - последний показанный товар.
+ */
+(function () {
+    'use strict';
+
+    document.addEventListener('click', function (e) {
+        const button = e.target.closest('.load-more-btn');
+        if (!button) {
+            return;
+        }
+        e.preventDefault();
+        button.disabled = true;
+
+        const url = new URL(button.dataset.url, window.location.origin);
+        url.searchParams.set('cursor', button.dataset.cursor);
+        fetch(url)
+            .then(r => r.json())
+            .then(data => {
+                document.getElementById(button.dataset.target).insertAdjacentHTML('beforeend', data.html);
+                if (data.has_more) {
+                    button.dataset.cursor = data.next_cursor;
+                    button.disabled = false;
+                } else {
+                    button.remove();
+                }
+            })
+            .catch(err => {
+                console.error('❌ Ошибка подгрузки товаров:', err);
+                button.disabled = false;
+            });
+    });
+})();
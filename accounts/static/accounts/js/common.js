@@ -0,0 +1,70 @@
+/*
+ * Общие функции всех страниц: CSRF-токен, счетчик корзины в шапке, уведомления.
+ * Подключается в base.html первым; остальные скрипты берут функции из window.lk.
+ */
+(function () {
+    'use strict';
+
+    // CSRF-токен: из формы или <meta name="csrf-token"> на странице, иначе из cookie csrftoken
+    function getCSRFToken() {
+        const field = document.querySelector('[name=csrfmiddlewaretoken], meta[name=csrf-token]');
+        if (field) {
+            return field.value || field.content;
+        }
+        for (const cookie of document.cookie.split(';')) {
+            const [name, value] = cookie.trim().split('=');
+            if (name === 'csrftoken') {
+                return decodeURIComponent(value);
+            }
+        }
+        console.warn('CSRF токен не найден!');
+        return '';
+    }
+
+    // Счетчик корзины: начальное значение рендерит сервер, дальше - из ответов AJAX
+    function updateCartCounter(count, broadcast = true) {
+        const counter = document.getElementById('cart-count');
+        if (counter) {
+            counter.textContent = count;
+            counter.style.display = count > 0 ? 'inline-block' : 'none';
+        }
+        // Сохраняем для других вкладок
+        if (broadcast) {
+            localStorage.setItem('cart_count', count);
+            localStorage.setItem('cart_updated', Date.now());
+        }
+    }
+
+    // Всплывающее уведомление в углу экрана, скрывается через 3 секунды
+    function showNotification(message, type = 'success') {
+        const notification = document.createElement('div');
+        notification.className = `alert ${type === 'success' ? 'alert-success' : 'alert-danger'} alert-dismissible fade show fixed-notification`;
+        notification.innerHTML = `
+            ${message}
+            <button type="button" class="btn-close" data-bs-dismiss="alert"></button>
+        `;
+        document.body.appendChild(notification);
+        setTimeout(() => notification.remove(), 3000);
+    }
+
+    // POST на адрес корзины с AJAX-заголовками; ответ - JSON
+    function postJSON(url, body) {
+        return fetch(url, {
+            method: 'POST',
+            body: body,
+            headers: {
+                'X-CSRFToken': getCSRFToken(),
+                'X-Requested-With': 'XMLHttpRequest'
+            }
+        }).then(response => response.json());
+    }
+
+    // Слушаем изменения корзины из других вкладок
+    window.addEventListener('storage', function (e) {
+        if (e.key === 'cart_updated') {
+            updateCartCounter(localStorage.getItem('cart_count'), false);
+        }
+    });
+
+    window.lk = {getCSRFToken, updateCartCounter, showNotification, postJSON};
+})();
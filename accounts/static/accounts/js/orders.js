@@ -0,0 +1,35 @@
+/*
+ * История заказов: подгрузка следующей страницы по курсору.
+ * Ответ эндпоинта: {html, next_cursor}; пустой курсор - страниц больше нет.
+ */
+(function () {
+    'use strict';
+
+    const button = document.getElementById('load-more-orders');
+    if (!button) {
+        return;
+    }
+
+    button.addEventListener('click', function (e) {
+        e.preventDefault();
+        button.disabled = true;
+
+        const url = new URL(button.dataset.url, window.location.origin);
+        url.searchParams.set('cursor', button.dataset.cursor);
+        fetch(url)
+            .then(r => r.json())
+            .then(data => {
+                document.getElementById('order-rows').insertAdjacentHTML('beforeend', data.html);
+                if (data.next_cursor) {
+                    button.dataset.cursor = data.next_cursor;
+                    button.disabled = false;
+                } else {
+                    button.remove();
+                }
+            })
+            .catch(err => {
+                console.error('❌ Ошибка подгрузки заказов:', err);
+                button.disabled = false;
+            });
+    });
+})();
@@ -0,0 +1,154 @@
+"""
+Проверка собранной статики (manage.py verify_static, шаг сборки после collectstatic).
+
+JS и CSS страниц лежат в accounts/static/accounts и подключаются через
+{% static %}. В продакшене хранилище - CompressedManifestStaticFilesStorage:
+имя каждого файла содержит хэш содержимого, поэтому WhiteNoise отдает их с
+бессрочным Cache-Control, а новая версия получает новое имя. Ошибки такой
+сборки проявляются только на продакшене ({% static %} с файлом, которого нет в
+манифесте, падает с ValueError на каждом запросе), поэтому проверяем при сборке:
+
+- каждый файл, на который ссылаются шаблоны, есть в манифесте и лежит в
+  STATIC_ROOT под именем с хэшем;
+- рядом лежит сжатая копия .gz (и .br, если установлен brotli), и она не
+  больше бюджета;
+- JS-файлы синтаксически корректны (node --check, если node установлен);
+- в шаблонах нет встроенных <script> без src: такой код уходит с каждым
+  HTML-ответом и не кэшируется браузером.
+"""
+import os
+import re
+import shutil
+import subprocess
+from dataclasses import dataclass, field
+
+# {% static 'accounts/js/cart.js' %}
+STATIC_TAG_RE = re.compile(r"""\{%\s*static\s+['"]([^'"]+)['"]""")
+# <script> без src (JSON-данные в <script type="application/json"> - не код, их пропускаем)
+INLINE_SCRIPT_RE = re.compile(r'<script(?![^>]*\b(?:src=|type=["\']application/(?:ld\+)?json))[^>]*>', re.I)
+
+DEFAULT_BUDGET_KB = 20
+
+
+def brotli_available():
+    try:
+        import brotli  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def template_files():
+    """Пути всех .html-шаблонов проекта (DIRS и templates/ приложений проекта)"""
+    from django.conf import settings
+    from django.template import engines
+    from django.template.utils import get_app_template_dirs
+
+    base_dir = str(settings.BASE_DIR)
+    paths = set()
+    for engine in engines.all():
+        directories = list(getattr(engine, 'dirs', [])) + list(get_app_template_dirs('templates'))
+        for directory in directories:
+            # Шаблоны установленных пакетов (admin и т.п.) - не наша забота
+            if not str(directory).startswith(base_dir):
+                continue
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    if filename.endswith('.html'):
+                        paths.add(os.path.realpath(os.path.join(root, filename)))
+    return sorted(paths)
+
+
+def template_references(paths):
+    """{имя статики: [шаблоны, где на нее ссылаются]}"""
+    references = {}
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            for name in STATIC_TAG_RE.findall(f.read()):
+                references.setdefault(name, []).append(path)
+    return references
+
+
+def inline_scripts(paths):
+    """[(шаблон, номер строки)] для каждого встроенного <script> без src"""
+    found = []
+    for path in paths:
+        with open(path, encoding='utf-8') as f:
+            content = f.read()
+        for match in INLINE_SCRIPT_RE.finditer(content):
+            found.append((path, content.count('\n', 0, match.start()) + 1))
+    return found
+
+
+@dataclass
+class StaticFileReport:
+    name: str
+    hashed_name: str
+    size: int
+    gzip_size: int | None = None
+    brotli_size: int | None = None
+    problems: list = field(default_factory=list)
+
+
+def _size(path):
+    return os.path.getsize(path) if os.path.exists(path) else None
+
+
+def check_file(storage, name, budget_bytes, node=None):
+    """Проверка одного файла из манифеста; None, если его в манифесте нет"""
+    hashed_name = storage.hashed_files.get(name)
+    if hashed_name is None:
+        return None
+    path = storage.path(hashed_name)
+    report = StaticFileReport(name=name, hashed_name=hashed_name, size=_size(path) or 0)
+    if not os.path.exists(path):
+        report.problems.append(f"нет файла {hashed_name} в STATIC_ROOT")
+        return report
+
+    report.gzip_size = _size(f"{path}.gz")
+    report.brotli_size = _size(f"{path}.br")
+    if report.gzip_size is None:
+        report.problems.append("нет сжатой копии .gz")
+    elif report.gzip_size > budget_bytes:
+        report.problems.append(f"{report.gzip_size / 1024:.1f} КБ в gzip - больше бюджета {budget_bytes / 1024:.0f} КБ")
+    if report.brotli_size is None and brotli_available():
+        report.problems.append("нет сжатой копии .br")
+
+    if node and name.endswith('.js'):
+        result = subprocess.run([node, '--check', path], capture_output=True, text=True)
+        if result.returncode:
+            report.problems.append(f"синтаксическая ошибка: {result.stderr.strip().splitlines()[-1]}")
+    return report
+
+
+def verify(storage=None, budget_kb=DEFAULT_BUDGET_KB):
+    """
+    Проверить статику, на которую ссылаются шаблоны.
+    Возвращает (отчеты по файлам, список проблем); пустой список - сборка в порядке.
+    """
+    from django.contrib.staticfiles.storage import ManifestFilesMixin, staticfiles_storage
+
+    storage = storage or staticfiles_storage
+    if not isinstance(storage, ManifestFilesMixin):
+        return [], [
+            f"хранилище {storage.__class__.__name__} без манифеста: имена файлов без хэша "
+            f"нельзя кэшировать бессрочно (включите STATIC_MANIFEST=True)"
+        ]
+    if not storage.hashed_files:
+        return [], [f"манифест {storage.manifest_name} пуст или не найден - сначала collectstatic"]
+
+    paths = template_files()
+    node = shutil.which('node')
+    reports, problems = [], []
+    for name, templates in sorted(template_references(paths).items()):
+        report = check_file(storage, name, budget_kb * 1024, node=node)
+        if report is None:
+            used_in = ', '.join(sorted({os.path.basename(path) for path in templates}))
+            problems.append(f"{name}: нет в манифесте (используется в {used_in})")
+            continue
+        reports.append(report)
+        problems.extend(f"{name}: {problem}" for problem in report.problems)
+
+    for path, line in inline_scripts(paths):
+        problems.append(f"{os.path.relpath(path)}:{line}: встроенный <script> - вынесите код в static")
+    return reports, problems
@@ -0,0 +1,34 @@
+"""
+Бэкенд шаблонов Django с замером времени рендеринга (см. instrumentation.py).
+Вложенные {% include %} рендерятся внутри родительского шаблона и входят в его время.
+"""
+import time
+
+from django.template.backends.django import DjangoTemplates
+
+from .instrumentation import add_template_time
+
+
+class TimedTemplate:
+    """Обертка шаблона бэкенда: render() добавляет свое время к счетчикам запроса"""
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        started = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            add_template_time(time.perf_counter() - started)
+
+
+class InstrumentedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
@@ -0,0 +1,57 @@
+"""
+{% fragment_cache %} - кэш фрагмента шаблона, в котором есть формы с {% csrf_token %}.
+
+Встроенный {% cache %} сохранил бы CSRF-токен первого посетителя, и формы
+остальных не прошли бы проверку. Здесь перед сохранением токен текущего
+запроса заменяется меткой, а при выдаче из кэша метка заменяется токеном
+нового запроса - карточка товара кэшируется целиком, вместе с формой.
+
+    {% load fragments %}
+    {% fragment_cache product_card product.id product.version product.available_stock %}
+        ...
+    {% endfragment_cache %}
+
+Ключ - имя фрагмента и значения переменных (как у {% cache %}); срок жизни -
+catalog_utils.FRAGMENT_CACHE_TIMEOUT.
+"""
+from django import template
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+
+from ..catalog_utils import FRAGMENT_CACHE_TIMEOUT
+
+register = template.Library()
+
+CSRF_PLACEHOLDER = '__fragment_csrf_token__'
+
+
+class FragmentCacheNode(template.Node):
+    def __init__(self, nodelist, fragment_name, vary_on):
+        self.nodelist = nodelist
+        self.fragment_name = fragment_name
+        self.vary_on = vary_on
+
+    def render(self, context):
+        token = context.get('csrf_token')
+        token = str(token) if token else ''
+        if not token or token == 'NOTPROVIDED':
+            # Без запроса (render_to_string без request) токена нет - такой вывод не кэшируем
+            return self.nodelist.render(context)
+
+        key = make_template_fragment_key(self.fragment_name, [var.resolve(context) for var in self.vary_on])
+        value = cache.get(key)
+        if value is None:
+            value = self.nodelist.render(context)
+            cache.set(key, value.replace(token, CSRF_PLACEHOLDER), FRAGMENT_CACHE_TIMEOUT)
+            return value
+        return value.replace(CSRF_PLACEHOLDER, token)
+
+
+@register.tag('fragment_cache')
+def do_fragment_cache(parser, token):
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError(f"'{bits[0]}' требует имя фрагмента")
+    return FragmentCacheNode(nodelist, bits[1], [parser.compile_filter(bit) for bit in bits[2:]])
@@ -1,3 +1,1338 @@
+from decimal import Decimal
+
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .models import Cart, CartItem, Category, CustomUser, Order, OrderItem, Product
+
+
+class QueryBudgetTests(TestCase):
+    """Число запросов страниц с позициями не должно расти с количеством строк (N+1)"""
+
+    # Запас на сессию, пользователя, корзину в шапке и т.п.
+    PAGE_QUERY_BUDGET = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('buyer', password='secret')
+        category = Category.objects.create(name='Стройматериалы')
+        cls.products = Product.objects.bulk_create([
+            Product(category=category, name=f'Товар {i}', sku=f'SKU-{i}', price=Decimal('10.50'), stock=100)
+            for i in range(40)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def make_order(self, lines):
+        order = Order.objects.create(user=self.user, status='pending')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=2, price=product.price)
+            for product in self.products[:lines]
+        ])
+        return order
+
+    def fill_cart(self, lines):
+        cart, _ = Cart.objects.get_or_create(user=self.user)
+        cart.items.all().delete()
+        CartItem.objects.bulk_create([
+            CartItem(cart=cart, product=product, quantity=1) for product in self.products[:lines]
+        ])
+        Cart.objects.filter(pk=cart.pk).update(items_count=lines, subtotal=Decimal('10.50') * lines)
+
+    def test_order_detail_queries_do_not_depend_on_lines(self):
+        small = self.count_queries(reverse('order_detail', args=[self.make_order(1).pk]))
+        large = self.count_queries(reverse('order_detail', args=[self.make_order(40).pk]))
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, self.PAGE_QUERY_BUDGET)
+
+    def test_checkout_queries_do_not_depend_on_lines(self):
+        self.fill_cart(1)
+        small = self.count_queries(reverse('checkout_from_cart'))
+        self.fill_cart(40)
+        large = self.count_queries(reverse('checkout_from_cart'))
+        self.assertEqual(small, large)
+        self.assertLessEqual(large, self.PAGE_QUERY_BUDGET)
+
+    def test_order_detail_line_totals(self):
+        order = self.make_order(3)
+        response = self.client.get(reverse('order_detail', args=[order.pk]))
+        self.assertEqual([item.line_total for item in response.context['items']], [Decimal('21.00')] * 3)
+
+
+def seed_dataset(user, prefix, categories=5, products_per_category=20, orders=5, lines_per_order=10):
+    """Каталог с подкатегориями, заказы пользователя с позициями и корзина"""
+    root = Category.objects.create(name=f'{prefix} Стройматериалы')
+    created = [Category.objects.create(name=f'{prefix} Категория {i}', parent=root) for i in range(categories)]
+    products = Product.objects.bulk_create([
+        Product(
+            category=category, name=f'{prefix} Товар {i}-{j}', sku=f'{prefix}-{i}-{j}',
+            price=Decimal('100.00'), stock=50, is_popular=(j % 5 == 0),
+        )
+        for i, category in enumerate(created)
+        for j in range(products_per_category)
+    ])
+    for _ in range(orders):
+        order = Order.objects.create(user=user, status='pending')
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, price=product.price)
+            for product in products[:lines_per_order]
+        ])
+    cart, _ = Cart.objects.get_or_create(user=user)
+    CartItem.objects.bulk_create([
+        CartItem(cart=cart, product=product, quantity=1)
+        for product in products[:lines_per_order]
+    ], ignore_conflicts=True)
+    Cart.objects.filter(pk=cart.pk).update(
+        items_count=CartItem.objects.filter(cart=cart).count(),
+        subtotal=Decimal('100.00') * CartItem.objects.filter(cart=cart).count(),
+    )
+    return created, products
+
+
+class ViewBudgetTests(TestCase):
+    """
+    Бюджет запросов и времени рендеринга для страниц сайта.
+    Число запросов не должно зависеть от объема данных: замер повторяется
+    после того, как каталог, заказы и корзина вырастают в несколько раз.
+    """
+
+    # Максимум времени ответа одной страницы (мс) - с большим запасом для медленных машин
+    RENDER_TIME_CEILING_MS = 2000
+
+    # Маршрут -> максимум SQL-запросов (сессия, пользователь и корзина в шапке входят)
+    QUERY_BUDGETS = {
+        'home': 7,  # данные из кэша + доступный остаток показываемых товаров
+        'catalog': 7,
+        'catalog_subtree': 6,
+        'catalog_more': 1,
+        'search': 7,
+        'cart': 4,
+        'checkout': 4,
+        'orders': 4,
+        'orders_feed': 3,
+        'order_detail': 5,
+        'dashboard': 5,
+        'cart_count': 3,
+    }
+
+    # AJAX-действия с корзиной: savepoint-ы транзакции, проверка остатка, пересчет итогов и резервов
+    CART_ACTION_BUDGET = 12
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('budget', password='secret')
+        cls.categories, cls.products = seed_dataset(cls.user, 'A')
+
+    def setUp(self):
+        from django.core.cache import cache
+        from . import category_tree
+        # Кэши между тестами не переносим: замеряется путь с заполнением кэша
+        cache.clear()
+        category_tree._state['tree'] = None
+        self.client.force_login(self.user)
+
+    def urls(self):
+        from .catalog_utils import encode_product_cursor
+        order = Order.objects.filter(user=self.user).order_by('-id').first()
+        category = self.categories[0]
+        # "Показать ещё" после первой порции каталога
+        shown = Product.objects.filter(category=category).order_by('name', 'id')[11]
+        return {
+            'home': reverse('home'),
+            'catalog': reverse('catalog'),
+            'catalog_subtree': reverse('catalog') + f'?category={category.parent_id}',
+            'catalog_more': reverse('catalog_category_products', args=[category.pk]) + f'?cursor={encode_product_cursor(shown)}',
+            'search': reverse('product_search') + '?q=Товар',
+            'cart': reverse('cart_view'),
+            'checkout': reverse('checkout_from_cart'),
+            'orders': reverse('order_list'),
+            'orders_feed': reverse('order_list_feed'),
+            'order_detail': reverse('order_detail', args=[order.pk]),
+            'dashboard': reverse('dashboard'),
+            'cart_count': reverse('get_cart_count'),
+        }
+
+    def test_load_more_walks_category_by_cursor(self):
+        """Курсор "Показать ещё" проходит категорию без пропусков и повторов"""
+        from .catalog_utils import get_category_chunk
+        category = self.categories[0]
+        expected = list(
+            Product.objects.filter(category=category, stock__gt=0).order_by('name', 'id').values_list('id', flat=True)
+        )
+        seen, cursor = [], None
+        while True:
+            products, cursor = get_category_chunk(category.pk, cursor, limit=5)
+            seen += [product.id for product in products]
+            if cursor is None:
+                break
+        self.assertEqual(seen, expected)
+
+    def measure(self):
+        """{маршрут: (число запросов, время мс)}"""
+        import time
+        from django.core.cache import cache
+        results = {}
+        for name, url in self.urls().items():
+            cache.clear()
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                response = self.client.get(url)
+                elapsed = (time.perf_counter() - started) * 1000
+            self.assertEqual(response.status_code, 200, url)
+            results[name] = (len(queries), elapsed)
+        return results
+
+    def test_views_within_budget(self):
+        for name, (queries, elapsed) in self.measure().items():
+            with self.subTest(view=name):
+                self.assertLessEqual(queries, self.QUERY_BUDGETS[name])
+                self.assertLess(elapsed, self.RENDER_TIME_CEILING_MS)
+
+    def test_query_counts_do_not_grow_with_data(self):
+        before = self.measure()
+        # Кэши сбрасываются после фиксации транзакции - выполняем эти колбэки
+        with self.captureOnCommitCallbacks(execute=True):
+            seed_dataset(self.user, 'B', categories=15, products_per_category=40, orders=20, lines_per_order=60)
+        after = self.measure()
+        for name in before:
+            with self.subTest(view=name):
+                self.assertEqual(before[name][0], after[name][0])
+
+    def test_cart_ajax_endpoints_within_budget(self):
+        product = self.products[-1]
+        headers = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('add_to_cart', args=[product.pk]), {'quantity': 1}, **headers)
+        self.assertTrue(response.json()['success'])
+        self.assertLessEqual(len(queries), self.CART_ACTION_BUDGET)
+
+        item = CartItem.objects.get(cart__user=self.user, product=product)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('update_cart_item', args=[item.pk]), {'quantity': 2}, **headers)
+        self.assertTrue(response.json()['success'])
+        self.assertLessEqual(len(queries), self.CART_ACTION_BUDGET)
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('remove_from_cart', args=[item.pk]), **headers)
+        self.assertTrue(response.json()['success'])
+        self.assertLessEqual(len(queries), self.CART_ACTION_BUDGET)
+
+
+class PerformanceMetricsTests(TestCase):
+    """Статистика /metrics/ обнуляется только POST-запросом с CSRF-токеном"""
+
+    def setUp(self):
+        from django.test import Client
+        self.client = Client(enforce_csrf_checks=True)
+        self.client.force_login(CustomUser.objects.create_user('staff', password='secret', is_staff=True))
+        self.client.get(reverse('home'))
+
+    def routes(self, response):
+        self.assertEqual(response.status_code, 200)
+        return response.json()['routes']
+
+    def test_get_does_not_reset(self):
+        self.assertTrue(self.routes(self.client.get(reverse('performance_metrics') + '?reset=1')))
+        self.assertTrue(self.routes(self.client.get(reverse('performance_metrics'))))
+
+    def test_post_resets_with_csrf_token(self):
+        self.assertEqual(self.client.post(reverse('performance_metrics')).status_code, 403)
+        # Токен из cookie, выставленной главной страницей (формы корзины)
+        response = self.client.post(
+            reverse('performance_metrics'), HTTP_X_CSRFTOKEN=self.client.cookies['csrftoken'].value,
+        )
+        self.assertEqual(self.routes(response), [])
+
+
+class ProductFragmentCacheTests(TestCase):
+    """Закэшированные карточки товаров: актуальны после изменений и с CSRF-токеном каждого посетителя"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Сухие смеси')
+        cls.product = Product.objects.create(
+            category=category, name='Цемент М500', sku='CEM-500', price=Decimal('123.45'), stock=20,
+        )
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def csrf_from_card(self, response):
+        import re
+        form = re.search(
+            rf'id="form-{self.product.pk}">.*?name="csrfmiddlewaretoken" value="([^"]+)"',
+            response.content.decode(), re.S,
+        )
+        return form.group(1)
+
+    def test_card_shows_new_price_after_save(self):
+        self.assertContains(self.client.get(reverse('catalog')), '123,45')
+        self.product.price = Decimal('150.50')
+        self.product.save()
+        response = self.client.get(reverse('catalog'))
+        self.assertContains(response, '150,50')
+        self.assertNotContains(response, '123,45')
+
+    def test_card_shows_new_stock_after_bulk_update(self):
+        self.assertContains(self.client.get(reverse('catalog')), 'В наличии: 20')
+        # Списание при оформлении заказа идет UPDATE'ом, без Product.save
+        Product.objects.filter(pk=self.product.pk).update(stock=3)
+        self.assertContains(self.client.get(reverse('catalog')), 'Мало: 3')
+
+    def test_cached_card_carries_each_visitors_csrf_token(self):
+        from django.test import Client
+        for _ in range(2):
+            client = Client(enforce_csrf_checks=True)
+            token = self.csrf_from_card(client.get(reverse('catalog')))
+            response = client.post(
+                reverse('add_to_cart', args=[self.product.pk]),
+                {'quantity': 1, 'csrfmiddlewaretoken': token},
+            )
+            self.assertEqual(response.status_code, 302)
+
+
+class StaticAssetsTests(TestCase):
+    """JS страниц - во внешних файлах; сборка с манифестом проходит verify_static"""
+
+    def test_pages_have_no_inline_scripts(self):
+        from .static_assets import INLINE_SCRIPT_RE
+        user = CustomUser.objects.create_user(username='static_client', password='pass12345')
+        self.client.force_login(user)
+        for url in (reverse('home'), reverse('catalog'), reverse('order_list')):
+            content = self.client.get(url).content.decode()
+            self.assertIn('accounts/js/cart.js', content)
+            self.assertIsNone(INLINE_SCRIPT_RE.search(content), url)
+
+    def test_collected_bundles_pass_verification(self):
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import CommandError, call_command
+        from django.test import override_settings
+
+        with tempfile.TemporaryDirectory() as static_root, override_settings(
+            STATIC_ROOT=static_root,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage'},
+            },
+        ):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            call_command('verify_static', stdout=StringIO())
+
+            # Сжатая копия пропала - сборка не проходит
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            os.remove(staticfiles_storage.path(staticfiles_storage.stored_name('accounts/js/cart.js')) + '.gz')
+            with self.assertRaises(CommandError):
+                call_command('verify_static', stdout=StringIO(), stderr=StringIO())
+
+
+class SharedCacheCheckTests(TestCase):
+    """check --deploy не пропускает кэш в памяти процесса"""
+
+    def test_process_local_cache_fails_deploy_check(self):
+        from django.test import override_settings
+        from .checks import check_shared_cache
+
+        with override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}):
+            self.assertEqual([error.id for error in check_shared_cache(None)], ['accounts.E001'])
+
+    def test_shared_cache_passes_deploy_check(self):
+        import tempfile
+        from django.test import override_settings
+        from .checks import check_shared_cache
+
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+        }):
+            self.assertEqual(check_shared_cache(None), [])
+
+
+class HotQueriesTests(TestCase):
+    """check_query_indexes проверяет SQL, который на самом деле выполняют горячие страницы"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='hot', password='pass')
+        seed_dataset(cls.user, 'H')
+
+    def test_captures_queries_of_hot_views(self):
+        from .hot_queries import HOT_VIEWS, capture_hot_queries
+
+        queries = capture_hot_queries()
+        views = {view for names in queries.values() for view in names}
+        self.assertEqual(views, set(HOT_VIEWS))
+        # Запросы, которые обычно закрыты кэшем, тоже попадают в проверку
+        self.assertTrue(any('EXISTS' in sql and 'accounts_category' in sql for sql in queries))
+        self.assertTrue(any('ROW_NUMBER' in sql for sql in queries))
+
+    def test_flags_full_table_and_index_scans(self):
+        from .hot_queries import check_hot_queries
+
+        results = check_hot_queries({
+            'SELECT COUNT(*) FROM "accounts_product"': ['count'],
+            'SELECT "id" FROM "accounts_product" WHERE "stock" > 0 ORDER BY "created_at" DESC': ['all_new'],
+            'SELECT "id" FROM "accounts_product" WHERE "stock" > 0 ORDER BY "created_at" DESC LIMIT 8': ['top_new'],
+        }, min_rows=1)
+        scans = {query.views[0]: [how for _, how, _ in query.scans] for query in results}
+        self.assertEqual(scans['count'][0].split()[-1], 'целиком')
+        self.assertEqual(scans['all_new'], ['индекс product_new_idx целиком'])
+        # Чтение индекса по порядку до LIMIT - не полный просмотр
+        self.assertEqual(scans['top_new'], [])
+
+
+class ProductSearchTests(TestCase):
+    """Поиск на сайте: морфология, ранжирование, точный артикул"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Сухие смеси')
+
+        def product(sku, name, description=''):
+            return Product.objects.create(category=category, sku=sku, name=name, description=description,
+                                          price=Decimal('100.00'), stock=10)
+
+        cls.in_description = product('MIX-1', 'Смесь монтажная', 'Подходит для цемента и бетона')
+        cls.in_name = product('CEM-1', 'Цемент М500')
+        cls.other = product('BR-1', 'Кирпич красный')
+
+    def search(self, query):
+        response = self.client.get(reverse('product_search'), {'q': query})
+        self.assertEqual(response.status_code, 200)
+        return response.context['products']
+
+    def test_name_match_ranks_above_description(self):
+        # "цементы" находит и "Цемент", и "цемента" в описании
+        self.assertEqual(self.search('цементы'), [self.in_name, self.in_description])
+
+    def test_exact_sku_returns_single_product(self):
+        self.assertEqual(self.search('CEM-1'), [self.in_name])
+
+    def test_empty_and_unmatched_queries(self):
+        self.assertEqual(self.search(''), [])
+        self.assertEqual(self.search('гипсокартон'), [])
+
+
+class AdminProductSearchTests(TestCase):
+    """Поиск товаров в админке: все совпадения, без лимита витрины, и часть артикула"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='admin_search', password='pass')
+        seed_dataset(cls.user, 'A', categories=4, products_per_category=20)
+
+    def search(self, term):
+        from django.contrib import admin
+
+        model_admin = admin.site._registry[Product]
+        queryset, may_have_duplicates = model_admin.get_search_results(None, Product.objects.all(), term)
+        self.assertFalse(may_have_duplicates)
+        return queryset
+
+    def test_returns_every_match(self):
+        from .search import SEARCH_LIMIT
+
+        self.assertGreater(Product.objects.count(), SEARCH_LIMIT)
+        self.assertEqual(self.search('Товар').count(), Product.objects.count())
+
+    def test_matches_part_of_sku(self):
+        category = Category.objects.first()
+        product = Product.objects.create(category=category, name='Цемент', sku='CM500D25', price=Decimal('1.00'))
+        # Полнотекстовый индекс ищет слово по началу, середину артикула находит только вхождение
+        self.assertEqual(list(self.search('500D')), [product])
+        # Короче трех символов (триграммный индекс не работает) - только точный артикул
+        self.assertEqual(list(self.search('0D')), [])
+
+
+class ReservedStockTests(TestCase):
+    """Главная и каталог показывают доступный остаток: резервы чужих корзин вычитаются"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from django.utils import timezone
+        from datetime import timedelta
+        category = Category.objects.create(name='Кровля')
+        cls.reserved = Product.objects.create(
+            category=category, name='Профлист С8', sku='PRO-C8', price=Decimal('500'), stock=5, is_popular=True,
+        )
+        cls.partial = Product.objects.create(
+            category=category, name='Профлист С20', sku='PRO-C20', price=Decimal('650'), stock=10, is_popular=True,
+        )
+        other = CustomUser.objects.create_user(username='reserver', password='pass12345')
+        cart = Cart.objects.create(user=other)
+        until = timezone.now() + timedelta(minutes=10)
+        CartItem.objects.create(cart=cart, product=cls.reserved, quantity=5, reserved_until=until)
+        CartItem.objects.create(cart=cart, product=cls.partial, quantity=7, reserved_until=until)
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+
+    def test_home_hides_fully_reserved_and_shows_available(self):
+        response = self.client.get(reverse('home'))
+        self.assertNotContains(response, 'Профлист С8<')
+        self.assertContains(response, 'В наличии: 3')
+        self.assertContains(response, 'max="3"')
+
+    def test_catalog_hides_fully_reserved_products(self):
+        response = self.client.get(reverse('catalog'))
+        self.assertNotContains(response, 'PRO-C8')
+        self.assertContains(response, 'PRO-C20')
+
+
+class FixtureStreamTests(TestCase):
+    """Очистка дампа: кодировка определяется сама, сбой не портит прежний результат"""
+
+    def setUp(self):
+        import tempfile
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def path(self, name):
+        import os
+        return os.path.join(self.directory.name, name)
+
+    def test_failed_write_keeps_previous_output(self):
+        import os
+        from .fixture_stream import write_fixture
+
+        output = self.path('filtered.json')
+        write_fixture(output, [{'model': 'accounts.category', 'pk': 1, 'fields': {}}])
+
+        def broken_records():
+            yield {'model': 'accounts.category', 'pk': 2, 'fields': {}}
+            raise UnicodeDecodeError('utf-8', b'\xc0', 0, 1, 'invalid start byte')
+
+        with self.assertRaises(UnicodeDecodeError):
+            write_fixture(output, broken_records())
+        with open(output, encoding='utf-8') as fp:
+            self.assertIn('"pk": 1', fp.read())
+        self.assertEqual(os.listdir(self.directory.name), ['filtered.json'])
+
+    def test_cp1251_dump_is_detected(self):
+        import json
+        from io import StringIO
+        from django.core.management import call_command
+
+        source, output = self.path('backup.json'), self.path('filtered.json')
+        records = [{'model': 'accounts.category', 'pk': 1, 'fields': {'name': 'Кирпич'}}]
+        with open(source, 'w', encoding='cp1251') as fp:
+            json.dump(records, fp, ensure_ascii=False)
+
+        call_command('filterdump', source, output, stdout=StringIO())
+        with open(output, encoding='utf-8') as fp:
+            self.assertEqual(json.load(fp), records)
+
+    def test_bulk_loaddata_round_trip(self):
+        """Даты из дампа, порядок по ключам (и ссылки на себя), обновление существующих pk, M2M"""
+        import datetime
+        from contextlib import redirect_stdout
+        from io import StringIO
+        from django.contrib.auth.models import Group
+        from django.core.management import call_command
+        from .fixture_stream import write_fixture
+
+        old = '2020-01-01T00:00:00Z'
+        Category.objects.create(pk=901, name='Старое название')
+        path = self.path('dump.json')
+        write_fixture(path, [
+            # Заказ раньше пользователя, подкатегория раньше родителя
+            {'model': 'accounts.order', 'pk': 905, 'fields': {
+                'user': 903, 'order_number': 'ORD-20200101-0001', 'status': 'delivered',
+                'total_amount': '100.00', 'created_at': old, 'updated_at': '2020-01-02T00:00:00Z',
+            }},
+            {'model': 'accounts.category', 'pk': 902, 'fields': {'name': 'Кирпич облицовочный', 'parent': 901}},
+            {'model': 'accounts.category', 'pk': 901, 'fields': {'name': 'Кирпич', 'parent': None}},
+            {'model': 'accounts.product', 'pk': 904, 'fields': {
+                'category': 902, 'name': 'Кирпич М150', 'sku': 'BR-150', 'price': '25.00', 'stock': 100,
+                'created_at': old,
+            }},
+            {'model': 'accounts.customuser', 'pk': 903, 'fields': {
+                'username': 'loaded', 'password': '!', 'groups': [906], 'date_joined': old,
+            }},
+            {'model': 'auth.group', 'pk': 906, 'fields': {'name': 'Менеджеры'}},
+        ])
+
+        # Вложенные команды тоже молчат при verbosity=0
+        with redirect_stdout(StringIO()) as nested_output:
+            call_command('bulk_loaddata', path, verbosity=0, stdout=StringIO())
+        self.assertEqual(nested_output.getvalue(), '')
+
+        moment = datetime.datetime(2020, 1, 1, tzinfo=datetime.timezone.utc)
+        order = Order.objects.get(pk=905)
+        self.assertEqual((order.created_at, order.updated_at), (moment, moment + datetime.timedelta(days=1)))
+        self.assertEqual(Product.objects.get(pk=904).created_at, moment)
+        self.assertEqual(Category.objects.get(pk=901).name, 'Кирпич')
+        child = Category.objects.get(pk=902)
+        self.assertEqual((child.parent_id, child.path), (901, Category.objects.get(pk=901).path + Category.path_segment(902)))
+        self.assertEqual(list(CustomUser.objects.get(pk=903).groups.all()), [Group.objects.get(pk=906)])
+
+
+class PriceImportTests(TestCase):
+    """Неверные числа в прайс-листе - ошибки отдельных строк, остальные строки загружаются"""
+
+    def test_non_finite_and_out_of_range_values_are_row_errors(self):
+        from .price_import import PriceListImporter
+
+        Category.objects.create(name='Цемент')
+        rows = [
+            {'sku': 'OK-1', 'name': 'Цемент М500', 'price': '450,50', 'stock': '10', 'category': 'Цемент'},
+            {'sku': 'BAD-1', 'name': 'Цемент', 'price': 'Infinity', 'stock': '1', 'category': 'Цемент'},
+            {'sku': 'BAD-2', 'name': 'Цемент', 'price': 'NaN', 'stock': '1', 'category': 'Цемент'},
+            {'sku': 'BAD-3', 'name': 'Цемент', 'price': '1', 'stock': 'inf', 'category': 'Цемент'},
+            {'sku': 'BAD-4', 'name': 'Цемент', 'price': '1', 'stock': 'nan', 'category': 'Цемент'},
+            {'sku': 'BAD-5', 'name': 'Цемент', 'price': '1e12', 'stock': '1', 'category': 'Цемент'},
+            {'sku': 'BAD-6', 'name': 'Цемент', 'price': '1', 'stock': '1e20', 'category': 'Цемент'},
+        ]
+        result = PriceListImporter().run(iter(rows))
+        self.assertEqual(len(result.errors), 6)
+        self.assertEqual(list(Product.objects.values_list('sku', 'price', 'stock')), [('OK-1', Decimal('450.50'), 10)])
+
+    def test_long_values_are_row_errors(self):
+        from .price_import import PriceListImporter
+
+        result = PriceListImporter().run(iter([
+            {'sku': 'LONG-1', 'name': 'Ц' * 301, 'price': '1'},
+            {'sku': 'L' * 101, 'name': 'Цемент', 'price': '1'},
+            {'sku': 'LONG-3', 'name': 'Цемент', 'price': '1', 'category': 'К' * 201},
+            {'sku': 'OK-2', 'name': 'Цемент', 'price': '1', 'category': 'Цемент'},
+        ]))
+        self.assertEqual(len(result.errors), 3)
+        self.assertEqual(list(Product.objects.values_list('sku', flat=True)), ['OK-2'])
+
+
+class AdminPriceImportTests(TestCase):
+    """Загрузка прайс-листа в админке: выгрузка Excel в cp1251 и битый файл - не ошибка 500"""
+
+    def setUp(self):
+        self.client.force_login(CustomUser.objects.create_superuser('importer', password='secret'))
+
+    def upload(self, name, content):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return self.client.post(reverse('admin:accounts_product_import'), {
+            'file': SimpleUploadedFile(name, content),
+        })
+
+    def messages(self, response):
+        return [str(message) for message in response.context['messages']]
+
+    def test_cp1251_csv_is_imported(self):
+        content = 'Артикул;Наименование;Цена;Остаток;Категория\nCM-500;Цемент М500;450,50;10;Сухие смеси\n'
+        response = self.upload('prices.csv', content.encode('cp1251'))
+        self.assertEqual(response.status_code, 200)
+        product = Product.objects.get(sku='CM-500')
+        self.assertEqual((product.name, product.category.name), ('Цемент М500', 'Сухие смеси'))
+
+    def test_corrupt_xlsx_is_form_error(self):
+        response = self.upload('prices.xlsx', b'not a zip archive')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('XLSX' in message for message in self.messages(response)))
+        self.assertFalse(Product.objects.exists())
+
+
+class CategoryTreeTests(TestCase):
+    """Материализованный путь категорий и кэш дерева"""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from . import category_tree
+        cache.clear()
+        category_tree._state['tree'] = None
+        self.root = Category.objects.create(name='Стройматериалы')
+        self.mixes = Category.objects.create(name='Сухие смеси', parent=self.root)
+        self.plaster = Category.objects.create(name='Штукатурки', parent=self.mixes)
+        self.tools = Category.objects.create(name='Инструмент')
+
+    def path(self, *categories):
+        return ''.join(Category.path_segment(category.pk) for category in categories)
+
+    def test_path_and_depth(self):
+        self.plaster.refresh_from_db()
+        self.assertEqual((self.plaster.path, self.plaster.depth), (self.path(self.root, self.mixes, self.plaster), 2))
+        self.assertEqual(self.plaster.ancestor_ids(), [self.root.pk, self.mixes.pk])
+        self.assertEqual(list(self.root.descendants()), [self.mixes, self.plaster])
+        self.assertEqual(list(self.mixes.descendants(include_self=True)), [self.mixes, self.plaster])
+
+    def test_move_rewrites_subtree(self):
+        self.mixes.parent = self.tools
+        self.mixes.save()
+        self.plaster.refresh_from_db()
+        self.assertEqual((self.plaster.path, self.plaster.depth), (self.path(self.tools, self.mixes, self.plaster), 2))
+        self.assertEqual(list(self.root.descendants()), [])
+        self.assertEqual(list(self.tools.descendants()), [self.mixes, self.plaster])
+
+        # В корень: глубина поддерева уменьшается
+        self.mixes.parent = None
+        self.mixes.save()
+        self.plaster.refresh_from_db()
+        self.assertEqual((self.plaster.path, self.plaster.depth), (self.path(self.mixes, self.plaster), 1))
+
+    def test_move_into_own_subtree_is_rejected(self):
+        self.mixes.parent = self.plaster
+        with self.assertRaises(ValueError):
+            self.mixes.save()
+
+    def test_tree_version_changes_after_commit(self):
+        from .cache_utils import get_version
+        from .category_tree import NAMESPACE, get_category_tree
+
+        self.assertEqual(get_category_tree().full_name(self.plaster.pk), 'Стройматериалы / Сухие смеси / Штукатурки')
+        version = get_version(NAMESPACE)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.mixes.name = 'Смеси'
+            self.mixes.save()
+            # До фиксации новое дерево еще не видно: версия прежняя
+            self.assertEqual(get_version(NAMESPACE), version)
+        self.assertNotEqual(get_version(NAMESPACE), version)
+        self.assertEqual(get_category_tree().full_name(self.plaster.pk), 'Стройматериалы / Смеси / Штукатурки')
+
+
+class OrderNumberTests(TestCase):
+    """Номера заказов ORD-yymmdd-NNNN из счетчика на день"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('numbers', password='secret')
+
+    def setUp(self):
+        from . import order_numbers
+        self.addCleanup(order_numbers._block.update, day=None, next=1, last=0)
+
+    def create_order(self):
+        return Order.objects.create(user=self.user, status='pending').order_number
+
+    def on_day(self, day):
+        from unittest import mock
+        return mock.patch('accounts.order_numbers.timezone.localdate', return_value=day)
+
+    def test_numbers_are_sequential_within_a_day(self):
+        import datetime
+        day = datetime.date(2026, 3, 14)
+        with self.on_day(day):
+            self.assertEqual([self.create_order() for _ in range(3)],
+                             ['ORD-260314-0001', 'ORD-260314-0002', 'ORD-260314-0003'])
+
+    def test_next_day_starts_from_one(self):
+        import datetime
+        from .models import OrderNumberCounter
+        with self.on_day(datetime.date(2026, 3, 14)):
+            self.create_order()
+            self.create_order()
+        with self.on_day(datetime.date(2026, 3, 15)):
+            self.assertEqual(self.create_order(), 'ORD-260315-0001')
+        self.assertEqual(
+            dict(OrderNumberCounter.objects.values_list('day', 'last_value')),
+            {datetime.date(2026, 3, 14): 2, datetime.date(2026, 3, 15): 1},
+        )
+
+    def test_block_reserves_several_numbers_with_one_update(self):
+        import datetime
+        from django.test import override_settings
+        from .models import OrderNumberCounter
+        day = datetime.date(2026, 3, 14)
+        with self.on_day(day), override_settings(ORDER_NUMBER_BLOCK_SIZE=3):
+            with self.captureOnCommitCallbacks(execute=True):
+                first = self.create_order()
+            counter = OrderNumberCounter.objects.get(day=day).last_value
+            with self.assertNumQueries(0):
+                from .order_numbers import allocate_order_number
+                rest = [allocate_order_number(), allocate_order_number()]
+            # Блок исчерпан - следующий номер из нового резерва
+            with self.captureOnCommitCallbacks(execute=True):
+                fourth = self.create_order()
+        self.assertEqual(counter, 3)
+        self.assertEqual([first, *rest, fourth],
+                         ['ORD-260314-0001', 'ORD-260314-0002', 'ORD-260314-0003', 'ORD-260314-0004'])
+        self.assertEqual(OrderNumberCounter.objects.get(day=day).last_value, 6)
+
+    def test_block_is_not_reused_after_rollback(self):
+        import datetime
+        from django.db import transaction
+        from django.test import override_settings
+        from .order_numbers import allocate_order_number
+        with self.on_day(datetime.date(2026, 3, 14)), override_settings(ORDER_NUMBER_BLOCK_SIZE=3):
+            with transaction.atomic():
+                self.assertEqual(allocate_order_number(), 'ORD-260314-0001')
+                transaction.set_rollback(True)
+            # Резерв откатился вместе с транзакцией, остаток блока не раздается
+            self.assertEqual(allocate_order_number(), 'ORD-260314-0001')
+
+    def test_counter_connection_is_closed_at_request_end(self):
+        from unittest import mock
+        from . import order_numbers
+        db = order_numbers.counter_connection()
+        self.addCleanup(db.close)
+        with mock.patch.object(db, 'close', wraps=db.close) as close:
+            self.client.get(reverse('home'))
+        close.assert_called_once_with()
+        self.assertIsNone(getattr(order_numbers._local, 'connection', None))
+
+
+class CheckoutTests(TestCase):
+    """Оформление заказа: остаток списывается условным UPDATE, склад не уходит в минус"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Утеплитель')
+        cls.last_unit = Product.objects.create(
+            category=category, name='Минвата 100 мм', sku='MW-100', price=Decimal('1200.00'), stock=1,
+        )
+        cls.plenty = Product.objects.create(
+            category=category, name='Пена монтажная', sku='FOAM-750', price=Decimal('450.00'), stock=20,
+        )
+        cls.first = CustomUser.objects.create_user('first', password='secret')
+        cls.second = CustomUser.objects.create_user('second', password='secret')
+
+    def make_cart(self, user, lines):
+        cart = Cart.objects.create(user=user)
+        for product, quantity in lines:
+            # Без резерва: обе корзины претендуют на один остаток
+            CartItem.objects.create(cart=cart, product=product, quantity=quantity)
+        Cart.objects.filter(pk=cart.pk).update(
+            items_count=sum(quantity for _, quantity in lines),
+            subtotal=sum(product.price * quantity for product, quantity in lines),
+        )
+        cart.refresh_from_db()
+        return cart
+
+    def test_last_unit_is_sold_once(self):
+        from .checkout import InsufficientStockError, place_order
+        first_cart = self.make_cart(self.first, [(self.last_unit, 1), (self.plenty, 2)])
+        second_cart = self.make_cart(self.second, [(self.last_unit, 1), (self.plenty, 3)])
+
+        order = place_order(first_cart, self.first)
+        with self.assertRaises(InsufficientStockError) as raised:
+            place_order(second_cart, self.second)
+
+        self.assertEqual(raised.exception.product, self.last_unit)
+        self.assertEqual((raised.exception.available, raised.exception.requested), (0, 1))
+        self.assertEqual(order.total_amount, Decimal('2100.00'))
+        self.assertEqual(list(Order.objects.values_list('user', flat=True)), [self.first.pk])
+        self.assertEqual(
+            dict(Product.objects.values_list('sku', 'stock')), {'MW-100': 0, 'FOAM-750': 18},
+        )
+        # Корзина первого очищена, корзина второго не тронута
+        first_cart.refresh_from_db()
+        second_cart.refresh_from_db()
+        self.assertEqual((first_cart.items_count, first_cart.items.count()), (0, 0))
+        self.assertEqual((second_cart.items_count, second_cart.subtotal), (4, Decimal('2550.00')))
+        self.assertEqual(
+            sorted(second_cart.items.values_list('product__sku', 'quantity')), [('FOAM-750', 3), ('MW-100', 1)],
+        )
+
+    def test_conditional_update_rolls_back_when_stock_is_gone(self):
+        """Остаток ушел между проверкой и списанием: UPDATE с stock >= qty не списывает ничего"""
+        from unittest import mock
+        from django.db.models import Value
+        from .checkout import InsufficientStockError, place_order
+        cart = self.make_cart(self.first, [(self.plenty, 2), (self.last_unit, 2)])
+
+        def stale_availability(queryset, exclude_cart=None):
+            return queryset.annotate(available=Value(100))
+
+        with mock.patch('accounts.checkout.with_availability', stale_availability):
+            with self.assertRaises(InsufficientStockError) as raised:
+                place_order(cart, self.first)
+
+        self.assertEqual(raised.exception.product, self.last_unit)
+        self.assertEqual((raised.exception.available, raised.exception.requested), (1, 2))
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(OrderItem.objects.exists())
+        self.assertEqual(dict(Product.objects.values_list('sku', 'stock')), {'MW-100': 1, 'FOAM-750': 20})
+        self.assertEqual(cart.items.count(), 2)
+
+    def test_empty_cart_is_rejected(self):
+        from .checkout import EmptyCartError, place_order
+        with self.assertRaises(EmptyCartError):
+            place_order(Cart.objects.create(user=self.first), self.first)
+        self.assertFalse(Order.objects.exists())
+
+
+class CartReservationTests(TestCase):
+    """Добавление в корзину не резервирует больше, чем есть на складе"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import timedelta
+        from django.utils import timezone
+        category = Category.objects.create(name='Пиломатериалы')
+        cls.product = Product.objects.create(
+            category=category, name='Брус 100x100', sku='BR-100', price=Decimal('800.00'), stock=10,
+        )
+        cls.buyer = CustomUser.objects.create_user('buyer', password='secret')
+        other = Cart.objects.create(user=CustomUser.objects.create_user('holder', password='secret'))
+        cls.other_item = CartItem.objects.create(
+            cart=other, product=cls.product, quantity=7, reserved_until=timezone.now() + timedelta(minutes=10),
+        )
+
+    def request(self):
+        from django.test import RequestFactory
+        request = RequestFactory().post('/')
+        request.user = self.buyer
+        return request
+
+    def test_add_within_available(self):
+        from .cart_utils import add_to_cart
+        self.assertEqual(add_to_cart(self.request(), self.product.pk, 3), (True, "Товар добавлен в корзину"))
+        self.assertEqual(add_to_cart(self.request(), self.product.pk, 1),
+                         (False, "Нельзя добавить больше 3 единиц товара"))
+        cart = Cart.objects.get(user=self.buyer)
+        self.assertEqual((cart.items_count, cart.subtotal), (3, Decimal('2400.00')))
+        self.assertIsNotNone(cart.items.get().reserved_until)
+
+    def test_reservations_exceeding_stock_leave_nothing_to_add(self):
+        from .cart_utils import add_to_cart
+        # Остаток уменьшился после резерва: резервы (7) больше склада (5)
+        Product.objects.filter(pk=self.product.pk).update(stock=5)
+        self.assertEqual(add_to_cart(self.request(), self.product.pk, 1),
+                         (False, "Недостаточно товара на складе. Доступно: 0"))
+        self.assertFalse(CartItem.objects.filter(cart__user=self.buyer).exists())
+
+    def test_update_cannot_raise_quantity_over_available(self):
+        from .cart_utils import add_to_cart, update_cart_item
+        add_to_cart(self.request(), self.product.pk, 2)
+        item = CartItem.objects.get(cart__user=self.buyer)
+        Product.objects.filter(pk=self.product.pk).update(stock=8)
+        self.assertEqual(update_cart_item(self.request(), item.pk, 3),
+                         (False, "Недостаточно товара на складе. Доступно: 1"))
+        # Уменьшение количества возможно и при нехватке остатка
+        self.assertEqual(update_cart_item(self.request(), item.pk, 1), (True, "Количество обновлено"))
+        cart = Cart.objects.get(user=self.buyer)
+        self.assertEqual((cart.items_count, cart.subtotal, cart.items.get().quantity), (1, Decimal('800.00'), 1))
+
+
+class OrderStatsTests(TestCase):
+    """Сводка заказов пользователя обновляется разницей из сигналов Order"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user('stats', password='secret')
+
+    def stats(self):
+        from .models import UserOrderStats
+        stats = UserOrderStats.objects.get(user=self.user)
+        return stats.total_orders, stats.total_spent, stats.active_orders
+
+    def create_order(self, amount, status='pending'):
+        return Order.objects.create(user=self.user, status=status, total_amount=Decimal(amount))
+
+    def test_created_orders_are_added(self):
+        self.create_order('100.00')
+        self.create_order('250.50', status='delivered')
+        self.assertEqual(self.stats(), (2, Decimal('350.50'), 1))
+
+    def test_missing_stats_are_built_from_existing_orders(self):
+        from .models import UserOrderStats
+        self.create_order('100.00')
+        UserOrderStats.objects.filter(user=self.user).delete()
+        latest = self.create_order('40.00')
+        self.assertEqual(self.stats(), (2, Decimal('140.00'), 2))
+        self.assertEqual(UserOrderStats.objects.get(user=self.user).last_order_at, latest.created_at)
+
+    def test_status_and_amount_changes(self):
+        order = self.create_order('100.00')
+        order.status = 'shipped'
+        order.total_amount = Decimal('120.00')
+        order.save()
+        self.assertEqual(self.stats(), (1, Decimal('120.00'), 1))
+        order.status = 'delivered'
+        order.save()
+        self.assertEqual(self.stats(), (1, Decimal('120.00'), 0))
+
+    def test_cancel_and_delete(self):
+        keep = self.create_order('100.00')
+        order = Order.objects.get(pk=self.create_order('60.00').pk)
+        order.status = 'cancelled'
+        order.save(update_fields=['status'])
+        self.assertEqual(self.stats(), (2, Decimal('160.00'), 1))
+        order.delete()
+        self.assertEqual(self.stats(), (1, Decimal('100.00'), 1))
+        keep.delete()
+        self.assertEqual(self.stats(), (0, Decimal('0'), 0))
+
+    def test_concurrent_first_order_is_not_overwritten(self):
+        """
+        Пока ждали блокировку пользователя, параллельная транзакция с первым
+        заказом собрала сводку: наш заказ прибавляется к ней, а не пересобирается
+        """
+        from unittest import mock
+        from django.utils import timezone
+        from .models import UserOrderStats
+
+        def other_first_order(user_id):
+            UserOrderStats.objects.create(
+                user_id=user_id, total_orders=1, total_spent=Decimal('500.00'),
+                active_orders=1, last_order_at=timezone.now(),
+            )
+
+        with mock.patch('accounts.order_stats._lock_user', side_effect=other_first_order) as lock:
+            self.create_order('100.00')
+        lock.assert_called_once_with(self.user.pk)
+        self.assertEqual(self.stats(), (2, Decimal('600.00'), 2))
+
+
+class CartTotalsTests(TestCase):
+    """Сохраненные итоги корзины (items_count, subtotal) совпадают с суммой позиций"""
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Крепеж')
+        cls.screws = Product.objects.create(
+            category=category, name='Саморезы 4.2x75', sku='SCR-75', price=Decimal('3.30'), stock=500,
+        )
+        cls.anchors = Product.objects.create(
+            category=category, name='Анкер 10x100', sku='ANC-10', price=Decimal('27.90'), stock=100,
+        )
+        cls.user = CustomUser.objects.create_user('totals', password='secret')
+
+    def setUp(self):
+        from django.test import RequestFactory
+        self.request = RequestFactory().post('/')
+        self.request.user = self.user
+
+    def assertTotals(self, items_count, subtotal):
+        from .cart_utils import drifted_carts
+        cart = Cart.objects.get(user=self.user)
+        lines = [(item.quantity, item.quantity * item.product.price) for item in cart.items.select_related('product')]
+        self.assertEqual((cart.items_count, cart.subtotal), (items_count, Decimal(subtotal)))
+        self.assertEqual(
+            (sum(quantity for quantity, _ in lines), sum((total for _, total in lines), Decimal('0'))),
+            (items_count, Decimal(subtotal)),
+        )
+        self.assertFalse(drifted_carts().exists())
+
+    def item(self, product):
+        return CartItem.objects.get(cart__user=self.user, product=product)
+
+    def test_add_update_remove_clear(self):
+        from .cart_utils import add_to_cart, clear_cart, remove_from_cart, update_cart_item
+        add_to_cart(self.request, self.screws.pk, 10)
+        add_to_cart(self.request, self.screws.pk, 5)
+        add_to_cart(self.request, self.anchors.pk, 2)
+        self.assertTotals(17, '105.30')
+
+        update_cart_item(self.request, self.item(self.screws).pk, 3)
+        self.assertTotals(5, '65.70')
+        remove_from_cart(self.request, self.item(self.anchors).pk)
+        self.assertTotals(3, '9.90')
+        update_cart_item(self.request, self.item(self.screws).pk, 0)
+        self.assertTotals(0, '0')
+
+        add_to_cart(self.request, self.anchors.pk, 1)
+        clear_cart(self.request)
+        self.assertTotals(0, '0')
+
+    def test_price_change_recalculates_carts(self):
+        from .cart_utils import add_to_cart
+        add_to_cart(self.request, self.screws.pk, 10)
+        add_to_cart(self.request, self.anchors.pk, 1)
+        product = Product.objects.get(pk=self.screws.pk)
+        product.price = Decimal('3.50')
+        product.save()
+        self.assertTotals(11, '62.90')
+
+    def test_merge_of_guest_and_stored_session_carts(self):
+        from .cart_utils import add_to_cart, merge_carts, merge_guest_cart
+        from .guest_cart import GuestCart, SessionGuestCartStore
+        add_to_cart(self.request, self.screws.pk, 10)
+        user_cart = Cart.objects.get(user=self.user)
+
+        self.request.session = {}
+        guest = GuestCart(SessionGuestCartStore(self.request))
+        guest.set_quantity(self.screws.pk, 5)
+        guest.set_quantity(self.anchors.pk, 2)
+        merge_guest_cart(guest, user_cart)
+        self.assertEqual((user_cart.items_count, user_cart.subtotal), (17, Decimal('105.30')))
+        self.assertTotals(17, '105.30')
+
+        session_cart = Cart.objects.create(session_key='old-session')
+        CartItem.objects.create(cart=session_cart, product=self.anchors, quantity=1)
+        merge_carts(session_cart, user_cart)
+        self.assertFalse(Cart.objects.filter(pk=session_cart.pk).exists())
+        self.assertTotals(18, '133.20')
+
+    def test_reconcile_fixes_drift(self):
+        import io
+        from django.core.management import call_command
+        from .cart_utils import add_to_cart, drifted_carts
+        add_to_cart(self.request, self.screws.pk, 10)
+        add_to_cart(self.request, self.anchors.pk, 1)
+        cart = Cart.objects.get(user=self.user)
+        clean = Cart.objects.create(user=CustomUser.objects.create_user('clean', password='secret'))
+        # Изменение позиции в обход cart_utils - итоги разошлись
+        CartItem.objects.filter(cart=cart, product=self.anchors).update(quantity=4)
+        self.assertEqual(list(drifted_carts().values_list('pk', flat=True)), [cart.pk])
+
+        out = io.StringIO()
+        call_command('reconcile_cart_totals', dry_run=True, stdout=out)
+        self.assertIn('Найдено корзин с расхождениями: 1', out.getvalue())
+        self.assertTrue(drifted_carts().exists())
+
+        out = io.StringIO()
+        call_command('reconcile_cart_totals', batch_size=1, stdout=out)
+        self.assertIn('Исправлено корзин с расхождениями: 1', out.getvalue())
+        self.assertTotals(14, '144.60')
+        clean.refresh_from_db()
+        self.assertEqual((clean.items_count, clean.subtotal), (0, Decimal('0')))
+
+
+class GuestCartTests(TestCase):
+    """Корзина гостя в сессии или подписанной cookie и перенос в БД при входе"""
+
+    AJAX = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+    @classmethod
+    def setUpTestData(cls):
+        category = Category.objects.create(name='Краски')
+        cls.products = Product.objects.bulk_create([
+            Product(category=category, name=f'Эмаль {i}', sku=f'EM-{i}', price=Decimal('300.00'), stock=10)
+            for i in range(3)
+        ])
+        cls.user = CustomUser.objects.create_user('guest', password='pass12345')
+
+    def add(self, product, quantity=1):
+        response = self.client.post(reverse('add_to_cart', args=[product.pk]), {'quantity': quantity}, **self.AJAX)
+        return response, response.json()
+
+    def login(self):
+        return self.client.post(reverse('login'), {'username': 'guest', 'password': 'pass12345'})
+
+    def test_session_store(self):
+        from .guest_cart import SESSION_KEY
+        self.add(self.products[0], 2)
+        _, data = self.add(self.products[0], 1)
+        self.assertEqual((data['success'], data['cart_count']), (True, 3))
+        self.assertEqual(self.client.session[SESSION_KEY], {str(self.products[0].pk): 3})
+        self.assertFalse(Cart.objects.exists())
+        self.assertNotIn('guest_cart', self.client.cookies)
+
+    def test_cookie_store(self):
+        from django.test import override_settings
+        from .guest_cart import COOKIE_NAME
+        with override_settings(GUEST_CART_STORE='cookie'):
+            response, _ = self.add(self.products[0], 2)
+            self.assertIn(f'{self.products[0].pk}:2', response.cookies[COOKIE_NAME].value)
+            self.assertTrue(response.cookies[COOKIE_NAME]['httponly'])
+            _, data = self.add(self.products[1])
+            self.assertEqual(data['cart_count'], 3)
+
+            # Подделанная cookie не читается: корзина пустая
+            self.client.cookies[COOKIE_NAME] = f'{self.products[0].pk}:99'
+            _, data = self.add(self.products[1])
+            self.assertEqual(data['cart_count'], 1)
+        self.assertFalse(Cart.objects.exists())
+
+    def test_cookie_store_line_limit(self):
+        from unittest import mock
+        from django.test import override_settings
+        from .guest_cart import SignedCookieGuestCartStore
+        with override_settings(GUEST_CART_STORE='cookie'), \
+                mock.patch.object(SignedCookieGuestCartStore, 'max_lines', 2):
+            self.add(self.products[0])
+            self.add(self.products[1])
+            _, data = self.add(self.products[2])
+            self.assertFalse(data['success'])
+            self.assertIn('Корзина гостя заполнена', data['message'])
+            # Уже лежащий товар добавить можно
+            _, data = self.add(self.products[0])
+            self.assertEqual((data['success'], data['cart_count']), (True, 3))
+
+    def test_login_merges_cookie_cart_and_deletes_cookie(self):
+        from django.test import override_settings
+        from .guest_cart import COOKIE_NAME
+        CartItem.objects.create(cart=Cart.objects.create(user=self.user), product=self.products[0], quantity=1)
+        with override_settings(GUEST_CART_STORE='cookie'):
+            self.add(self.products[0], 2)
+            self.add(self.products[1], 20)  # больше остатка - отказ
+            self.add(self.products[1], 4)
+            response = self.login()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.cookies[COOKIE_NAME].value, '')
+        self.assertEqual(response.cookies[COOKIE_NAME]['max-age'], 0)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(
+            dict(cart.items.values_list('product_id', 'quantity')), {self.products[0].pk: 3, self.products[1].pk: 4},
+        )
+        self.assertEqual((cart.items_count, cart.subtotal), (7, Decimal('2100.00')))
+
+    def test_login_merges_session_cart(self):
+        from .guest_cart import SESSION_KEY
+        self.add(self.products[2], 2)
+        self.login()
+        self.assertNotIn(SESSION_KEY, self.client.session)
+        cart = Cart.objects.get(user=self.user)
+        self.assertEqual(list(cart.items.values_list('product_id', 'quantity')), [(self.products[2].pk, 2)])
+        self.assertEqual((cart.items_count, cart.subtotal), (2, Decimal('600.00')))
+
+
+class OrderHistoryTests(TestCase):
+    """История заказов: курсор (created_at, id), фильтр по статусу, JSON-лента"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import timedelta
+        from django.utils import timezone
+        cls.user = CustomUser.objects.create_user('history', password='secret')
+        other = CustomUser.objects.create_user('stranger', password='secret')
+        start = timezone.now() - timedelta(days=10)
+        statuses = ['pending', 'delivered', 'pending', 'cancelled', 'pending', 'delivered', 'pending']
+        cls.orders = []
+        for i, status in enumerate(statuses):
+            order = Order.objects.create(user=cls.user, status=status)
+            # Пары заказов с одинаковым временем: порядок внутри пары - по id
+            Order.objects.filter(pk=order.pk).update(created_at=start + timedelta(hours=i // 2))
+            cls.orders.append(order)
+        Order.objects.create(user=other, status='pending')
+        cls.newest_first = list(Order.objects.filter(user=cls.user).order_by('-created_at', '-id'))
+
+    def walk(self, status=None, limit=2):
+        from .order_history import get_orders_page
+        seen, cursor = [], None
+        while True:
+            page, cursor = get_orders_page(self.user, cursor, status, limit=limit)
+            self.assertLessEqual(len(page), limit)
+            seen.extend(page)
+            if cursor is None:
+                return seen
+
+    def test_cursor_round_trip(self):
+        from .order_history import decode_cursor, encode_cursor
+        order = self.newest_first[0]
+        self.assertEqual(decode_cursor(encode_cursor(order)), (order.created_at, order.pk))
+        self.assertNotIn('=', encode_cursor(order))
+
+    def test_pages_cover_history_once_across_equal_timestamps(self):
+        self.assertEqual(self.walk(), self.newest_first)
+        self.assertEqual(self.walk(limit=7), self.newest_first)
+
+    def test_invalid_cursor_starts_from_first_page(self):
+        import base64
+        from .order_history import decode_cursor, get_orders_page
+        broken = base64.urlsafe_b64encode(b'yesterday|abc').decode()
+        for cursor in ('', 'not base64!', broken, base64.urlsafe_b64encode(b'\xff\xfe').decode()):
+            with self.subTest(cursor=cursor):
+                self.assertIsNone(decode_cursor(cursor))
+                self.assertEqual(get_orders_page(self.user, cursor, limit=3)[0], self.newest_first[:3])
+
+    def test_status_filter(self):
+        pending = [order for order in self.newest_first if order.status == 'pending']
+        self.assertEqual(len(pending), 4)
+        self.assertEqual(self.walk(status='pending', limit=3), pending)
+
+    def test_feed_view(self):
+        self.client.force_login(self.user)
+        url = reverse('order_list_feed')
+        data = self.client.get(url, {'status': 'delivered'}).json()
+        self.assertIsNone(data['next_cursor'])
+        delivered = [order.order_number for order in self.newest_first if order.status == 'delivered']
+        self.assertEqual([number for number in delivered if number in data['html']], delivered)
+        self.assertEqual(data['html'].count('<tr>'), 2)
+
+        # Неизвестный статус и битый курсор игнорируются - первая страница всех заказов
+        data = self.client.get(url, {'status': 'lost', 'cursor': '%%%'}).json()
+        self.assertEqual(data['html'].count('<tr>'), len(self.newest_first))
+
+    def test_feed_requires_login(self):
+        response = self.client.get(reverse('order_list_feed'))
+        self.assertEqual(response.status_code, 302)
+
+
+class ExportTests(TestCase):
+    """Выгрузки прайс-листа и реестра заказов: только для персонала, формат импорта"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import datetime
+        from django.utils import timezone
+        root = Category.objects.create(name='Сухие смеси')
+        category = Category.objects.create(name='Цемент', parent=root)
+        cls.cement = Product.objects.create(
+            category=category, name='Цемент М500', sku='CEM-500', price=Decimal('450.00'), stock=40, unit='меш.',
+        )
+        cls.staff = CustomUser.objects.create_user('manager', password='secret', is_staff=True)
+        cls.buyer = CustomUser.objects.create_user('buyer', password='secret', company_name='СтройДвор')
+        for day, quantity in ((10, 2), (20, 5)):
+            order = Order.objects.create(user=cls.buyer, status='confirmed')
+            Order.objects.filter(pk=order.pk).update(
+                created_at=timezone.make_aware(datetime(2026, 3, day, 12, 30)),
+            )
+            OrderItem.objects.create(order=order, product=cls.cement, quantity=quantity, price=Decimal('450.00'))
+        cls.march_20 = Order.objects.get(created_at__day=20).order_number
+
+    def setUp(self):
+        from django.core.cache import cache
+        from . import category_tree
+        # Дерево категорий в памяти процесса могло остаться от другого теста
+        cache.clear()
+        category_tree._state['tree'] = None
+
+    def csv_rows(self, response):
+        import csv
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('\ufeff'))
+        return list(csv.reader(content[1:].splitlines(), delimiter=';'))
+
+    def xlsx_rows(self, response):
+        import io
+        from openpyxl import load_workbook
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)), read_only=True)
+        return [list(row) for row in workbook.worksheets[0].iter_rows(values_only=True)]
+
+    def test_staff_only(self):
+        for url in (reverse('export_products'), reverse('export_orders')):
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url).status_code, 302)
+                self.client.force_login(self.buyer)
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 302)
+                self.assertIn(reverse('admin:login'), response['Location'])
+                self.client.logout()
+
+    def test_products_csv(self):
+        from .exports import PRODUCT_HEADER
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('export_products'))
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertRegex(response['Content-Disposition'], r'^attachment; filename="products_\d{8}\.csv"$')
+        self.assertEqual(self.csv_rows(response), [
+            PRODUCT_HEADER,
+            ['CEM-500', 'Цемент М500', '450.00', '40', 'меш.', 'Сухие смеси / Цемент', ''],
+        ])
+
+    def test_products_csv_can_be_imported_back(self):
+        import io
+        from .price_import import PriceListImporter, read_price_list
+        self.client.force_login(self.staff)
+        content = b''.join(self.client.get(reverse('export_products')).streaming_content)
+        result = PriceListImporter().run(read_price_list(io.BytesIO(content), 'products.csv'))
+        self.assertEqual((result.rows, result.unchanged, result.errors), (1, 1, []))
+
+    def test_orders_xlsx_with_period(self):
+        from .exports import ORDER_HEADER, XLSX_CONTENT_TYPE
+        self.client.force_login(self.staff)
+        response = self.client.get(
+            reverse('export_orders'), {'format': 'xlsx', 'date_from': '2026-03-15', 'date_to': '2026-03-31'},
+        )
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        self.assertRegex(response['Content-Disposition'], r'filename="orders_\d{8}\.xlsx"')
+        self.assertEqual(self.xlsx_rows(response), [
+            ORDER_HEADER,
+            [self.march_20, '20.03.2026 12:30', 'Подтвержден', 'buyer', 'СтройДвор',
+             'CEM-500', 'Цемент М500', 5, 450, 2250],
+        ])
 
-# Create your tests here.
+    def test_orders_csv_whole_period(self):
+        self.client.force_login(self.staff)
+        rows = self.csv_rows(self.client.get(reverse('export_orders')))
+        self.assertEqual([row[7] for row in rows[1:]], ['2', '5'])
+        self.assertEqual(rows[1][9], '900.00')
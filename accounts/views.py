@@ -1,18 +1,33 @@
+import logging
+
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
-from django.db.models import Sum, Count
+from django.db.models import DecimalField, ExpressionWrapper, F
 from django.http import JsonResponse
+from django.template.loader import render_to_string
 from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.admin.views.decorators import staff_member_required
+from django.utils.dateparse import parse_date
 from django.views.decorators.http import require_POST, require_http_methods
 
-from .models import Order, Product, OrderItem, Cart, CartItem, CustomUser
-from .forms import OrderForm, OrderItemFormSet, CartItemForm, UserRegistrationForm
+from .models import Order, Product
+from .forms import OrderForm, CartItemForm, UserRegistrationForm
 from .cart_utils import (
-    get_or_create_cart, add_to_cart, remove_from_cart, 
-    update_cart_item, get_cart_items_count, clear_cart, merge_carts
+    add_to_cart, remove_from_cart, 
+    update_cart_item, get_cart_items_count, clear_cart, get_cart_lines
 )
+from .catalog_utils import get_catalog_page, get_category_chunk, get_home_data
+from .category_tree import get_category_tree
+from .search import search_products
+from .checkout import CheckoutError, place_order
+from .exports import export_response
+from .instrumentation import route_stats
+from .order_history import get_orders_page
+from .order_stats import get_user_stats
+
+logger = logging.getLogger(__name__)
 
 # ==================== АУТЕНТИФИКАЦИЯ ====================
 
@@ -78,38 +93,18 @@ def register_view(request):
 def home(request):
     """Главная страница"""
     try:
-        # Все товары в наличии
-        available_products = Product.objects.filter(stock__gt=0)
-        
-        # 1. Популярные товары
-        popular_products = available_products.filter(is_popular=True)[:8]
-        
-        # Если популярных мало (меньше 4), добавляем другие
-        if popular_products.count() < 4:
-            additional = available_products.exclude(
-                id__in=[p.id for p in popular_products]
-            )[:8 - popular_products.count()]
-            popular_products = list(popular_products) + list(additional)
-        
-        # 2. Новинки
-        new_products = available_products.order_by('-created_at')[:8]
-        
-    except Exception as e:
-        print(f"Error in home view: {e}")
+        home_data = get_home_data()
+    except Exception:
+        logger.exception("Не удалось получить данные главной страницы")
         
         # В случае ошибки показываем все товары
-        popular_products = Product.objects.all()[:8]
-        new_products = Product.objects.order_by('-created_at')[:8]
-    
-    # Статистика
-    total_products = Product.objects.count()
-    in_stock_count = Product.objects.filter(stock__gt=0).count()
+        home_data = {
+            'popular_products': Product.objects.all()[:8],
+            'new_products': Product.objects.order_by('-created_at')[:8],
+        }
     
     context = {
-        'popular_products': popular_products,
-        'new_products': new_products,
-        'total_products': total_products,
-        'in_stock_count': in_stock_count,
+        **home_data,
         'user': request.user
     }
     
@@ -120,15 +115,9 @@ def home(request):
 @login_required
 def dashboard(request):
     """Личный кабинет пользователя"""
-    user_orders = Order.objects.filter(user=request.user)
-    
-    stats = {
-        'total_orders': user_orders.count(),
-        'total_spent': user_orders.aggregate(Sum('total_amount'))['total_amount__sum'] or 0,
-        'active_orders': user_orders.exclude(status__in=['delivered', 'cancelled']).count(),
-    }
-    
-    recent_orders = user_orders.order_by('-created_at')[:5]
+    # Счетчики - из сводки (одна строка), последние заказы - по индексу (user, -created_at, -id)
+    stats = get_user_stats(request.user)
+    recent_orders = Order.objects.filter(user=request.user).order_by('-created_at', '-id')[:5]
     
     return render(request, 'accounts/dashboard.html', {
         'stats': stats,
@@ -139,15 +128,43 @@ def dashboard(request):
 
 @login_required
 def order_list(request):
-    """Список заказов пользователя"""
-    orders = Order.objects.filter(user=request.user).order_by('-created_at')
-    return render(request, 'accounts/order_list.html', {'orders': orders})
+    """Список заказов пользователя (keyset-пагинация по курсору)"""
+    status = _order_status_filter(request)
+    orders, next_cursor = get_orders_page(request.user, request.GET.get('cursor'), status)
+    return render(request, 'accounts/order_list.html', {
+        'orders': orders,
+        'next_cursor': next_cursor,
+        'status': status,
+        'status_choices': Order.STATUS_CHOICES,
+    })
+
+@login_required
+def order_list_feed(request):
+    """Следующая страница истории заказов в JSON (для бесконечной прокрутки)"""
+    status = _order_status_filter(request)
+    orders, next_cursor = get_orders_page(request.user, request.GET.get('cursor'), status)
+    html = ''.join(
+        render_to_string('accounts/order_row.html', {'order': order}, request=request)
+        for order in orders
+    )
+    return JsonResponse({
+        'html': html,
+        'next_cursor': next_cursor,
+    })
+
+def _order_status_filter(request):
+    status = request.GET.get('status', '')
+    return status if status in dict(Order.STATUS_CHOICES) else None
 
 @login_required
 def order_detail(request, order_id):
     """Детали заказа"""
     order = get_object_or_404(Order, id=order_id, user=request.user)
-    return render(request, 'accounts/order_detail.html', {'order': order})
+    # Позиции с товарами и суммой строки одним запросом (без N+1 в шаблоне)
+    items = order.items.select_related('product').annotate(
+        line_total=ExpressionWrapper(F('quantity') * F('price'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+    ).order_by('id')
+    return render(request, 'accounts/order_detail.html', {'order': order, 'items': items})
 
 @login_required
 def create_order(request):
@@ -174,28 +191,62 @@ def create_order(request):
 # ==================== КАТАЛОГ ====================
 
 def product_catalog(request):
-    """Каталог товаров"""
-    products = Product.objects.filter(stock__gt=0)
-    categories = {}
+    """Каталог товаров (постраничный, с группировкой по категориям в БД)"""
+    tree = get_category_tree()
+    
+    # Выбранная категория: показываем ее вместе со всеми подкатегориями
+    current_category = None
+    try:
+        current_category = tree.get(int(request.GET.get('category', '')))
+    except ValueError:
+        pass
+    
+    page, blocks = get_catalog_page(
+        request.GET.get('page'),
+        category_path=current_category['path'] if current_category else None,
+    )
     
-    for product in products:
-        if product.category not in categories:
-            categories[product.category] = []
-        categories[product.category].append(product)
+    return render(request, 'accounts/catalog.html', {
+        'page_obj': page,
+        'blocks': blocks,
+        'current_category': current_category,
+        'breadcrumbs': tree.breadcrumbs(current_category['id']) if current_category else [],
+        'subcategories': tree.children_of(current_category['id'] if current_category else None),
+    })
+
+def catalog_category_products(request, category_id):
+    """Подгрузка следующей порции товаров категории (для кнопки "Показать ещё")"""
+    products, next_cursor = get_category_chunk(category_id, request.GET.get('cursor'))
+    # Одна отрисовка на всю порцию: контекст-процессоры выполняются один раз, а не на каждую карточку
+    html = render_to_string('accounts/product_cards.html', {'products': products}, request=request)
     
-    return render(request, 'accounts/catalog.html', {'categories': categories})
+    return JsonResponse({
+        'html': html,
+        'has_more': next_cursor is not None,
+        'next_cursor': next_cursor,
+    })
+
+def product_search(request):
+    """Поиск товаров по названию, артикулу и описанию"""
+    query = request.GET.get('q', '').strip()
+    products = search_products(query) if query else []
+    
+    return render(request, 'accounts/search.html', {
+        'query': query,
+        'products': products,
+    })
 
 # ==================== КОРЗИНА ====================
 
 def cart_view(request):
     """Просмотр корзины"""
-    cart = get_or_create_cart(request)
-    items = cart.items.all().select_related('product')
+    cart = request.cart
+    items = get_cart_lines(cart)
     
     # Формы для изменения количества
     item_forms = {}
     for item in items:
-        item_forms[item.id] = CartItemForm(instance=item)
+        item_forms[item.id] = CartItemForm(initial={'quantity': item.quantity})
     
     total_price = sum(item.product.price * item.quantity for item in items)
     
@@ -295,14 +346,33 @@ def clear_cart_view(request):
 @require_http_methods(["GET", "POST"])
 def checkout_from_cart(request):
     """Оформить заказ из корзины"""
-    cart = get_or_create_cart(request)
+    cart = request.cart
     
     if cart.total_items == 0:
         messages.error(request, "Корзина пуста")
         return redirect('cart_view')
     
-    # Проверяем наличие товаров на складе
-    for item in cart.items.all():
+    if request.method == 'POST':
+        # Заказ, позиции, списание остатков и очистка корзины - одной транзакцией
+        try:
+            order = place_order(
+                cart,
+                request.user,
+                delivery_address=request.POST.get('delivery_address', ''),
+                comments=request.POST.get('comments', ''),
+                phone=request.POST.get('phone', ''),
+                email=request.POST.get('email', request.user.email),
+            )
+        except CheckoutError as e:
+            messages.error(request, str(e))
+            return redirect('cart_view')
+        
+        messages.success(request, f"Заказ {order.order_number} успешно создан!")
+        return redirect('order_detail', order_id=order.id)
+    
+    # Проверяем наличие товаров на складе; эти же позиции (с товарами) уходят в шаблон
+    lines = list(get_cart_lines(cart))
+    for item in lines:
         if item.quantity > item.product.stock:
             messages.error(request, 
                 f"Товара '{item.product.name}' недостаточно на складе. "
@@ -310,80 +380,58 @@ def checkout_from_cart(request):
             )
             return redirect('cart_view')
     
-    if request.method == 'POST':
-        # Создаем заказ
-        order = Order.objects.create(
-            user=request.user,
-            status='pending',
-            total_amount=cart.total_price,
-            delivery_address=request.POST.get('delivery_address', ''),
-            phone=request.POST.get('phone', ''),
-            email=request.POST.get('email', request.user.email)
-        )
-        
-        # Переносим товары из корзины в заказ
-        for item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                product=item.product,
-                quantity=item.quantity,
-                price=item.product.price
-            )
-            
-            # Уменьшаем остаток на складе
-            item.product.stock -= item.quantity
-            item.product.save()
-        
-        # Очищаем корзину
-        cart.items.all().delete()
-        
-        messages.success(request, f"Заказ {order.order_number} успешно создан!")
-        return redirect('order_detail', order_id=order.id)
-    
     return render(request, 'accounts/checkout.html', {
         'cart': cart,
+        'lines': lines,
     })
 
+# ==================== ВЫГРУЗКИ ====================
+
+def _export_format(request):
+    return 'xlsx' if request.GET.get('format') == 'xlsx' else 'csv'
+
+@staff_member_required
+def export_products(request):
+    """Прайс-лист целиком (CSV потоком, XLSX через временный файл)"""
+    return export_response('products', _export_format(request), Product.objects.all())
+
+@staff_member_required
+def export_orders(request):
+    """Реестр заказов за период: ?date_from=2026-01-01&date_to=2026-01-31"""
+    date_from = parse_date(request.GET.get('date_from', '') or '')
+    date_to = parse_date(request.GET.get('date_to', '') or '')
+    return export_response('orders', _export_format(request), Order.objects.all(), date_from, date_to)
+
+# ==================== МЕТРИКИ ====================
+
+@staff_member_required
+@require_http_methods(["GET", "POST"])
+def performance_metrics(request):
+    """p50/p95 времени ответа по маршрутам в этом процессе (POST - обнулить, с CSRF-токеном)"""
+    if request.method == 'POST':
+        route_stats.reset()
+    return JsonResponse({'routes': route_stats.snapshot()})
+
 # ==================== ВСПОМОГАТЕЛЬНЫЕ ФУНКЦИИ ====================
 
 def get_cart_count(request):
     """Возвращает количество товаров в корзине (для AJAX)"""
-    cart = get_or_create_cart(request)
-    count = sum(item.quantity for item in cart.items.all())
-    return JsonResponse({'count': count})
+    cart = request.cart
+    return JsonResponse({'count': cart.total_items})
 
 def test_simple_add(request, product_id):
     """Тестовая страница для проверки добавления в корзину"""
-    if not request.session.session_key:
-        request.session.create()
-    
-    cart, created = Cart.objects.get_or_create(
-        session_key=request.session.session_key,
-        user=None
-    )
-    
-    try:
-        product = Product.objects.get(id=product_id)
-    except Product.DoesNotExist:
-        return JsonResponse({'success': False, 'error': 'Товар не найден'})
-    
-    # Добавляем в корзину
-    cart_item, created = CartItem.objects.get_or_create(
-        cart=cart,
-        product=product,
-        defaults={'quantity': 1}
-    )
-    
-    if not created:
-        cart_item.quantity += 1
-        cart_item.save()
+    success, message = add_to_cart(request, product_id, 1)
     
     # Обновляем счетчик
-    total = sum(item.quantity for item in cart.items.all())
+    total = get_cart_items_count(request)
     request.session['cart_count'] = total
     
+    if not success:
+        return JsonResponse({'success': False, 'error': message, 'cart_count': total})
+    
     return JsonResponse({
         'success': True,
-        'message': f'Товар {product.name} добавлен в корзину',
+        'message': message,
         'cart_count': total
-    })
\ No newline at end of file
+    })
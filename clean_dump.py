@@ -1,20 +1,15 @@
-import json
+import os
 import sys
 
-# Загрузите дамп
-with open('db_backup.json', 'r', encoding='utf-8') as f:
-    data = json.load(f)
+import django
 
-# Отфильтруйте данные
-filtered_data = []
-for item in data:
-    # Исключаем системные таблицы которые создаются автоматически
-    if item['model'] not in ['contenttypes.contenttype', 'sessions.session', 'admin.logentry']:
-        filtered_data.append(item)
+# Потоковая очистка дампа (см. accounts/management/commands/filterdump.py):
+# записи читаются и пишутся по одной, память не зависит от размера дампа
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lk_clone.settings')
+django.setup()
 
-# Сохраните очищенный дамп
-with open('db_filtered.json', 'w', encoding='utf-8') as f:
-    json.dump(filtered_data, f, indent=2, ensure_ascii=False)
+from django.core.management import call_command
 
-print(f"Очищено: {len(data) - len(filtered_data)} записей")
-print(f"Сохранено: {len(filtered_data)} записей")
\ No newline at end of file
+# Кодировка дампа (UTF-8 или cp1251) определяется сама; дополнительные
+# параметры передаются как есть, например: --exclude auth.permission
+call_command('filterdump', 'db_backup.json', 'db_filtered.json', *sys.argv[1:], indent=2)
@@ -0,0 +1,74 @@
+"""
+Конфигурация gunicorn для продакшена (читается автоматически из текущего каталога).
+
+Приложение загружается один раз в мастер-процессе (preload_app) и
+прогревается (lk_clone/warmup.py) до запуска воркеров, поэтому воркеры
+стартуют мгновенно, а первые запросы после деплоя не платят за импорт
+Django, компиляцию шаблонов и пустые кэши.
+
+Режимы (GUNICORN_MODE):
+- sync (по умолчанию) - процессы по одному запросу, 2 * CPU + 1 воркеров;
+- gthread - процессы по CPU с потоками в каждом: запросы корзины в основном
+  ждут БД, и потоки обслуживают их параллельно без лишней памяти на процессы.
+
+Все значения можно переопределить переменными окружения: WEB_CONCURRENCY
+(воркеры), GUNICORN_THREADS, GUNICORN_TIMEOUT, GUNICORN_MAX_REQUESTS.
+
+Несколько воркеров - только с общим кэшем (REDIS_URL): версии кэша
+(accounts/cache_utils.py) в LocMem у каждого процесса свои, и воркеры,
+получившие при fork прогретые мастером дерево категорий и данные главной,
+не увидели бы их сброса в другом воркере. Без REDIS_URL по умолчанию
+запускается один воркер, а явный запрос нескольких останавливает сервер.
+"""
+import multiprocessing
+import os
+
+cpu_count = multiprocessing.cpu_count()
+mode = os.environ.get('GUNICORN_MODE', 'sync')
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+if mode == 'gthread':
+    worker_class = 'gthread'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpu_count))
+    threads = int(os.environ.get('GUNICORN_THREADS', 4))
+else:
+    worker_class = 'sync'
+    workers = int(os.environ.get('WEB_CONCURRENCY', cpu_count * 2 + 1))
+    threads = 1
+
+if not os.environ.get('REDIS_URL') and 'WEB_CONCURRENCY' not in os.environ:
+    # Без общего кэша - один процесс (см. выше)
+    workers = 1
+
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Периодический перезапуск воркеров - страховка от роста памяти
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    """Мастер загрузил приложение и еще не запустил воркеры - проверка кэша и прогрев"""
+    from accounts.cache_utils import cache_is_shared
+    from lk_clone.warmup import warm_up
+
+    if server.num_workers > 1 and not cache_is_shared():
+        server.log.error(
+            "%s воркеров с кэшем в памяти процесса: сбросы кэша не дойдут до остальных воркеров. "
+            "Задайте REDIS_URL или запустите один воркер", server.num_workers,
+        )
+        raise SystemExit(1)
+
+    timings = warm_up()
+    server.log.info(
+        "Прогрев: %s", ', '.join(f"{name} {seconds * 1000:.0f} мс" for name, seconds in timings.items())
+    )
+
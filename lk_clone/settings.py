@@ -2,6 +2,7 @@ import sys
 import os
 from pathlib import Path
 import dj_database_url
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 
 # Загружаем переменные окружения
@@ -69,6 +70,13 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Для параллельных запросов (runserver, нагрузочный прогон): транзакция
+        # сразу берет блокировку записи и ждет ее, а не падает с "database is locked"
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+            'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL;',
+        },
     }
 }
 
@@ -93,6 +101,32 @@ else:
 
 print(f"Final DATABASES config: {DATABASES['default']['ENGINE']}", file=sys.stderr)
 
+# ========== КЭШ ==========
+
+# Версии кэша (accounts/cache_utils.py) должны видеть все воркеры: иначе сброс
+# дерева категорий и данных главной доходит только до воркера, сделавшего
+# изменение. Поэтому в продакшене - общий Redis (REDIS_URL, сервис lk-cache в
+# render.yaml), а LocMem - только для разработки в одном процессе (runserver,
+# gunicorn с одним воркером - см. gunicorn.conf.py)
+REDIS_URL = os.environ.get('REDIS_URL')
+if ON_RENDER and not REDIS_URL:
+    raise ImproperlyConfigured('На Render нужен общий кэш: задайте REDIS_URL (см. render.yaml)')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'lk_clone',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'lk_clone',
+        }
+    }
+
 # ========== СТАТИЧЕСКИЕ ФАЙЛЫ ==========
 
 # Static files (CSS, JavaScript, Images)
@@ -102,23 +136,38 @@ STATIC_URL = 'static/'
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # Добавляем whitenoise для всех
+    'accounts.middleware.CustomMiddleware',  # Замеры запроса (после whitenoise - статику не меряем)
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'accounts.middleware.CustomMiddleware',
+    'accounts.middleware.CartMiddleware',
 ]
 
-if ON_RENDER:
-    # На Render
-    STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
-    STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
-else:
-    # Локально
-    STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
-    STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+# JS и CSS страниц лежат в accounts/static/accounts (находятся AppDirectoriesFinder)
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+# Манифест (по умолчанию на Render): collectstatic кладет файлы с хэшем содержимого
+# в имени (base.3f2a9c.css) и их сжатые копии (.gz, .br при установленном brotli);
+# {% static %} выдает имена с хэшем, и WhiteNoise отдает такие файлы с
+# Cache-Control: max-age=315360000, immutable - браузер не перезапрашивает их
+# до следующего изменения. Проверка результата сборки: manage.py verify_static.
+# Локально и в тестах - обычное хранилище, collectstatic не нужен.
+STATIC_MANIFEST = os.environ.get('STATIC_MANIFEST', str(ON_RENDER)) == 'True'
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': (
+            'whitenoise.storage.CompressedManifestStaticFilesStorage' if STATIC_MANIFEST
+            else 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        ),
+    },
+}
 
 # Медиа файлы
 MEDIA_URL = '/media/'
@@ -141,14 +190,24 @@ ROOT_URLCONF = 'lk_clone.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates с замером времени рендеринга (см. accounts/instrumentation.py)
+        'BACKEND': 'accounts.template_backend.InstrumentedDjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'accounts/templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'accounts.context_processors.cart',
+                'accounts.context_processors.fragments',
+            ],
+            # Скомпилированные шаблоны хранятся в памяти процесса (в разработке
+            # runserver сбрасывает их при изменении файлов шаблонов)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
             ],
         },
     },
@@ -186,6 +245,15 @@ LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = 'home'
 
+# Гостевая корзина: 'session' (в сессии) или 'cookie' (подписанная cookie, без сессии)
+GUEST_CART_STORE = os.environ.get('GUEST_CART_STORE', 'session')
+
+# Сколько минут позиция корзины держит резерв остатка
+CART_RESERVATION_MINUTES = int(os.environ.get('CART_RESERVATION_MINUTES', '15'))
+
+# Номера заказов: сколько номеров процесс резервирует за один запрос к счетчику
+ORDER_NUMBER_BLOCK_SIZE = int(os.environ.get('ORDER_NUMBER_BLOCK_SIZE', '1'))
+
 # Default primary key field type
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
@@ -202,8 +270,21 @@ LOGGING = {
         'handlers': ['console'],
         'level': 'INFO' if ON_RENDER else 'DEBUG',
     },
+    'loggers': {
+        # Замеры запросов (CustomMiddleware): по умолчанию только медленные (WARNING),
+        # PERF_LOG_LEVEL=DEBUG - строка на каждый запрос: время, SQL, шаблоны
+        'accounts.performance': {
+            'handlers': ['console'],
+            'level': os.environ.get('PERF_LOG_LEVEL', 'WARNING'),
+            'propagate': False,
+        },
+    },
 }
 
+# Замеры производительности: заголовок Server-Timing и порог медленного запроса (WARNING в логе)
+PERF_SERVER_TIMING = os.environ.get('PERF_SERVER_TIMING', 'True') == 'True'
+PERF_SLOW_REQUEST_MS = int(os.environ.get('PERF_SLOW_REQUEST_MS', '500'))
+
 print(f"✅ Настройки загружены: {'Render (продакшен)' if ON_RENDER else 'Локальная разработка'}", file=sys.stderr)
 print(f"Database engine: {DATABASES['default']['ENGINE']}", file=sys.stderr)
 print(f"Debug mode: {DEBUG}", file=sys.stderr)
@@ -9,9 +9,15 @@ urlpatterns = [
     path('', views.home, name='home'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('orders/', views.order_list, name='order_list'),
+    path('orders/feed/', views.order_list_feed, name='order_list_feed'),
+    path('export/products/', views.export_products, name='export_products'),
+    path('export/orders/', views.export_orders, name='export_orders'),
+    path('metrics/', views.performance_metrics, name='performance_metrics'),
     path('orders/<int:order_id>/', views.order_detail, name='order_detail'),
     path('orders/create/', views.create_order, name='create_order'),
     path('catalog/', views.product_catalog, name='catalog'),
+    path('search/', views.product_search, name='product_search'),
+    path('catalog/category/<int:category_id>/more/', views.catalog_category_products, name='catalog_category_products'),
     
     # Новые маршруты для корзины
     path('cart/', views.cart_view, name='cart_view'),
@@ -0,0 +1,84 @@
+"""
+Прогрев приложения перед приемом запросов.
+
+Вызывается из gunicorn.conf.py в мастер-процессе после загрузки приложения
+(preload_app) и до запуска воркеров: все, что прогрето здесь, воркеры
+получают при fork готовым (copy-on-write) - компиляцию шаблонов (с кэширующим
+загрузчиком), разобранные маршруты URL, импорт модулей представлений и
+тегов, дерево категорий и данные главной страницы. Соединения с БД после
+прогрева закрываются: открытый сокет нельзя делить между процессами.
+
+Унаследованные дерево и данные главной остаются верными, пока версии кэша
+общие для всех воркеров (Redis): после сброса версии в любом воркере
+остальные перечитают данные. Поэтому gunicorn.conf.py не запускает
+несколько воркеров с кэшем в памяти процесса.
+"""
+import logging
+import os
+import time
+
+logger = logging.getLogger('accounts.performance')
+
+
+def _template_names():
+    """Имена всех .html-шаблонов из DIRS и templates/ приложений"""
+    from django.template import engines
+    from django.template.utils import get_app_template_dirs
+
+    names = set()
+    for engine in engines.all():
+        directories = list(getattr(engine, 'dirs', [])) + list(get_app_template_dirs('templates'))
+        for directory in directories:
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    if filename.endswith('.html'):
+                        names.add(os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/'))
+    return sorted(names)
+
+
+def warm_templates():
+    from django.template import TemplateDoesNotExist, TemplateSyntaxError
+    from django.template.loader import get_template
+
+    loaded = 0
+    for name in _template_names():
+        try:
+            get_template(name)
+            loaded += 1
+        except (TemplateDoesNotExist, TemplateSyntaxError) as e:
+            logger.warning("warmup: шаблон %s не загружен: %s", name, e)
+    return loaded
+
+
+def warm_urls():
+    """Разобрать URLconf и импортировать все представления"""
+    from django.urls import get_resolver
+
+    resolver = get_resolver()
+    # reverse_dict строит таблицы обратного разрешения для всех маршрутов
+    return len(resolver.reverse_dict)
+
+
+def warm_caches():
+    from accounts.catalog_utils import get_home_data
+    from accounts.category_tree import get_category_tree
+
+    get_category_tree()
+    get_home_data()
+
+
+def warm_up():
+    """Прогреть все; возвращает {шаг: секунды}. Ошибки шага пишутся в лог и не мешают старту"""
+    from django.db import connections
+
+    timings = {}
+    for name, step in (('templates', warm_templates), ('urls', warm_urls), ('caches', warm_caches)):
+        started = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("warmup: шаг %s завершился ошибкой", name)
+        timings[name] = time.perf_counter() - started
+    connections.close_all()
+    logger.info("warmup %s", ' '.join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items()))
+    return timings